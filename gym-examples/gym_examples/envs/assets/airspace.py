@@ -1,33 +1,399 @@
+import os
+import json
+import hashlib
+import numpy as np
+import shapely
 import geopandas as gpd
+from scipy import ndimage
+from profiling import profiler
 from osmnx import features as ox_features
-from osmnx import geocode_to_gdf as geocode_to_gdf 
+from osmnx import geocode_to_gdf as geocode_to_gdf
 from osmnx import projection as ox_projection
 
 
+# Airspace cache defaults, can be overridden through environment variables so that
+# worker processes and training nodes pick them up without changing constructor calls
+AIRSPACE_CACHE_DIR = os.environ.get('UAM_AIRSPACE_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'uam_airspace'))
+AIRSPACE_OFFLINE = os.environ.get('UAM_AIRSPACE_OFFLINE', '0') == '1'
+
 
 class Airspace:
-    def __init__(self, location_name:str, buffer_radius = 500):
+    def __init__(self, location_name:str, buffer_radius = 500, tags = None, cache_dir = None, offline = None):
+        '''
+        Args:
+            location_name (str): named geocode of the location, e.g. 'Austin, Texas, USA'
+            buffer_radius (float): no-fly buffer (meters) around each hospital
+            tags (dict): OSM feature tags used for the static obstacles, default {'building':'hospital'}
+            cache_dir (str | None): directory of the on-disk airspace cache, default AIRSPACE_CACHE_DIR,
+                                    pass False to disable the cache
+            offline (bool | None): when True the network is never touched and the airspace must be in the cache,
+                                   default AIRSPACE_OFFLINE
+        '''
 
         self.location_name = location_name #'Austin, Texas, USA'
         self.buffer_radius = buffer_radius
-        
-        #TODO - Buffer area needs to be added to all location of interest as they are added to the airspace 
+        self.tags = tags if tags is not None else {'building':'hospital'}
+        self.cache_dir = AIRSPACE_CACHE_DIR if cache_dir is None else cache_dir
+        self.offline = AIRSPACE_OFFLINE if offline is None else offline
+
+        #TODO - Buffer area needs to be added to all location of interest as they are added to the airspace
         #self.buffer_area = buffer_area
-        
+
+        if not self._load_from_cache():
+            if self.offline:
+                raise RuntimeError(f'Airspace offline mode: {self.location_name} not found in cache {self.cache_dir}')
+            self._load_from_network()
+            self._save_to_cache()
+
+        self._build_obstacle_index()
+
+        #self._location_property -> (private property) lists the properties of the location, which is a gpd.GeoDataFrame
+
+    def __repr__(self) -> str:
+        return ('Airspace({location_name})'.format(location_name = self.location_name))
+
+
+    def _load_from_network(self,):
+        '''Internal method. Geocodes the location and downloads the hospital features using osmnx.'''
         #location
-        location_gdf = geocode_to_gdf(location_name) #converts named geocode - 'Austin,Texas' location to gdf 
+        location_gdf = geocode_to_gdf(self.location_name) #converts named geocode - 'Austin,Texas' location to gdf
         self.location_utm_gdf:gpd.GeoDataFrame = ox_projection.project_gdf(location_gdf) #default projection - UTM projection #! GeoDataFrame has deprication warning - need quick fix
-        self.location_utm_gdf['boundary'] = self.location_utm_gdf.boundary #adding column 'boundary' 
-        
-        #hospital        
-        location_hospital = ox_features.features_from_polygon(location_gdf['geometry'][0], tags={'building':'hospital'})
+        self.location_utm_gdf['boundary'] = self.location_utm_gdf.boundary #adding column 'boundary'
+
+        #hospital
+        location_hospital = ox_features.features_from_polygon(location_gdf['geometry'][0], tags=self.tags)
         self.location_utm_hospital = ox_projection.project_gdf(location_hospital)
         self.location_utm_hospital_buffer = self.location_utm_hospital.buffer(self.buffer_radius) # 500 meter buffer area
-        
-        #self._location_property -> (private property) lists the properties of the location, which is a gpd.GeoDataFrame
-    
-    def __repr__(self) -> str:
-        return ('Airspace({location_name})'.format(location_name = self.location_name))
-    
 
-    #TODO - Look at system design principles to choose one of the ways to populate the area with 1) hospitals 2) airport and airspace 3) school etc.
\ No newline at end of file
+
+    def cache_key(self,) -> str:
+        '''Key of this airspace in the cache, built from location name, buffer radius and feature tags.'''
+        key_info = json.dumps({'location_name':self.location_name,
+                               'buffer_radius':self.buffer_radius,
+                               'tags':self.tags}, sort_keys=True)
+        return hashlib.sha1(key_info.encode()).hexdigest()[:16]
+
+
+    def _cache_path(self, layer:str) -> str:
+        return os.path.join(self.cache_dir, f'{self.cache_key()}_{layer}.parquet')
+
+
+    def _meta_path(self,) -> str:
+        return os.path.join(self.cache_dir, f'{self.cache_key()}.json')
+
+
+    def _load_from_cache(self,) -> bool:
+        '''Internal method. Loads the projected boundary, hospitals and buffers from GeoParquet.
+        The meta file is written last, an entry without it is incomplete. 
+        Returns False on a cache miss, unreadable layers also count as a miss.'''
+        if not self.cache_dir:
+            return False
+
+        layer_paths = [self._cache_path(layer) for layer in ('location', 'hospital', 'hospital_buffer')]
+        if not all(os.path.exists(path) for path in layer_paths + [self._meta_path()]):
+            return False
+
+        try:
+            self.location_utm_gdf = gpd.read_parquet(layer_paths[0])
+            self.location_utm_hospital = gpd.read_parquet(layer_paths[1])
+            self.location_utm_hospital_buffer = gpd.read_parquet(layer_paths[2]).geometry
+        except Exception:
+            return False
+        return True
+
+
+    def _save_to_cache(self,):
+        '''Internal method. Writes the airspace layers to GeoParquet.
+        Only geometry columns are cached, the OSM attribute columns have mixed types that parquet cannot store.'''
+        if not self.cache_dir:
+            return
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        layers = {'location':self.location_utm_gdf[['geometry', 'boundary']],
+                  'hospital':self.location_utm_hospital[['geometry']],
+                  'hospital_buffer':gpd.GeoDataFrame(geometry=self.location_utm_hospital_buffer)}
+        # every file is written next to its target and renamed, so a crashed or concurrent writer never leaves a partial file,
+        # the meta file goes last and marks the entry complete
+        for layer, gdf in layers.items():
+            path = self._cache_path(layer)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            gdf.to_parquet(tmp_path)
+            os.replace(tmp_path, path)
+
+        meta_path = self._meta_path()
+        tmp_path = f'{meta_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as meta_file:
+            json.dump({'location_name':self.location_name,
+                       'buffer_radius':self.buffer_radius,
+                       'tags':self.tags}, meta_file)
+        os.replace(tmp_path, meta_path)
+
+
+    def _build_obstacle_index(self,):
+        '''Internal method. Builds a STRtree over the prepared hospital buffer geometries,
+        so that static obstacle queries only touch buildings near the query point.'''
+        self.obstacle_geometries:np.ndarray = np.asarray(self.location_utm_hospital_buffer.values, dtype=object)
+        shapely.prepare(self.obstacle_geometries)
+        self.obstacle_index = shapely.STRtree(self.obstacle_geometries)
+
+
+    def query_obstacles_within(self, points_xy, radius):
+        '''Checks if any static obstacle (hospital buffer) is within radius of each point.
+
+        Args:
+            points_xy (np.ndarray): (N,2) array of UTM positions
+            radius (float | np.ndarray): detection radius, scalar or one per point
+
+        Returns:
+            np.ndarray: (N,) bool array, True where an obstacle is within radius of the point
+        '''
+        points_xy = np.asarray(points_xy, dtype=float).reshape(-1, 2)
+        points = shapely.points(points_xy)
+        profiler.count('geometry_constructions', len(points_xy))
+        profiler.count('building_checks', len(points_xy))
+        point_idx, _ = self.obstacle_index.query(points, predicate='dwithin', distance=radius)
+        obstacle_detected = np.zeros(len(points_xy), dtype=bool)
+        obstacle_detected[point_idx] = True
+        return obstacle_detected
+
+
+    def obstacle_clearance(self, points_xy, max_distance) -> np.ndarray:
+        '''Exact distance from each point to the nearest static obstacle (hospital buffer), capped at max_distance.
+        Only obstacles within max_distance are searched, which keeps the query fast for points far from any obstacle.
+
+        Args:
+            points_xy (np.ndarray): (N,2) array of UTM positions
+            max_distance (float): search radius
+
+        Returns:
+            np.ndarray: (N,) distances, 0 inside an obstacle, max_distance when no obstacle is closer
+        '''
+        points_xy = np.asarray(points_xy, dtype=float).reshape(-1, 2)
+        clearance = np.full(len(points_xy), float(max_distance))
+        if len(points_xy) == 0 or len(self.obstacle_geometries) == 0:
+            return clearance
+        points = shapely.points(points_xy)
+        profiler.count('geometry_constructions', len(points_xy))
+        profiler.count('building_checks', len(points_xy))
+        (point_idx, _), distance = self.obstacle_index.query_nearest(points, max_distance=max_distance, return_distance=True, all_matches=False)
+        clearance[point_idx] = np.minimum(distance, max_distance)
+        return clearance
+
+
+    def _build_free_space_sampler(self,):
+        '''Internal method. Compiles the vertiport sample space, the airspace minus the hospital buffers,
+        into a constrained Delaunay triangulation and a cumulative area table over its triangles.
+        The costly difference and union are computed only once per Airspace.'''
+        free_space = self.location_utm_gdf.iloc[0,0].difference(self.location_utm_hospital_buffer.union_all())
+
+        # constrained triangulation slows down sharply with the number of holes in a polygon,
+        # airspaces with many buffers are split into tiles of about 100 buffers and triangulated tile by tile
+        num_tiles = int(np.ceil(np.sqrt(len(self.location_utm_hospital_buffer) / 100)))
+        if num_tiles > 1:
+            min_x, min_y, max_x, max_y = free_space.bounds
+            tile_x, tile_y = np.linspace(min_x, max_x, num_tiles + 1), np.linspace(min_y, max_y, num_tiles + 1)
+            tiles = shapely.box(*np.meshgrid(tile_x[:-1], tile_y[:-1]), *np.meshgrid(tile_x[1:], tile_y[1:])).ravel()
+            free_space = shapely.intersection(free_space, tiles)
+
+        triangles = shapely.get_parts(shapely.constrained_delaunay_triangles(free_space))
+        triangles = triangles[shapely.area(triangles) > 0]
+        if len(triangles) == 0:
+            raise RuntimeError(f'{self} has no free space outside the hospital buffers')
+        # exterior ring of a triangle is closed, first three of its four coordinates are the vertices
+        self.free_space_triangles:np.ndarray = shapely.get_coordinates(shapely.get_exterior_ring(triangles)).reshape(-1, 4, 2)[:, :3]
+        self.free_space_cumulative_area:np.ndarray = np.cumsum(shapely.area(triangles))
+
+
+    def sample_free_space(self, num_points, rng = None) -> np.ndarray:
+        '''Samples points uniformly from the airspace outside the hospital buffers.
+        A triangle is drawn with probability proportional to its area, then a uniform point inside it.
+
+        Args:
+            num_points (int): number of points
+            rng (np.random.Generator | None): random generator, default the global np.random functions
+
+        Returns:
+            np.ndarray: (num_points, 2) array of UTM positions
+        '''
+        if not hasattr(self, 'free_space_triangles'):
+            self._build_free_space_sampler()
+
+        rng = np.random if rng is None else rng
+        total_area = self.free_space_cumulative_area[-1]
+        triangle_idx = np.searchsorted(self.free_space_cumulative_area, rng.random(num_points) * total_area, side='right')
+        triangle_idx = np.minimum(triangle_idx, len(self.free_space_cumulative_area) - 1)
+        a, b, c = (self.free_space_triangles[triangle_idx, k] for k in range(3))
+
+        # uniform barycentric coordinates, samples in the far half of the parallelogram are folded back
+        r1, r2 = rng.random((2, num_points, 1))
+        fold = (r1 + r2) > 1
+        r1, r2 = np.where(fold, 1 - r1, r1), np.where(fold, 1 - r2, r2)
+        return a + r1 * (b - a) + r2 * (c - a)
+
+
+    def _distance_field_path(self, resolution) -> str:
+        return os.path.join(self.cache_dir, f'{self.cache_key()}_sdf_{resolution:g}m.npy')
+
+
+    def _compute_distance_field(self, resolution) -> np.ndarray:
+        '''Internal method. Rasterizes the hospital buffers on a grid of cell centers over the airspace bounds
+        and converts the mask into a signed distance field (meters, negative inside a buffer) with
+        euclidean distance transforms. The field is accurate to about one cell.
+        Without any buffer the field is the diagonal of the bounds everywhere, a finite upper bound of any distance in the airspace.'''
+        min_x, min_y, max_x, max_y = self.distance_field_bounds
+        num_cols = int(np.ceil((max_x - min_x) / resolution)) + 1
+        num_rows = int(np.ceil((max_y - min_y) / resolution)) + 1
+
+        # each buffer is only rasterized inside its own bounding box
+        inside = np.zeros((num_rows, num_cols), dtype=bool)
+        for geometry in self.obstacle_geometries:
+            geom_min_x, geom_min_y, geom_max_x, geom_max_y = geometry.bounds
+            col_0, col_1 = np.clip([np.floor((geom_min_x - min_x) / resolution), np.ceil((geom_max_x - min_x) / resolution) + 1], 0, num_cols).astype(int)
+            row_0, row_1 = np.clip([np.floor((geom_min_y - min_y) / resolution), np.ceil((geom_max_y - min_y) / resolution) + 1], 0, num_rows).astype(int)
+            grid_x, grid_y = np.meshgrid(min_x + resolution * np.arange(col_0, col_1), min_y + resolution * np.arange(row_0, row_1))
+            inside[row_0:row_1, col_0:col_1] |= shapely.contains_xy(geometry, grid_x, grid_y)
+
+        if not inside.any():
+            return np.full((num_rows, num_cols), np.hypot(max_x - min_x, max_y - min_y), dtype=np.float32)
+        outside_distance = ndimage.distance_transform_edt(~inside, sampling=resolution)
+        inside_distance = ndimage.distance_transform_edt(inside, sampling=resolution)
+        return (outside_distance - inside_distance).astype(np.float32)
+
+
+    def build_distance_field(self, resolution = 10.):
+        '''Builds the signed distance field of the hospital buffers at resolution (meters per cell).
+        With the cache enabled the field is written next to the airspace layers once and memory-mapped afterwards,
+        so every process sharing the cache shares the same pages. A field already built at the same resolution is kept.
+
+        Args:
+            resolution (float): grid spacing in meters
+        '''
+        if (hasattr(self, 'distance_field') and self.distance_field_resolution == resolution
+                and (not self.cache_dir or isinstance(self.distance_field, np.memmap))):
+            return
+        self.distance_field_resolution = resolution
+        self.distance_field_bounds = tuple(self.location_utm_gdf.total_bounds)
+
+        if not self.cache_dir:
+            self.distance_field = self._compute_distance_field(resolution)
+            return
+
+        path = self._distance_field_path(resolution)
+        if not os.path.exists(path):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as sdf_file:
+                np.save(sdf_file, self._compute_distance_field(resolution))
+            os.replace(tmp_path, path)
+        self.distance_field:np.ndarray = np.load(path, mmap_mode='r')
+
+
+    def build_indexes(self, distance_field_resolution = 10.):
+        '''Builds the lazily built structures (free space sampler, distance field) now,
+        e.g. before forking workers that share this airspace copy-on-write.'''
+        if not hasattr(self, 'free_space_triangles'):
+            self._build_free_space_sampler()
+        self.build_distance_field(distance_field_resolution)
+
+
+    def obstacle_distance(self, points_xy):
+        '''Signed distance (meters) from each point to the nearest hospital buffer, negative inside a buffer,
+        and the gradient of the distance, which points away from the nearest buffer.
+        The distance field is bilinearly interpolated, points outside the airspace bounds are clamped to its edge.
+        An airspace without buffers gives the diagonal of its bounds as the distance and a zero gradient.
+        Builds the distance field at 10 m resolution on first use, call build_distance_field for another resolution.
+
+        Args:
+            points_xy (np.ndarray): (N,2) array of UTM positions
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: (N,) distances and (N,2) gradients
+        '''
+        if not hasattr(self, 'distance_field'):
+            self.build_distance_field()
+
+        points_xy = np.asarray(points_xy, dtype=float).reshape(-1, 2)
+        resolution = self.distance_field_resolution
+        num_rows, num_cols = self.distance_field.shape
+        min_x, min_y = self.distance_field_bounds[:2]
+
+        # continuous grid coordinates, the lower left corner of each cell and the offset inside it
+        grid_x = np.clip((points_xy[:, 0] - min_x) / resolution, 0, num_cols - 1)
+        grid_y = np.clip((points_xy[:, 1] - min_y) / resolution, 0, num_rows - 1)
+        col = np.minimum(grid_x.astype(int), num_cols - 2)
+        row = np.minimum(grid_y.astype(int), num_rows - 2)
+        tx, ty = grid_x - col, grid_y - row
+
+        d_00 = self.distance_field[row, col]
+        d_01 = self.distance_field[row, col + 1]
+        d_10 = self.distance_field[row + 1, col]
+        d_11 = self.distance_field[row + 1, col + 1]
+
+        distance = (1 - ty) * ((1 - tx) * d_00 + tx * d_01) + ty * ((1 - tx) * d_10 + tx * d_11)
+        gradient = np.column_stack((((1 - ty) * (d_01 - d_00) + ty * (d_11 - d_10)) / resolution,
+                                    ((1 - tx) * (d_10 - d_00) + tx * (d_11 - d_01)) / resolution))
+        return distance, gradient
+
+
+class SyntheticAirspace(Airspace):
+    '''
+    Network free Airspace stand-in for tests and benchmarks.
+
+    The city boundary is a procedurally generated star shaped polygon and the hospitals are
+    num_hospitals random rectangles inside it, projected to a UTM CRS like the osmnx layers.
+    Everything downstream (obstacle index, free space sampler, distance field) works unchanged.
+    '''
+
+    def __init__(self, num_hospitals = 50, size = 20000., buffer_radius = 500, seed = 0, cache_dir = False):
+        '''
+        Args:
+            num_hospitals (int): number of synthetic hospital polygons
+            size (float): approximate diameter (meters) of the city
+            buffer_radius (float): no-fly buffer (meters) around each hospital
+            seed (int): seed of the generated city, the same arguments always give the same airspace
+            cache_dir (str | False): airspace cache directory, disabled by default since generation is cheap
+        '''
+        self.num_hospitals = num_hospitals
+        self.size = size
+        self.seed = seed
+        super().__init__(f'synthetic_{num_hospitals}_{size:g}_{seed}', buffer_radius=buffer_radius, cache_dir=cache_dir, offline=False)
+
+
+    def _load_from_network(self,):
+        '''Generates the city instead of downloading it.'''
+        rng = np.random.default_rng(self.seed)
+        crs = 'EPSG:32614' # UTM zone 14N, same zone as Austin
+        origin = np.array([600000., 3340000.])
+
+        # boundary - radius varies smoothly with angle, a few low frequency harmonics
+        angle = np.linspace(0, 2*np.pi, 180, endpoint=False)
+        radius = np.ones_like(angle)
+        for harmonic in range(2, 6):
+            radius += rng.uniform(0, 0.12) * np.cos(harmonic * angle + rng.uniform(0, 2*np.pi))
+        radius *= 0.5 * self.size / radius.max()
+        boundary = shapely.Polygon(origin + np.column_stack((radius * np.cos(angle), radius * np.sin(angle))))
+
+        self.location_utm_gdf = gpd.GeoDataFrame(geometry=[boundary], crs=crs)
+        self.location_utm_gdf['boundary'] = self.location_utm_gdf.boundary
+
+        # hospitals - random rotated rectangles, 40 to 200 meters a side, centres sampled inside the boundary
+        min_x, min_y, max_x, max_y = boundary.bounds
+        centres = np.zeros((0, 2))
+        while len(centres) < self.num_hospitals:
+            candidates = rng.uniform((min_x, min_y), (max_x, max_y), (2 * self.num_hospitals, 2))
+            candidates = candidates[shapely.contains_xy(boundary, candidates[:, 0], candidates[:, 1])]
+            centres = np.vstack((centres, candidates))[:self.num_hospitals]
+
+        half_sides = rng.uniform(20, 100, (self.num_hospitals, 2))
+        rotation = rng.uniform(0, np.pi, self.num_hospitals)
+        corners = np.array([[-1, -1], [1, -1], [1, 1], [-1, 1]])[None] * half_sides[:, None]
+        cos, sin = np.cos(rotation)[:, None], np.sin(rotation)[:, None]
+        corners = np.stack((cos * corners[..., 0] - sin * corners[..., 1],
+                            sin * corners[..., 0] + cos * corners[..., 1]), axis=-1) + centres[:, None]
+        hospitals = shapely.polygons(corners)
+
+        self.location_utm_hospital = gpd.GeoDataFrame(geometry=hospitals, crs=crs)
+        self.location_utm_hospital_buffer = self.location_utm_hospital.buffer(self.buffer_radius)
+
+
+    #TODO - Look at system design principles to choose one of the ways to populate the area with 1) hospitals 2) airport and airspace 3) school etc.
@@ -16,10 +16,8 @@ If collision detected;
 The Backward pass needs to calculate what should be the correction heading for uavs that have collided in future. 
 '''
 import numpy as np
-import random
 from shapely import Point
 import shapely
-from geopandas import GeoSeries
 from typing import List, Dict
 from airspace import Airspace
 from vertiport import Vertiport
@@ -27,27 +25,48 @@ from uav import UAV
 from uav_basic import UAV_Basic
 from autonomous_uav import Autonomous_UAV
 from das import Collision_controller
-import copy
+from fleet_state import FleetState
+from profiling import profiler
 #from autonomous_uav import Autonomous_UAV
 
 
 class ATC:
 
-    def __init__(self, airspace:Airspace, ):
+    def __init__(self, airspace:Airspace, rng = None):
         '''ATC (Air Traffic Controller) - maintains information on UAVs and Vertiports.
 
         Args:
             airspace (Airspace): The airspace object associated with the ATC.
+            rng (np.random.Generator | None): generator of the scenario - vertiport locations, start/end assignment,
+                                              headings and end vertiport reassignments. Default the global np.random functions.
 
         Attributes:
             airspace (Airspace): The airspace object associated with the ATC.
             reg_uav_list (List[UAV]): The list of registered UAVs.
             vertiports_in_airspace (List[Vertiport]): The list of vertiports in the airspace.
+            fleet_state (FleetState): Array state of the registered UAVs, one slot per UAV.
+            uav_pool (List[UAV_Basic]): Every UAV_Basic created by the ATC, uav_pool[i] owns fleet slot i.
+                                        UAVs are reused from the pool when the scenario is reset.
+            vertiport_xy (np.ndarray): (num_vertiports, 2) locations of vertiports_in_airspace.
+            uav_registry (Dict[int, int]): uav id -> index of the UAV in reg_uav_list.
+            vertiport_registry (Dict[int, int]): vertiport id -> index of the vertiport in vertiports_in_airspace.
+            profiler (StepProfiler): profiler shared by the sim and UAV code, counts landings, takeoffs and reassignments.
+            predicted_conflicts (Dict[str, np.ndarray]): conflicts found by the last predict_conflicts call.
+            rng (np.random.Generator | module): generator of the scenario, can be replaced between episodes.
         '''
 
         self.airspace = airspace
         self.reg_uav_list:List[UAV_Basic] = [] #:List[UAV]
         self.vertiports_in_airspace:List[Vertiport] = [] #:List[Vertiport]
+        self.fleet_state = FleetState()
+        self.uav_pool:List[UAV_Basic] = []
+        self.vertiport_xy:np.ndarray = np.zeros((0, 2))
+        self.uav_registry:Dict[int, int] = {}
+        self.vertiport_registry:Dict[int, int] = {}
+        self.profiler = profiler
+        self.predicted_conflicts:Dict[str, np.ndarray] = {}
+        # only calls shared by np.random.Generator and the np.random module are used
+        self.rng = np.random if rng is None else rng
         #self.controller = controller
         
     
@@ -67,15 +86,52 @@ class ATC:
             - Creates the vertiports and updates the vertiports in the airspace list.
         """
         
-        # Need to remove the hospital regions first so that vertiports are not sampled from hospital and buffer zones
-        sample_space = self.airspace.location_utm_gdf.iloc[0,0].difference(self.airspace.location_utm_hospital_buffer.unary_union)
-        sample_space_gdf = GeoSeries(sample_space)
-        sample_vertiport:GeoSeries = sample_space_gdf.sample_points(num_vertiports)
-        sample_vertiport_array:np.ndarray = shapely.get_parts(sample_vertiport[0])
+        sample_vertiport_array = self._sample_vertiport_locations(num_vertiports)
 
         for location in sample_vertiport_array:
-            self.vertiports_in_airspace.append(Vertiport(location=location, uav_list=[])) # location-> shapely.Point
+            vertiport = Vertiport(location=location, uav_list=[]) # location-> shapely.Point
+            self.vertiport_registry[vertiport.id] = len(self.vertiports_in_airspace)
+            self.vertiports_in_airspace.append(vertiport)
+        self.vertiport_xy = np.vstack((self.vertiport_xy, shapely.get_coordinates(sample_vertiport_array)))
     
+    def _sample_vertiport_locations(self, num_vertiports) -> np.ndarray:
+        '''Internal method. Samples num_vertiports random Points in the airspace, outside hospital buffers.'''
+        # vertiports are not sampled from hospital and buffer zones, airspace precomputes that sample space once
+        sample_vertiport_array:np.ndarray = shapely.points(self.airspace.sample_free_space(num_vertiports, rng=self.rng))
+        return sample_vertiport_array
+    
+    def resample_vertiports(self,):
+        '''Moves the existing vertiports to new random locations, the Vertiport objects are reused.'''
+        sample_vertiport_array = self._sample_vertiport_locations(len(self.vertiports_in_airspace))
+        for vertiport, location in zip(self.vertiports_in_airspace, sample_vertiport_array):
+            vertiport.location = location
+        self.vertiport_xy = shapely.get_coordinates(sample_vertiport_array)
+    
+    def _sample_start_end_vertiports(self, num_uavs):
+        '''Internal method. Picks start and end vertiports (indices into vertiports_in_airspace) for num_uavs UAVs.
+        No two UAVs share a start vertiport or an end vertiport, and a UAV's start and end vertiport differ.
+        At least one vertiport is left without a UAV starting at it, for the auto_uav.
+
+        Starts and ends are each one random permutation. A UAV whose end equals its start swaps ends with
+        any other position of the end permutation, which cannot create a new clash since starts and ends are distinct.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: start and end vertiport indices
+        '''
+        num_vertiports = len(self.vertiports_in_airspace)
+        if num_uavs >= num_vertiports:
+            raise RuntimeError(f'{num_uavs} UAVs need more than {num_vertiports} vertiports, one vertiport is kept free for the auto_uav')
+
+        start_idx = self.rng.permutation(num_vertiports)[:num_uavs]
+        end_perm = self.rng.permutation(num_vertiports)
+        for k in np.flatnonzero(end_perm[:num_uavs] == start_idx):
+            if end_perm[k] != start_idx[k]: # already fixed by an earlier swap
+                continue
+            m = (k + 1 + self.rng.choice(num_vertiports - 1)) % num_vertiports
+            end_perm[k], end_perm[m] = end_perm[m], end_perm[k]
+        
+        return start_idx, end_perm[:num_uavs]
+
     #TODO - break the task of creating UAVs and assigning start end vertiport 
     #* This method needs to be run once to initialize the sim 
     def create_n_reg_uavs(self, num_uavs, ):
@@ -89,18 +145,89 @@ class ATC:
             None
         """
         
-        start_vertiport_list = copy.deepcopy(self.vertiports_in_airspace)
-        end_vertiport_list = copy.deepcopy(self.vertiports_in_airspace)
-
-        for _ in range(num_uavs):
-            uav_start_vertiport = random.choice(start_vertiport_list)
-            uav_end_vertiport = random.choice(end_vertiport_list)
-            while uav_start_vertiport.location == uav_end_vertiport.location:
-                uav_end_vertiport = random.choice(end_vertiport_list)
-            uav = UAV_Basic(uav_start_vertiport, uav_end_vertiport)
-            start_vertiport_list.pop(start_vertiport_list.index(uav_start_vertiport))
-            end_vertiport_list.pop(end_vertiport_list.index(uav_end_vertiport))
-            self.reg_uav_list.append(uav)
+        start_idx, end_idx = self._sample_start_end_vertiports(num_uavs)
+
+        for uav_start_idx, uav_end_idx in zip(start_idx, end_idx):
+            uav = UAV_Basic(self.vertiports_in_airspace[uav_start_idx], 
+                            self.vertiports_in_airspace[uav_end_idx], 
+                            fleet_state=self.fleet_state,
+                            heading_deg=self.rng.uniform(-178, 178))
+            self.fleet_state.start_vertiport[uav.fleet_index] = uav_start_idx
+            self.fleet_state.end_vertiport[uav.fleet_index] = uav_end_idx
+            self.uav_pool.append(uav)
+            self._register_uav(uav)
+
+    def _register_uav(self, uav:UAV_Basic):
+        '''Internal method. Appends uav to reg_uav_list and records its index in uav_registry.'''
+        self.uav_registry[uav.id] = len(self.reg_uav_list)
+        self.reg_uav_list.append(uav)
+
+    def get_uav(self, uav_id) -> UAV_Basic:
+        '''Returns the registered UAV with id uav_id.'''
+        try:
+            return self.reg_uav_list[self.uav_registry[int(uav_id)]]
+        except KeyError:
+            raise RuntimeError('UAV not it list')
+
+    def get_vertiport(self, vertiport_id) -> Vertiport:
+        '''Returns the vertiport with id vertiport_id.'''
+        try:
+            return self.vertiports_in_airspace[self.vertiport_registry[int(vertiport_id)]]
+        except KeyError:
+            raise RuntimeError('Vertiport not in airspace')
+
+    def reset_reg_uavs(self, num_uavs):
+        """
+        Refills reg_uav_list in place with num_uavs UAVs parked at new random start vertiports.
+        UAVs are reused from uav_pool and their fleet slots are reset with array operations,
+        new UAV_Basic objects are only created when the pool is too small.
+
+        Args:
+            num_uavs (int): The number of UAVs in the new scenario.
+
+        Returns:
+            None
+        """
+        start_idx, end_idx = self._sample_start_end_vertiports(num_uavs)
+        num_pooled = min(num_uavs, len(self.uav_pool))
+        
+        self.reg_uav_list.clear()
+        self.uav_registry.clear()
+        self.fleet_state.num_uavs = num_pooled
+        for uav, uav_start_idx, uav_end_idx in zip(self.uav_pool, start_idx, end_idx):
+            uav.start_vertiport = self.vertiports_in_airspace[uav_start_idx]
+            uav.end_vertiport = self.vertiports_in_airspace[uav_end_idx]
+            uav.refresh_uav()
+            self._register_uav(uav)
+        self.fleet_state.reset_slots(self.vertiport_xy[start_idx[:num_pooled]], self.vertiport_xy[end_idx[:num_pooled]], rng=self.rng)
+
+        for uav_start_idx, uav_end_idx in zip(start_idx[num_pooled:], end_idx[num_pooled:]):
+            uav = UAV_Basic(self.vertiports_in_airspace[uav_start_idx], 
+                            self.vertiports_in_airspace[uav_end_idx], 
+                            fleet_state=self.fleet_state,
+                            heading_deg=self.rng.uniform(-178, 178))
+            self.uav_pool.append(uav)
+            self._register_uav(uav)
+        # pool UAVs own slots 0..num_uavs-1 in reg_uav_list order
+        self.fleet_state.start_vertiport[:num_uavs] = start_idx
+        self.fleet_state.end_vertiport[:num_uavs] = end_idx
+
+    def reset(self, num_uavs, resample_vertiports = False):
+        """
+        Resets the scenario in place for a new episode, the airspace and its indexes are kept.
+
+        Args:
+            num_uavs (int): The number of regular UAVs in the new scenario.
+            resample_vertiports (bool): Move the vertiports to new random locations.
+
+        Returns:
+            None
+        """
+        for vertiport in self.vertiports_in_airspace:
+            vertiport.uav_occupancy.clear()
+        if resample_vertiports:
+            self.resample_vertiports()
+        self.reset_reg_uavs(num_uavs)
 
             
     
@@ -122,6 +249,72 @@ class ATC:
         return filtered_vertiport
     
 
+    def vertiport_events(self,):
+        '''Departure and arrival checks of has_left_start_vertiport and has_reached_end_vertiport
+        for the whole fleet, evaluated on the fleet arrays.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: fleet indices of UAVs that have left their start vertiport (more than 100 m away)
+                                           and of UAVs that have reached their end vertiport (within landing_proximity)
+        '''
+        fleet_state = self.fleet_state
+        n = len(fleet_state)
+        x, y = fleet_state.x[:n], fleet_state.y[:n]
+        # same arithmetic as Point.distance, so events match the per UAV checks exactly
+        dx_start, dy_start = x - fleet_state.start_x[:n], y - fleet_state.start_y[:n]
+        dx_end, dy_end = x - fleet_state.end_x[:n], y - fleet_state.end_y[:n]
+        distance_to_start = np.sqrt(dx_start * dx_start + dy_start * dy_start)
+        distance_to_end = np.sqrt(dx_end * dx_end + dy_end * dy_end)
+
+        departing = np.flatnonzero((distance_to_start > 100) & ~fleet_state.leaving_start_vertiport[:n])
+        landing = np.flatnonzero((distance_to_end <= fleet_state.landing_proximity[:n]) & ~fleet_state.reaching_end_vertiport[:n])
+        return departing, landing
+
+
+    def update_vertiport_events(self,):
+        '''Batched has_left_start_vertiport + has_reached_end_vertiport over reg_uav_list.
+
+        Events are detected for the whole fleet at once, then the clearing and landing procedures run
+        only for the UAVs with an event. Per UAV the loop does the departure check before the arrival check,
+        neither procedure changes another UAV's check, so all departures are applied first and
+        landings follow in fleet order, which keeps the random end vertiport draws in the same order.
+        reg_uav_list has to be in fleet order (reg_uav_list[i].fleet_index == i).
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: fleet indices of departing and landing UAVs
+        '''
+        departing, landing = self.vertiport_events()
+        for fleet_index in departing:
+            uav = self.reg_uav_list[fleet_index]
+            self._clearing_procedure(uav)
+            uav.leaving_start_vertiport = True
+        for fleet_index in landing:
+            self._landing_procedure(self.reg_uav_list[fleet_index])
+        return departing, landing
+
+
+    def predict_conflicts(self, interaction_cache, radius_str = 'nmac', lookahead = 30.) -> Dict[str, np.ndarray]:
+        '''Conflicts in the near future - UAV pairs whose closest point of approach in the next lookahead seconds
+        is within radius_str, at their current speeds and headings (detection.InteractionCache.predicted_conflicts).
+
+        Args:
+            interaction_cache (InteractionCache): cache updated for the current positions
+            radius_str (str): 'nmac' or 'collision' ('detection' for early advisories)
+            lookahead (float): horizon (s)
+
+        Returns:
+            Dict[str, np.ndarray]: 'uav_id_i', 'uav_id_j', 't_cpa' (s) and 'miss_distance' (m), one entry per pair,
+                                   also stored in self.predicted_conflicts
+        '''
+        pair_i, pair_j, t_cpa, miss_distance = interaction_cache.predicted_conflicts(radius_str, lookahead)
+        self.predicted_conflicts = {'uav_id_i':self.fleet_state.uav_id[pair_i],
+                                    'uav_id_j':self.fleet_state.uav_id[pair_j],
+                                    't_cpa':t_cpa,
+                                    'miss_distance':miss_distance}
+        profiler.count('predicted_conflicts', len(pair_i))
+        return self.predicted_conflicts
+
+
     def has_reached_end_vertiport(self, uav:UAV_Basic):
         '''Checks if a UAV has reached its end_vertiport.
         
@@ -167,7 +360,7 @@ class ATC:
         Returns:
             Vertiport: A Vertiport object selected randomly from the available vertiports.
         '''
-        sample_vertiport = random.choice(self.vertiports_in_airspace)
+        sample_vertiport = self.vertiports_in_airspace[self.rng.choice(len(self.vertiports_in_airspace))]
         return sample_vertiport
     
     
@@ -183,10 +376,12 @@ class ATC:
             uav (UAV): The UAV object for which the end vertiport needs to be reassigned.
         '''
         sample_end_vertiport = self.provide_vertiport()
-        while sample_end_vertiport.location == uav.start_vertiport.location:
+        while sample_end_vertiport is uav.start_vertiport:
             sample_end_vertiport = self.provide_vertiport()
         uav.end_vertiport = sample_end_vertiport
+        uav.fleet_state.end_vertiport[uav.fleet_index] = self.vertiport_registry[sample_end_vertiport.id]
         uav.update_end_point()
+        profiler.count('atc_reassignments')
     
 
     def _update_start_vertiport_of_uav(self, vertiport:Vertiport, uav:UAV_Basic):
@@ -203,6 +398,7 @@ class ATC:
 
         '''
         uav.start_vertiport = vertiport
+        uav.fleet_state.start_vertiport[uav.fleet_index] = self.vertiport_registry[vertiport.id]
         uav.update_start_point()
     
 
@@ -217,7 +413,8 @@ class ATC:
             None
         '''
         landing_vertiport = landing_uav.end_vertiport
-        landing_vertiport.uav_list.append(landing_uav) 
+        landing_vertiport.add_uav(landing_uav)
+        profiler.count('atc_landings')
         landing_uav.refresh_uav()
         self._reassign_end_vertiport_of_uav(landing_uav)
 
@@ -233,10 +430,8 @@ class ATC:
         Raises:
             None
         '''
-        outgoing_uav_id = outgoing_uav.id
-        for uav in outgoing_uav.start_vertiport.uav_list:
-            if uav.id == outgoing_uav_id:
-                outgoing_uav.start_vertiport.uav_list.remove(uav)
+        outgoing_uav.start_vertiport.remove_uav(outgoing_uav)
+        profiler.count('atc_takeoffs')
 
     
     def set_start_end_uav(self, list_uav_airspace):
@@ -245,8 +440,18 @@ class ATC:
 
 
     def create_auto_uav(self,) -> Autonomous_UAV:
-        #! need to provide the start and end vertiport
-        self.auto_uav = Autonomous_UAV()
+        '''Creates the auto_uav at a vertiport that is not the start vertiport of any regular UAV,
+        with a random end vertiport.'''
+        occupied_vertiports = {uav.start_vertiport.id for uav in self.reg_uav_list}
+        vacant_vertiports = [vertiport for vertiport in self.vertiports_in_airspace if vertiport.id not in occupied_vertiports]
+        if len(vacant_vertiports) == 0:
+            raise RuntimeError('No vacant vertiport for the auto uav')
+        
+        auto_uav_start_vertiport = vacant_vertiports[self.rng.choice(len(vacant_vertiports))]
+        end_vertiports = self._vertiport_filtering(auto_uav_start_vertiport)
+        auto_uav_end_vertiport = end_vertiports[self.rng.choice(len(end_vertiports))]
+        self.auto_uav = Autonomous_UAV(auto_uav_start_vertiport, auto_uav_end_vertiport, heading_deg=self.rng.uniform(-178, 178))
+        return self.auto_uav
 
     def create_n_uavs(self, percent_auto):
         '''This method will create a mix of smart and regular uavs.
@@ -9,13 +9,14 @@ class Autonomous_UAV(UAV):
                  start_vertiport,
                  end_vertiport,
                  landing_proximity = 50,
-                 max_speed = 40):
+                 max_speed = 40,
+                 heading_deg = None):
         '''Representation of UAV in airspace. UAV motion represented in 2D plane. 
      Object is to move from start vertiport to end vertiport.
      A UAV instance requires a start and end vertiport.
      '''
 
-        super().__init__(start_vertiport, end_vertiport, landing_proximity, max_speed)
+        super().__init__(start_vertiport, end_vertiport, landing_proximity, max_speed, heading_deg)
         #! need to update the rendering properties, 
         #! since i have called super how do i pass/update the attributes
         #UAV rendering-representation properties 
@@ -27,7 +28,7 @@ class Autonomous_UAV(UAV):
 
 
     def step(self, acceleration, heading_correction):
-        self._update_speed(acceleration, d_t=1)
+        self._update_speed(d_t=1, acceleration_from_controller=acceleration)
         self._update_position(d_t=1, ) 
         self._update_theta_d(heading_correction)
         self._update_ref_final_heading()
\ No newline at end of file
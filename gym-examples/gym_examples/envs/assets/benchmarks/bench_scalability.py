@@ -0,0 +1,185 @@
+'''
+Scalability benchmark of Simulator_basic.sim_step and Uam_Uav_Env.step on a SyntheticAirspace, no network needed.
+
+    python benchmarks/bench_scalability.py                      # quick grid
+    python benchmarks/bench_scalability.py --preset full        # 10 to 10,000 UAVs x 10 to 10,000 obstacles
+    python benchmarks/bench_scalability.py --compare benchmarks/results/<previous>.json
+
+For every (target, num_uavs, num_obstacles) it reports steps/s, per-step latency percentiles (ms)
+and the peak memory allocated while stepping (tracemalloc, measured in a separate pass so it does
+not slow down the timed steps). Results are written to benchmarks/results/<time>_<commit>.json,
+--compare prints the ratio against an earlier result file and flags regressions.
+'''
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import subprocess
+import tracemalloc
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSETS_DIR = os.path.dirname(BENCHMARK_DIR)
+ENVS_DIR = os.path.dirname(ASSETS_DIR)
+sys.path[:0] = [ASSETS_DIR, ENVS_DIR]
+
+from airspace import SyntheticAirspace
+from simulator_basic import Simulator_basic
+
+
+PRESETS = {'quick':{'num_uavs':[10, 100, 1000], 'num_obstacles':[10, 1000]},
+           'full':{'num_uavs':[10, 100, 1000, 10000], 'num_obstacles':[10, 100, 1000, 10000]}}
+
+
+def make_airspace(num_obstacles, seed = 0) -> SyntheticAirspace:
+    '''City grows with the obstacle count, so the free space left for vertiports stays about the same fraction.'''
+    size = 20000. * max(1., np.sqrt(num_obstacles / 100))
+    return SyntheticAirspace(num_hospitals=num_obstacles, size=size, seed=seed)
+
+
+def make_simulator_basic(airspace, num_uavs, conflict_horizon = False, conflict_lookahead = None):
+    sim = Simulator_basic(airspace.location_name, num_uavs + 2, num_uavs, sleep_time=0, total_timestep=0, airspace=airspace,
+                          conflict_horizon=conflict_horizon, conflict_lookahead=conflict_lookahead)
+    sim.set_uav_intruder_list()
+    sim.set_building_gdf()
+    return sim.sim_step
+
+
+def make_cpa_kernel(airspace, num_uavs, pairs_per_uav = 5):
+    '''detection.closest_point_of_approach alone on pairs_per_uav random candidate pairs per UAV (5,000 pairs at 1,000 UAVs),
+    relative positions within the broad phase reach of a 30 s lookahead and relative speeds up to 2 x max_speed.'''
+    from detection import closest_point_of_approach
+    num_pairs = pairs_per_uav * num_uavs
+    rng = np.random.default_rng(0)
+    dx, dy = rng.uniform(-2000, 2000, (2, num_pairs))
+    dvx, dvy = rng.uniform(-86, 86, (2, num_pairs))
+    return lambda: closest_point_of_approach(dx, dy, dvx, dvy, 30.)
+
+
+def make_uam_env(airspace, num_uavs):
+    from uam_uav import Uam_Uav_Env
+    # distance field is kept at about 2000 x 2000 cells for the large synthetic cities
+    env = Uam_Uav_Env(airspace.location_name, num_uavs + 2, num_uavs, airspace=airspace,
+                      distance_field_resolution=max(10., airspace.size / 2000))
+    env.reset(seed=0)
+    action = np.zeros(2)
+    return lambda: env.step(action)
+
+
+TARGETS = {'Simulator_basic.sim_step':make_simulator_basic,
+           'Simulator_basic.sim_step+horizon':lambda airspace, num_uavs: make_simulator_basic(airspace, num_uavs, conflict_horizon=True),
+           'Simulator_basic.sim_step+cpa':lambda airspace, num_uavs: make_simulator_basic(airspace, num_uavs, conflict_lookahead=30.),
+           'closest_point_of_approach':make_cpa_kernel,
+           'Uam_Uav_Env.step':make_uam_env}
+
+
+def time_steps(step, num_steps, num_warmup):
+    for _ in range(num_warmup):
+        step()
+    latency = np.empty(num_steps)
+    for k in range(num_steps):
+        start = time.perf_counter()
+        step()
+        latency[k] = time.perf_counter() - start
+    return latency
+
+
+def peak_step_memory(step, num_steps) -> float:
+    '''Peak memory (MB) allocated by num_steps steps, on top of what was allocated before stepping.'''
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    for _ in range(num_steps):
+        step()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (peak - baseline) / 2**20
+
+
+def run_case(target, num_uavs, num_obstacles, airspace, num_steps, num_warmup, seed = 0) -> dict:
+    random.seed(seed)
+    np.random.seed(seed)
+    build_start = time.perf_counter()
+    step = TARGETS[target](airspace, num_uavs)
+    build_time = time.perf_counter() - build_start
+
+    latency = time_steps(step, num_steps, num_warmup)
+    return {'target':target,
+            'num_uavs':num_uavs,
+            'num_obstacles':num_obstacles,
+            'num_steps':num_steps,
+            'build_s':build_time,
+            'steps_per_s':num_steps / latency.sum(),
+            'latency_ms':{f'p{q}':float(np.percentile(latency, q) * 1e3) for q in (50, 90, 99)},
+            'peak_step_memory_mb':peak_step_memory(step, max(1, num_steps // 10))}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=BENCHMARK_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(results, previous_path, threshold):
+    '''Prints the steps/s ratio of every case that is also in the previous result file.'''
+    with open(previous_path) as previous_file:
+        previous = json.load(previous_file)
+    previous_cases = {(case['target'], case['num_uavs'], case['num_obstacles']):case for case in previous['results']}
+    print(f'\ncompared with {previous["commit"]} ({previous_path})')
+    for case in results:
+        key = (case['target'], case['num_uavs'], case['num_obstacles'])
+        if key not in previous_cases:
+            continue
+        ratio = case['steps_per_s'] / previous_cases[key]['steps_per_s']
+        flag = '  REGRESSION' if ratio < 1 - threshold else ''
+        print(f'{key[0]:<34} uavs={key[1]:<6} obstacles={key[2]:<6} steps/s x{ratio:.2f}{flag}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='UAM scalability benchmark')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='quick')
+    parser.add_argument('--targets', nargs='+', choices=sorted(TARGETS), default=['Simulator_basic.sim_step', 'Uam_Uav_Env.step'])
+    parser.add_argument('--num-uavs', type=int, nargs='+', help='overrides the preset fleet sizes')
+    parser.add_argument('--num-obstacles', type=int, nargs='+', help='overrides the preset obstacle counts')
+    parser.add_argument('--steps', type=int, default=50, help='timed steps per case')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--output-dir', default=os.path.join(BENCHMARK_DIR, 'results'))
+    parser.add_argument('--compare', help='earlier result file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1, help='slowdown reported as a regression')
+    args = parser.parse_args()
+
+    num_uavs_list = args.num_uavs or PRESETS[args.preset]['num_uavs']
+    num_obstacles_list = args.num_obstacles or PRESETS[args.preset]['num_obstacles']
+
+    results = []
+    for num_obstacles in num_obstacles_list:
+        airspace = make_airspace(num_obstacles)
+        for target in args.targets:
+            for num_uavs in num_uavs_list:
+                case = run_case(target, num_uavs, num_obstacles, airspace, args.steps, args.warmup)
+                results.append(case)
+                print(f'{target:<34} uavs={num_uavs:<6} obstacles={num_obstacles:<6} '
+                      f'{case["steps_per_s"]:9.1f} steps/s  p50 {case["latency_ms"]["p50"]:8.2f} ms  '
+                      f'p99 {case["latency_ms"]["p99"]:8.2f} ms  peak {case["peak_step_memory_mb"]:7.2f} MB')
+
+    commit = git_commit()
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_path = os.path.join(args.output_dir, f'{time.strftime("%Y%m%d-%H%M%S")}_{commit}.json')
+    with open(output_path, 'w') as output_file:
+        json.dump({'commit':commit,
+                   'time':time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'preset':args.preset,
+                   'python':platform.python_version(),
+                   'numpy':np.__version__,
+                   'machine':platform.machine(),
+                   'processor':platform.processor(),
+                   'results':results}, output_file, indent=2)
+    print(f'results written to {output_path}')
+
+    if args.compare:
+        compare(results, args.compare, args.threshold)
@@ -28,8 +28,21 @@ class Collision_controller:
     and based on that specific UAVs observation, it will assign action to that specific UAV.
     '''
 
-    def __init__(self) -> None:
+    def __init__(self, static_heading_correction = 25) -> None:
         self.name = 'Baseline Collision Controller'
+        self.static_heading_correction = static_heading_correction
+        
+        # quadrant lookup tables for the batched controller,
+        # indexed by [intruder relative position quadrant, own heading quadrant, intruder heading quadrant]
+        # relative position quadrant - 0: del_x>0,del_y>0  1: del_x<0,del_y>0  2: del_x<0,del_y<0  3: del_x>0,del_y<0
+        self.heading_correction_table = np.zeros((4, 5, 5))
+        self.acceleration_table = np.zeros((4, 5, 5))
+        for rel_quadrant, own_quadrant, intruder_quadrant, heading_correction in ((0, 1, 4, 25),
+                                                                                  (1, 2, 3, -25),
+                                                                                  (2, 4, 1, 25),
+                                                                                  (3, 3, 2, -25)):
+            self.heading_correction_table[rel_quadrant, own_quadrant, intruder_quadrant] = heading_correction
+            self.acceleration_table[rel_quadrant, own_quadrant, intruder_quadrant] = -1
 
     def get_quadrant(self, theta):
         if (theta >= 0) and (theta < 90):
@@ -42,6 +55,13 @@ class Collision_controller:
             return 4
         else:
             raise RuntimeError('DAS Error: Invalid heading')
+
+    @staticmethod
+    def get_quadrant_batch(theta):
+        '''Vectorized get_quadrant, theta is an array of headings'''
+        if np.any(~((theta >= -180) & (theta <= 180))):
+            raise RuntimeError('DAS Error: Invalid heading')
+        return np.select([(theta >= 0) & (theta < 90), theta >= 90, theta >= -90], [1, 2, 3], 4)
         
     '''
     state -> static state                dynamic state                          get_action
@@ -105,9 +125,9 @@ class Collision_controller:
                 current_heading -= 360
 
             if 0 <= current_heading or current_heading <= 180:
-                heading_correction = 25
+                heading_correction = self.static_heading_correction
             elif -180<=current_heading or current_heading<= 0: 
-                heading_correction = -25
+                heading_correction = -self.static_heading_correction
             else:
                 raise RuntimeError(f'DAS module - state[0][0] is True and state[1] is None, current heading {state[0][1]}')
 
@@ -119,6 +139,43 @@ class Collision_controller:
             raise RuntimeError('DAS module: static and dynamic states do not match the conditionals')
 
         return acceleration, heading_correction
+
+    def get_action_batch(self, static_mask, own_heading_deg, intruder_rel_pos, intruder_heading_deg, intruder_mask):
+        '''
+        Batched get_action, produces the same actions for all UAVs at once.
+
+        Args:
+            static_mask (np.ndarray): (N,) bool, static object detected
+            own_heading_deg (np.ndarray): (N,) own current heading
+            intruder_rel_pos (np.ndarray): (N,2) nearest intruder position relative to own position
+            intruder_heading_deg (np.ndarray): (N,) nearest intruder current heading
+            intruder_mask (np.ndarray): (N,) bool, True where the UAV has an intruder, other intruder entries are ignored
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: acceleration and heading_correction, one per UAV
+        '''
+        static_mask = np.asarray(static_mask, dtype=bool)
+        intruder_mask = np.asarray(intruder_mask, dtype=bool)
+        acceleration = np.zeros(len(static_mask))
+        heading_correction = np.zeros(len(static_mask))
+
+        # static object and no intruder - always turns by static_heading_correction, same as get_action
+        heading_correction[static_mask & ~intruder_mask] = self.static_heading_correction
+
+        # intruder and no static object - quadrant logic
+        dynamic_mask = ~static_mask & intruder_mask
+        if np.any(dynamic_mask):
+            del_x = np.asarray(intruder_rel_pos)[dynamic_mask, 0]
+            del_y = np.asarray(intruder_rel_pos)[dynamic_mask, 1]
+            if np.any((del_x == 0) | (del_y == 0)):
+                raise RuntimeError('Action not from scenario')
+            rel_quadrant = np.where(del_y > 0, np.where(del_x > 0, 0, 1), np.where(del_x < 0, 2, 3))
+            own_quadrant = self.get_quadrant_batch(np.asarray(own_heading_deg)[dynamic_mask])
+            intruder_quadrant = self.get_quadrant_batch(np.asarray(intruder_heading_deg)[dynamic_mask])
+            acceleration[dynamic_mask] = self.acceleration_table[rel_quadrant, own_quadrant, intruder_quadrant]
+            heading_correction[dynamic_mask] = self.heading_correction_table[rel_quadrant, own_quadrant, intruder_quadrant]
+
+        return acceleration, heading_correction
     
 
 
@@ -134,6 +191,9 @@ class Zero_controller:
 
     def get_action(self, state):
         return 0,0 
+
+    def get_action_batch(self, static_mask, own_heading_deg, intruder_rel_pos, intruder_heading_deg, intruder_mask):
+        return np.zeros(len(static_mask)), np.zeros(len(static_mask))
     
 
 
@@ -0,0 +1,528 @@
+# Detection of intruder UAVs, circle-circle checks done on coordinate arrays instead of buffered polygons
+
+import numpy as np
+from scipy.spatial import cKDTree
+from shapely import Point
+from profiling import profiler
+
+
+def intruder_mask(own_xy, others_xy, own_radius, other_radius):
+    '''Checks which of the other UAVs intersect the own UAV.
+
+    Two circles intersect exactly when the distance between their centres is at most r1 + r2,
+    so no polygon needs to be built.
+
+    Args:
+        own_xy (tuple | np.ndarray): (x, y) position of the own UAV
+        others_xy (np.ndarray): (N,2) positions of the other UAVs
+        own_radius (float): radius (detection/nmac/collision) of the own UAV
+        other_radius (float | np.ndarray): radius of the other UAVs, scalar or one per UAV
+
+    Returns:
+        np.ndarray: (N,) bool array, True where the other UAV is an intruder
+    '''
+    others_xy = np.asarray(others_xy, dtype=float).reshape(-1, 2)
+    profiler.count('pairwise_checks', len(others_xy))
+    distance = np.hypot(others_xy[:, 0] - own_xy[0], others_xy[:, 1] - own_xy[1])
+    return distance <= own_radius + other_radius
+
+
+
+def closest_point_of_approach(dx, dy, dvx, dvy, lookahead):
+    '''Closest point of approach of UAV pairs flying straight at constant speed, within a look-ahead horizon.
+
+    With relative position d and relative velocity v the separation at time t is |d + v t|,
+    it is smallest at t = -d.v / |v|^2, clipped to [0, lookahead]. Pairs without relative motion keep their separation.
+
+    Args:
+        dx, dy (np.ndarray): (N,) position of the other UAV relative to the own UAV
+        dvx, dvy (np.ndarray): (N,) velocity of the other UAV relative to the own UAV
+        lookahead (float): horizon (s)
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (N,) time to CPA (s) and miss distance (m)
+    '''
+    speed_squared = dvx * dvx + dvy * dvy
+    t_cpa = -(dx * dvx + dy * dvy)
+    np.divide(t_cpa, speed_squared, out=t_cpa, where=speed_squared > 0)
+    t_cpa[speed_squared == 0] = 0.
+    np.clip(t_cpa, 0., lookahead, out=t_cpa)
+    miss_distance = np.hypot(dx + dvx * t_cpa, dy + dvy * t_cpa)
+    return t_cpa, miss_distance
+
+
+class NeighborIndex:
+    '''Broad phase neighbor index over a FleetState, built on a KD-tree.
+
+    The index is rebuilt once per sim step. Candidate pairs are collected once for the largest radius,
+    detection, nmac and collision neighbor sets are then filtered from those candidates with exact
+    circle-circle checks, so every radius is answered from the same index.
+    '''
+
+    radius_fields = {'detection':'detection_radius',
+                     'nmac':'nmac_radius',
+                     'collision':'collision_radius'}
+
+    def __init__(self, fleet_state):
+        self.fleet_state = fleet_state
+        self.rebuild()
+
+    def rebuild(self, active = None):
+        '''Rebuilds the KD-tree and the candidate pairs from the current fleet positions.
+
+        Args:
+            active (np.ndarray | None): (N,) bool, only pairs between active UAVs are indexed,
+                                        inactive UAVs have no neighbors (see ConflictHorizon)
+        '''
+        self.num_uavs = len(self.fleet_state)
+        self.xy = self.fleet_state.position
+        active_index = None if active is None else np.flatnonzero(active)
+        # fleet indices of the tree points, None when every UAV is indexed
+        self.active_index = active_index
+        self.tree = cKDTree(self.xy if active_index is None else self.xy[active_index])
+
+        max_radius = max([getattr(self.fleet_state, field)[:self.num_uavs].max(initial=0.) for field in self.radius_fields.values()])
+        self.candidate_distance = 2 * max_radius
+        candidate_pairs = self.tree.query_pairs(r=self.candidate_distance, output_type='ndarray')
+        if active_index is not None:
+            # back to fleet indices, active_index is ascending so pair_i < pair_j still holds
+            candidate_pairs = active_index[candidate_pairs]
+        self.pair_i = candidate_pairs[:, 0]
+        self.pair_j = candidate_pairs[:, 1]
+        self.pair_distance = np.hypot(self.xy[self.pair_j, 0] - self.xy[self.pair_i, 0],
+                                      self.xy[self.pair_j, 1] - self.xy[self.pair_i, 1])
+        profiler.count('pairwise_checks', len(self.pair_i))
+        self._neighbor_cache = {}
+
+    def _get_radius(self, radius_str) -> np.ndarray:
+        if radius_str not in self.radius_fields:
+            raise RuntimeError('Unknown radius string passed.')
+        return getattr(self.fleet_state, self.radius_fields[radius_str])[:self.num_uavs]
+
+    def pairs(self, radius_str = 'detection'):
+        '''Intersecting pairs for a radius string.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray, np.ndarray]: fleet indices i < j and the distance of each pair
+        '''
+        radius = self._get_radius(radius_str)
+        is_intruder = self.pair_distance <= radius[self.pair_i] + radius[self.pair_j]
+        return self.pair_i[is_intruder], self.pair_j[is_intruder], self.pair_distance[is_intruder]
+
+    def candidate_pairs(self, max_distance):
+        '''Pairs i < j of indexed UAVs at most max_distance apart, from the candidate pairs when they reach that far,
+        otherwise from a new query on the KD-tree.'''
+        if max_distance <= self.candidate_distance:
+            within = self.pair_distance <= max_distance
+            return self.pair_i[within], self.pair_j[within]
+        pairs = self.tree.query_pairs(r=max_distance, output_type='ndarray')
+        if self.active_index is not None:
+            pairs = self.active_index[pairs]
+        profiler.count('pairwise_checks', len(pairs))
+        return pairs[:, 0], pairs[:, 1]
+
+    def _neighbor_table(self, radius_str):
+        '''Internal method. Both directions of every pair, sorted by own index, distance and intruder index.
+        Returns (own, intruder, distance, offsets), neighbors of UAV i are entries offsets[i]:offsets[i+1].'''
+        if radius_str not in self._neighbor_cache:
+            pair_i, pair_j, pair_distance = self.pairs(radius_str)
+            own = np.concatenate((pair_i, pair_j))
+            intruder = np.concatenate((pair_j, pair_i))
+            distance = np.concatenate((pair_distance, pair_distance))
+            order = np.lexsort((intruder, distance, own))
+            own, intruder, distance = own[order], intruder[order], distance[order]
+            offsets = np.searchsorted(own, np.arange(self.num_uavs + 1))
+            self._neighbor_cache[radius_str] = (own, intruder, distance, offsets)
+        return self._neighbor_cache[radius_str]
+
+    def neighbors(self, fleet_index, radius_str = 'detection') -> np.ndarray:
+        '''Fleet indices of the intruders of one UAV, in ascending index order.'''
+        _, intruder, _, offsets = self._neighbor_table(radius_str)
+        return np.sort(intruder[offsets[fleet_index]:offsets[fleet_index + 1]])
+
+    def nearest(self, radius_str = 'detection'):
+        '''Nearest intruder of every UAV.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: fleet index of the nearest intruder (-1 where there is no intruder)
+                                           and its distance (inf where there is no intruder).
+                                           Ties go to the lower index, same as scanning the intruder list in order.
+        '''
+        _, intruder, distance, offsets = self._neighbor_table(radius_str)
+        has_intruder = offsets[1:] > offsets[:-1]
+        first = offsets[:-1][has_intruder]
+        nearest = np.full(self.num_uavs, -1, dtype=np.int64)
+        nearest_distance = np.full(self.num_uavs, np.inf)
+        nearest[has_intruder] = intruder[first]
+        nearest_distance[has_intruder] = distance[first]
+        return nearest, nearest_distance
+
+
+    def nearest_k(self, k, radius_str = 'detection') -> np.ndarray:
+        '''Fleet indices of the k nearest intruders of every UAV, read from the neighbor table of the current tick.
+
+        Returns:
+            np.ndarray: (num_uavs, k) fleet indices ordered by distance, padded with -1
+        '''
+        key = (radius_str, k)
+        if key not in self._neighbor_cache:
+            _, intruder, _, offsets = self._neighbor_table(radius_str)
+            # the table is sorted by own index and distance, the r-th nearest of UAV i is entry offsets[i] + r
+            entry = offsets[:-1, None] + np.arange(k)
+            has_rank = entry < offsets[1:, None]
+            if len(intruder) == 0:
+                nearest_k = np.full((self.num_uavs, k), -1, dtype=np.int64)
+            else:
+                nearest_k = np.where(has_rank, intruder.take(np.minimum(entry, len(intruder) - 1)), -1)
+            self._neighbor_cache[key] = nearest_k
+        return self._neighbor_cache[key]
+
+
+def fleet_das_inputs(fleet_state, airspace, neighbor_index:NeighborIndex, active = None):
+    '''
+    Static object mask and nearest intruder of every UAV, the inputs of the DAS controller.
+    Intruders are read from neighbor_index, which has to be rebuilt for the current fleet positions.
+    With an active mask buildings are only checked for the active UAVs, the others get no static object.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: static_mask and the fleet index of the nearest intruder (-1 where there is no intruder)
+    '''
+    with profiler.phase('building_intersection'):
+        position = fleet_state.position
+        detection_radius = fleet_state.detection_radius[:len(fleet_state)]
+        if active is None:
+            static_mask = airspace.query_obstacles_within(position, detection_radius)
+        else:
+            static_mask = np.zeros(len(fleet_state), dtype=bool)
+            static_mask[active] = airspace.query_obstacles_within(position[active], detection_radius[active])
+
+    with profiler.phase('intruder_detection'):
+        nearest, _ = neighbor_index.nearest('detection')
+
+    return static_mask, nearest
+
+
+def fleet_das_state(fleet_state, airspace, neighbor_index:NeighborIndex):
+    '''
+    Batched UAV_Basic.get_state for a whole fleet, in the argument order of Collision_controller.get_action_batch.
+    Intruders are read from neighbor_index, which has to be rebuilt for the current fleet positions.
+
+    Returns:
+        tuple: static_mask, own_heading_deg, intruder_rel_pos, intruder_heading_deg, intruder_mask
+    '''
+    position = fleet_state.position
+    own_heading_deg = fleet_state.heading_deg[:len(fleet_state)]
+    static_mask, nearest = fleet_das_inputs(fleet_state, airspace, neighbor_index)
+
+    with profiler.phase('intruder_detection'):
+        intruder_mask = nearest >= 0
+        intruder_rel_pos = np.where(intruder_mask[:, None], position[nearest] - position, 0.)
+        intruder_heading_deg = np.where(intruder_mask, own_heading_deg[nearest], 0.)
+
+    return static_mask, own_heading_deg, intruder_rel_pos, intruder_heading_deg, intruder_mask
+
+
+
+class InteractionCache:
+    '''
+    Per tick cache of the fleet interactions: neighbor index (pairwise distances of the candidate pairs) and,
+    on first use, the nearest intruder of every UAV, buildings within detection radius and the obstacle proximity
+    of UAVs outside the fleet (point_obstacles, e.g. the auto_uav).
+
+    The step loop calls update(tick) once the positions of the tick are final. Every later consumer of the same tick
+    (DAS inputs, UAV_Basic.step, env observation and reward) reads from the cache instead of redoing the geometry,
+    update with the tick that is already cached is a no-op. Headings and speeds are not cached, they are read from the fleet.
+    '''
+
+    def __init__(self, fleet_state, airspace, neighbor_index:NeighborIndex = None):
+        self.fleet_state = fleet_state
+        self.airspace = airspace
+        self.neighbor_index = neighbor_index if neighbor_index is not None else NeighborIndex(fleet_state)
+        self.clear()
+
+    def clear(self,):
+        '''Drops the cached tick, call after UAVs are moved other than by stepping (e.g. reset).'''
+        self.tick = None
+        self._point_obstacles = {}
+        self._conflicts = {}
+
+    def update(self, tick, active = None) -> bool:
+        '''
+        Builds the cache for the current fleet positions, unless tick is already cached.
+
+        Args:
+            tick (int): sim step the positions belong to
+            active (np.ndarray | None): (N,) bool, see NeighborIndex.rebuild and fleet_das_inputs
+
+        Returns:
+            bool: True when the cache was rebuilt
+        '''
+        if tick == self.tick:
+            profiler.count('interaction_cache_hits')
+            return False
+        with profiler.phase('intruder_detection'):
+            self.neighbor_index.rebuild(active)
+        self._active = active
+        self._das_inputs = None
+        self._point_obstacles = {}
+        self._conflicts = {}
+        self.tick = tick
+        return True
+
+    def _fleet_das_inputs(self,):
+        '''Internal method. (static_mask, nearest, nearest_distance) of the fleet, built on first use in the tick,
+        so a tick that only answers point queries (e.g. the observation after reset) skips the fleet wide building check.'''
+        if self._das_inputs is None:
+            static_mask, _ = fleet_das_inputs(self.fleet_state, self.airspace, self.neighbor_index, self._active)
+            nearest, nearest_distance = self.neighbor_index.nearest('detection')
+            self._das_inputs = (static_mask, nearest, nearest_distance)
+        return self._das_inputs
+
+    @property
+    def static_mask(self) -> np.ndarray:
+        '''(N,) bool, a hospital buffer within the detection radius of the UAV.'''
+        return self._fleet_das_inputs()[0]
+
+    @property
+    def nearest(self) -> np.ndarray:
+        '''(N,) fleet index of the nearest intruder within detection radius, -1 where there is no intruder.'''
+        return self._fleet_das_inputs()[1]
+
+    @property
+    def nearest_distance(self) -> np.ndarray:
+        '''(N,) distance to the nearest intruder, inf where there is no intruder.'''
+        return self._fleet_das_inputs()[2]
+
+    def point_obstacles(self, own_xy, own_radius):
+        '''
+        Obstacle proximity of a UAV that is not part of the fleet (e.g. the auto_uav), computed once per tick
+        and shared by its consumers (static object check, observation, reward).
+
+        Args:
+            own_xy (tuple | np.ndarray): (x, y) position of the own UAV
+            own_radius (float): radius checked against the hospital buffers
+
+        Returns:
+            tuple[bool, float, np.ndarray]: hospital buffer within own_radius, signed distance to the nearest buffer
+                                            and its (2,) gradient, see Airspace.obstacle_distance
+        '''
+        key = (float(own_xy[0]), float(own_xy[1]), float(own_radius))
+        if key not in self._point_obstacles:
+            xy = np.array([key[:2]])
+            intersects = bool(self.airspace.query_obstacles_within(xy, np.array([own_radius]))[0])
+            distance, gradient = self.airspace.obstacle_distance(xy)
+            self._point_obstacles[key] = (intersects, float(distance[0]), gradient[0])
+        return self._point_obstacles[key]
+
+    def predicted_conflicts(self, radius_str = 'nmac', lookahead = 30.):
+        '''
+        Pairs predicted to come within their nmac (or collision, detection) radii in the next lookahead seconds,
+        from the closest point of approach at the current speeds and headings. Cached for the tick.
+
+        The broad phase takes every pair that could close the gap in time: current distance at most
+        the sum of the largest radii plus lookahead times twice the largest speed.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: fleet indices i < j, time to CPA (s) and miss distance (m)
+        '''
+        key = (radius_str, lookahead)
+        if key not in self._conflicts:
+            with profiler.phase('conflict_prediction'):
+                fleet_state = self.fleet_state
+                n = len(fleet_state)
+                radius = self.neighbor_index._get_radius(radius_str)
+                speed = fleet_state.speed[:n]
+                reach = 2 * radius.max(initial=0.) + 2 * np.abs(speed).max(initial=0.) * lookahead
+                pair_i, pair_j = self.neighbor_index.candidate_pairs(reach)
+
+                # 1d gathers, much cheaper than indexing (N,2) arrays with pair indices
+                heading_rad = np.deg2rad(fleet_state.heading_deg[:n])
+                x, y = fleet_state.x[:n], fleet_state.y[:n]
+                vx, vy = speed * np.cos(heading_rad), speed * np.sin(heading_rad)
+                pair_i, pair_j = np.ascontiguousarray(pair_i), np.ascontiguousarray(pair_j)
+                t_cpa, miss_distance = closest_point_of_approach(x.take(pair_j) - x.take(pair_i), y.take(pair_j) - y.take(pair_i),
+                                                                 vx.take(pair_j) - vx.take(pair_i), vy.take(pair_j) - vy.take(pair_i),
+                                                                 lookahead)
+                profiler.count('cpa_pairs', len(pair_i))
+
+                conflict = miss_distance <= radius[pair_i] + radius[pair_j]
+                self._conflicts[key] = (pair_i[conflict], pair_j[conflict], t_cpa[conflict], miss_distance[conflict])
+        return self._conflicts[key]
+
+    def predicted_nearest(self, radius_str = 'nmac', lookahead = 30.):
+        '''
+        Most urgent predicted conflict of every UAV, in the form of nearest (an input of the DAS controllers).
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: fleet index of the intruder with the earliest CPA (-1 where there is none,
+                                           ties go to the lower index) and the time to that CPA (inf where there is none)
+        '''
+        pair_i, pair_j, t_cpa, _ = self.predicted_conflicts(radius_str, lookahead)
+        own = np.concatenate((pair_i, pair_j))
+        intruder = np.concatenate((pair_j, pair_i))
+        t_cpa = np.concatenate((t_cpa, t_cpa))
+        order = np.lexsort((intruder, t_cpa, own))
+        own, intruder, t_cpa = own[order], intruder[order], t_cpa[order]
+        first = np.ones(len(own), dtype=bool)
+        first[1:] = own[1:] != own[:-1]
+
+        n = len(self.fleet_state)
+        predicted = np.full(n, -1, dtype=np.int64)
+        predicted_t_cpa = np.full(n, np.inf)
+        predicted[own[first]] = intruder[first]
+        predicted_t_cpa[own[first]] = t_cpa[first]
+        return predicted, predicted_t_cpa
+
+    def das_state(self, fleet_index):
+        '''UAV_Basic.get_state of one UAV from the cache, (static_state, dynamic_state).'''
+        fleet_state = self.fleet_state
+        static_state = (bool(self.static_mask[fleet_index]), float(fleet_state.heading_deg[fleet_index]))
+        intruder = self.nearest[fleet_index]
+        if intruder < 0:
+            return static_state, None
+        dynamic_state = {'own_id':int(fleet_state.uav_id[fleet_index]),
+                         'own_pos':Point(fleet_state.x[fleet_index], fleet_state.y[fleet_index]),
+                         'own_current_heading':float(fleet_state.heading_deg[fleet_index]),
+                         'intruder_id':int(fleet_state.uav_id[intruder]),
+                         'intruder_pos':Point(fleet_state.x[intruder], fleet_state.y[intruder]),
+                         'intruder_current_heading':float(fleet_state.heading_deg[intruder])}
+        return static_state, dynamic_state
+
+    def point_neighbors(self, own_xy, own_radius, other_radius):
+        '''
+        UAVs of the fleet intersecting a UAV that is not part of it (e.g. the auto_uav), same check as intruder_mask,
+        answered from the cached KD-tree.
+
+        Args:
+            own_xy (tuple | np.ndarray): (x, y) position of the own UAV
+            own_radius (float): radius of the own UAV
+            other_radius (float): radius of the fleet UAVs
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: fleet indices ordered by distance (ties go to the lower index) and their distances
+        '''
+        fleet_state = self.fleet_state
+        if self.neighbor_index.active_index is None:
+            # slack on the tree radius, the exact check below decides
+            candidates = np.array(self.neighbor_index.tree.query_ball_point(own_xy, own_radius + other_radius + 1e-6), dtype=np.int64)
+        else:
+            # inactive UAVs are not in the tree
+            candidates = np.arange(len(fleet_state))
+        profiler.count('pairwise_checks', len(candidates))
+        distance = np.hypot(fleet_state.x[candidates] - own_xy[0], fleet_state.y[candidates] - own_xy[1])
+        is_intruder = distance <= own_radius + other_radius
+        candidates, distance = candidates[is_intruder], distance[is_intruder]
+        order = np.lexsort((candidates, distance))
+        return candidates[order], distance[order]
+
+
+class ConflictHorizon:
+    '''
+    Conflict-horizon scheduler, skips detection for UAVs that cannot have a conflict yet.
+
+    When a UAV is checked and has no building or intruder in its detection radius, a conservative earliest step
+    at which it could detect one is computed from its clearance to the nearest obstacle and the nearest other UAV,
+    and a bound on how fast that clearance can shrink. Until that step the UAV is inactive: it is left out of the
+    neighbor index and the building queries and its DAS action is zero, which is exactly what checking it would have given.
+
+    Bound on the distance a UAV can cover in k steps (speed changes by at most A per step):
+        k * |speed| + A * k * (k - 1) / 2
+    where A is the largest acceleration any controller can command in the fleet (speed controller,
+    landing deceleration and DAS table). A UAV-UAV gap shrinks by at most the sum of both UAVs' bounds,
+    the other UAV's speed is taken as the fleet maximum. Speed can overshoot max_speed by one step of
+    acceleration, so the bound uses the current speeds rather than 2 x max_speed.
+    Detection is done on the detection radius, which is the largest radius.
+    '''
+
+    def __init__(self, fleet_state, airspace, controller, neighbor_index:NeighborIndex = None, lookahead = 2000., max_horizon = 10000):
+        '''
+        Args:
+            fleet_state (FleetState): fleet to schedule
+            airspace (Airspace): source of the static obstacles
+            controller (Collision_controller | Zero_controller): DAS controller of the fleet, bounds the DAS acceleration
+            neighbor_index (NeighborIndex | None): its KD-tree is reused when every UAV was checked
+            lookahead (float): clearances are searched up to this distance (m) beyond the detection radii,
+                               larger values give longer skips for isolated UAVs at a higher query cost
+            max_horizon (int): longest skip in steps
+        '''
+        self.fleet_state = fleet_state
+        self.airspace = airspace
+        self.neighbor_index = neighbor_index
+        self.lookahead = lookahead
+        self.max_horizon = max_horizon
+        self.das_max_acceleration = float(np.abs(getattr(controller, 'acceleration_table', 0.)).max())
+        self.next_check = np.zeros(0, dtype=np.int64)
+
+    def reset(self,):
+        '''Checks every UAV at the next step, call after UAVs are moved other than by stepping (e.g. reset).'''
+        self.next_check = np.zeros(0, dtype=np.int64)
+
+    def due(self, step) -> np.ndarray:
+        '''(N,) bool, True for the UAVs that have to be checked at step. UAVs added since the last call are due.'''
+        n = len(self.fleet_state)
+        if len(self.next_check) != n:
+            next_check = np.zeros(n, dtype=np.int64)
+            m = min(n, len(self.next_check))
+            next_check[:m] = self.next_check[:m]
+            self.next_check = next_check
+        active = self.next_check <= step
+        profiler.count('horizon_skips', int(n - np.count_nonzero(active)))
+        return active
+
+    def max_acceleration(self,) -> float:
+        n = len(self.fleet_state)
+        max_speed = self.fleet_state.max_speed[:n]
+        return max(self.fleet_state.max_acceleration[:n].max(initial=0.),
+                   (max_speed**2 / (2*500)).max(initial=0.),
+                   self.das_max_acceleration)
+
+    @staticmethod
+    def safe_steps(clearance, speed, other_speed, acceleration, max_horizon) -> np.ndarray:
+        '''Largest k such that the clearance stays positive for steps 1..k,
+        when it shrinks by k * (speed + other_speed) + acceleration * k * (k - 1) at most.'''
+        def closing(k):
+            return k * (speed + other_speed) + acceleration * k * (k - 1)
+        b = speed + other_speed - acceleration
+        if acceleration > 0:
+            root = (-b + np.sqrt(b * b + 4 * acceleration * np.maximum(clearance, 0.))) / (2 * acceleration)
+        else:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                root = np.where(b > 0, clearance / b, np.inf)
+        k = np.floor(np.minimum(root, max_horizon))
+        # the root is exact up to rounding, step back where it lands on the boundary
+        k = np.where(closing(k) < clearance, k, k - 1)
+        return np.where(clearance > 0, np.maximum(k, 0), 0).astype(np.int64)
+
+    def update(self, step, active, static_mask, nearest):
+        '''Computes the next check step of the UAVs that were checked at step.
+        UAVs that detected a building or an intruder (static_mask, nearest from fleet_das_inputs) are checked again at the next step.'''
+        self.next_check[active] = step + 1
+        active_index = np.flatnonzero(active & ~static_mask & (nearest < 0))
+        if len(active_index) == 0:
+            return
+        fleet_state = self.fleet_state
+        n = len(fleet_state)
+        xy = fleet_state.position
+        speed = np.abs(fleet_state.speed[:n])
+        detection_radius = fleet_state.detection_radius[:n]
+        max_detection_radius = detection_radius.max()
+        acceleration = self.max_acceleration()
+
+        # nearest other UAV over the whole fleet, inactive UAVs included
+        search_radius = 2 * max_detection_radius + self.lookahead
+        if n > 1:
+            tree = self.neighbor_index.tree if self.neighbor_index is not None and active.all() else cKDTree(xy)
+            nearest_distance, _ = tree.query(xy[active_index], k=2, distance_upper_bound=search_radius)
+            nearest_distance = np.minimum(nearest_distance[:, 1], search_radius)
+        else:
+            nearest_distance = np.full(len(active_index), search_radius)
+        # small margin, so rounding in the positions can never turn the boundary case into a detection
+        uav_clearance = nearest_distance - detection_radius[active_index] - max_detection_radius - 1e-6
+        uav_steps = self.safe_steps(uav_clearance, speed[active_index], speed.max(), acceleration, self.max_horizon)
+
+        obstacle_clearance = self.airspace.obstacle_clearance(xy[active_index], max_detection_radius + self.lookahead)
+        obstacle_clearance = obstacle_clearance - detection_radius[active_index] - 1e-6
+        # a single UAV's bound, acceleration * k * (k - 1) / 2
+        obstacle_steps = self.safe_steps(obstacle_clearance, speed[active_index], 0., acceleration / 2, self.max_horizon)
+
+        self.next_check[active_index] = step + np.minimum(uav_steps, obstacle_steps) + 1
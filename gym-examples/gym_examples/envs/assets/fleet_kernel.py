@@ -0,0 +1,196 @@
+# Fused fleet step, DAS actions and integration in one loop over the fleet arrays, compiled with numba when it is installed
+import math
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def _quadrant(theta):
+    '''Scalar Collision_controller.get_quadrant_batch'''
+    if not (-180. <= theta <= 180.):
+        raise RuntimeError('DAS Error: Invalid heading')
+    if 0. <= theta < 90.:
+        return 1
+    elif theta >= 90.:
+        return 2
+    elif theta >= -90.:
+        return 3
+    return 4
+
+
+def _das_actions_loop(n, static_mask, nearest, x, y, heading_deg,
+                      static_heading_correction, heading_correction_table, acceleration_table,
+                      acceleration, heading_correction):
+    '''Collision_controller.get_action_batch for the first n UAVs, written into acceleration and heading_correction.'''
+    for i in range(n):
+        j = nearest[i]
+        acceleration[i] = 0.
+        heading_correction[i] = 0.
+        if static_mask[i]:
+            if j < 0:
+                heading_correction[i] = static_heading_correction
+        elif j >= 0:
+            del_x = x[j] - x[i]
+            del_y = y[j] - y[i]
+            if del_x == 0. or del_y == 0.:
+                raise RuntimeError('Action not from scenario')
+            if del_y > 0.:
+                rel_quadrant = 0 if del_x > 0. else 1
+            else:
+                rel_quadrant = 2 if del_x < 0. else 3
+            own_quadrant = _quadrant(heading_deg[i])
+            intruder_quadrant = _quadrant(heading_deg[j])
+            acceleration[i] = acceleration_table[rel_quadrant, own_quadrant, intruder_quadrant]
+            heading_correction[i] = heading_correction_table[rel_quadrant, own_quadrant, intruder_quadrant]
+
+
+def _integrate_loop(n, d_t, x, y, speed, max_speed, max_acceleration, heading_deg, ref_heading_deg, end_x, end_y,
+                    acceleration, heading_correction):
+    '''FleetState.step_all for the first n UAVs, one UAV at a time: position, speed, heading, reference heading.'''
+    for i in range(n):
+        # position - first order Euler's method, the speed controller sees the new position like in step_all
+        heading_rad = math.radians(heading_deg[i])
+        x[i] += speed[i] * math.cos(heading_rad) * d_t
+        y[i] += speed[i] * math.sin(heading_rad) * d_t
+
+        # speed
+        if acceleration[i] != 0.:
+            final_acc = acceleration[i]
+        elif speed[i] == 0.:
+            final_acc = max_acceleration[i]
+        elif math.hypot(end_x[i] - x[i], end_y[i] - y[i]) <= 500.:
+            final_acc = - (max_speed[i]**2 / (2*500))
+        elif speed[i] <= max_speed[i]:
+            final_acc = max_acceleration[i]
+        else:
+            final_acc = 0.
+        speed[i] += final_acc * d_t
+
+        # heading, same turn rates as fleet_state.heading_controller
+        heading_difference = (ref_heading_deg[i] - heading_deg[i] + 180.) % 360. - 180.
+        if heading_correction[i] != 0.:
+            heading_update = heading_correction[i]
+        elif abs(heading_difference) < 0.5:
+            heading_update = 0.
+        elif abs(heading_difference) < 20.:
+            heading_update = math.copysign(1., heading_difference)
+        else:
+            heading_update = math.copysign(20., heading_difference)
+        heading_deg[i] = (heading_deg[i] + heading_update + 180.) % 360. - 180.
+
+        # reference heading, pointed towards end point
+        ref_heading_deg[i] = math.degrees(math.atan2(end_y[i] - y[i], end_x[i] - x[i]))
+
+
+def _fleet_step_loop(n, d_t, static_mask, nearest, x, y, speed, max_speed, max_acceleration, heading_deg, ref_heading_deg, end_x, end_y,
+                     static_heading_correction, heading_correction_table, acceleration_table,
+                     acceleration, heading_correction):
+    '''Full UAV_Basic.step semantics for the fleet: DAS actions from the pre-step state, then integration.'''
+    _das_actions_loop(n, static_mask, nearest, x, y, heading_deg,
+                      static_heading_correction, heading_correction_table, acceleration_table,
+                      acceleration, heading_correction)
+    _integrate_loop(n, d_t, x, y, speed, max_speed, max_acceleration, heading_deg, ref_heading_deg, end_x, end_y,
+                    acceleration, heading_correction)
+
+
+if numba is not None:
+    # the helpers are compiled first, so the jitted loops call the compiled versions
+    _quadrant = numba.njit(cache=True, nogil=True)(_quadrant)
+    _das_actions_loop = numba.njit(cache=True, nogil=True)(_das_actions_loop)
+    _integrate_loop = numba.njit(cache=True, nogil=True)(_integrate_loop)
+    _fleet_step_loop = numba.njit(cache=True, nogil=True)(_fleet_step_loop)
+
+JIT_AVAILABLE = numba is not None
+
+
+class FleetKernel:
+    '''
+    Steps a FleetState with the actions of a DAS controller.
+
+    With numba installed (and a controller with quadrant lookup tables, e.g. Collision_controller)
+    the DAS actions and the integration run in one compiled loop over the fleet arrays, no temporary arrays
+    are allocated. Otherwise the NumPy path is used: controller.get_action_batch and FleetState.step_all.
+    Both paths produce the same fleet state.
+
+    Inputs are the per-UAV static object mask and the fleet index of the nearest intruder (-1 where there is none),
+    see detection.fleet_das_inputs.
+    '''
+
+    def __init__(self, fleet_state, controller, use_jit = None):
+        '''
+        Args:
+            fleet_state (FleetState): fleet to step
+            controller (Collision_controller | Zero_controller): DAS controller of the fleet
+            use_jit (bool | None): None uses the compiled loop when available, False forces the NumPy path,
+                                   True raises when the compiled loop cannot be used
+        '''
+        has_tables = hasattr(controller, 'heading_correction_table')
+        if use_jit and not JIT_AVAILABLE:
+            raise RuntimeError('Compiled fleet kernel needs numba')
+        if use_jit and not has_tables:
+            raise RuntimeError(f'Compiled fleet kernel needs a controller with quadrant tables, got {type(controller).__name__}')
+
+        self.fleet_state = fleet_state
+        self.controller = controller
+        self.use_jit = JIT_AVAILABLE and has_tables if use_jit is None else use_jit
+        self.acceleration = np.zeros(0)
+        self.heading_correction = np.zeros(0)
+
+    def _action_buffers(self, n):
+        '''Internal method. Action arrays of length n, reused from step to step.'''
+        if len(self.acceleration) < n:
+            self.acceleration = np.zeros(max(n, 2 * len(self.acceleration)))
+            self.heading_correction = np.zeros(len(self.acceleration))
+        return self.acceleration[:n], self.heading_correction[:n]
+
+    def actions(self, static_mask, nearest):
+        '''DAS acceleration and heading correction of every UAV, from the current fleet state.'''
+        fleet_state = self.fleet_state
+        n = len(fleet_state)
+        if not self.use_jit:
+            position = fleet_state.position
+            heading_deg = fleet_state.heading_deg[:n]
+            intruder_mask = nearest >= 0
+            intruder_rel_pos = np.where(intruder_mask[:, None], position[nearest] - position, 0.)
+            intruder_heading_deg = np.where(intruder_mask, heading_deg[nearest], 0.)
+            return self.controller.get_action_batch(static_mask, heading_deg, intruder_rel_pos, intruder_heading_deg, intruder_mask)
+
+        acceleration, heading_correction = self._action_buffers(n)
+        _das_actions_loop(n, np.asarray(static_mask, dtype=bool), np.asarray(nearest, dtype=np.int64),
+                          fleet_state.x, fleet_state.y, fleet_state.heading_deg,
+                          float(self.controller.static_heading_correction),
+                          self.controller.heading_correction_table, self.controller.acceleration_table,
+                          acceleration, heading_correction)
+        return acceleration, heading_correction
+
+    def integrate(self, d_t, acceleration, heading_correction):
+        '''Advances the fleet by d_t seconds with the given actions, same as FleetState.step_all.'''
+        fleet_state = self.fleet_state
+        if not self.use_jit:
+            fleet_state.step_all(d_t=d_t, acceleration=acceleration, heading_correction=heading_correction)
+            return
+        _integrate_loop(len(fleet_state), float(d_t), fleet_state.x, fleet_state.y, fleet_state.speed,
+                        fleet_state.max_speed, fleet_state.max_acceleration,
+                        fleet_state.heading_deg, fleet_state.ref_heading_deg, fleet_state.end_x, fleet_state.end_y,
+                        np.asarray(acceleration, dtype=np.float64), np.asarray(heading_correction, dtype=np.float64))
+
+    def step(self, d_t, static_mask, nearest):
+        '''DAS actions and integration in one pass. Returns the acceleration and heading correction that were applied.'''
+        if not self.use_jit:
+            acceleration, heading_correction = self.actions(static_mask, nearest)
+            self.integrate(d_t, acceleration, heading_correction)
+            return acceleration, heading_correction
+
+        fleet_state = self.fleet_state
+        n = len(fleet_state)
+        acceleration, heading_correction = self._action_buffers(n)
+        _fleet_step_loop(n, float(d_t), np.asarray(static_mask, dtype=bool), np.asarray(nearest, dtype=np.int64),
+                         fleet_state.x, fleet_state.y, fleet_state.speed, fleet_state.max_speed, fleet_state.max_acceleration,
+                         fleet_state.heading_deg, fleet_state.ref_heading_deg, fleet_state.end_x, fleet_state.end_y,
+                         float(self.controller.static_heading_correction),
+                         self.controller.heading_correction_table, self.controller.acceleration_table,
+                         acceleration, heading_correction)
+        return acceleration, heading_correction
@@ -0,0 +1,179 @@
+# Struct-of-arrays state of all UAV_Basic in the airspace, the fleet is stepped with array operations
+import numpy as np
+
+
+def wrap_heading_deg(heading_deg):
+    '''Wraps headings (degree) to [-180, 180)'''
+    return (heading_deg + 180.) % 360. - 180.
+
+
+def heading_controller(heading_deg, ref_heading_deg, heading_correction = None):
+    '''Batched turn-rate controller, turns every UAV towards its reference heading.
+
+    The turn direction comes from the wrapped heading difference, so UAVs always take the shorter turn.
+    Turn rate is 20 degree/s, 1 degree/s when within 20 degree of the reference heading
+    and 0 within 0.5 degree. Non zero DAS heading corrections over-ride the controller.
+
+    Args:
+        heading_deg (np.ndarray | float): current headings
+        ref_heading_deg (np.ndarray | float): reference (final) headings
+        heading_correction (np.ndarray | float | None): heading correction from controller/das_system
+
+    Returns:
+        np.ndarray: updated headings, wrapped to [-180, 180)
+    '''
+    heading_difference = wrap_heading_deg(ref_heading_deg - heading_deg)
+    abs_heading_difference = np.abs(heading_difference)
+    rate_of_turn = np.where(abs_heading_difference < 20, 1., 20.) #degree/s, Airbus H175
+    rate_of_turn = np.where(abs_heading_difference < 0.5, 0., rate_of_turn)
+    heading_update = np.sign(heading_difference) * rate_of_turn
+
+    if heading_correction is not None:
+        heading_update = np.where(heading_correction != 0, heading_correction, heading_update)
+
+    return wrap_heading_deg(heading_deg + heading_update)
+
+
+class FleetState:
+    '''Contiguous numpy arrays holding the state of a fleet of UAVs.
+
+    Every UAV owns one slot (fleet_index) in the arrays, UAV_Basic objects read and write their
+    position, speed, heading, radii and start/end points through views into that slot.
+    Only the first num_uavs entries of each array are in use, the arrays grow when capacity is reached.
+    '''
+
+    float_fields = ('x', 'y',
+                    'speed', 'max_speed', 'max_acceleration',
+                    'heading_deg', 'ref_heading_deg',
+                    'footprint', 'nmac_radius', 'detection_radius', 'collision_radius',
+                    'landing_proximity',
+                    'start_x', 'start_y', 'end_x', 'end_y')
+    
+    # vertiport event flags, read by ATC.vertiport_events
+    bool_fields = ('leaving_start_vertiport', 'reaching_end_vertiport')
+
+    # start and end vertiport index in ATC.vertiports_in_airspace, -1 when unknown, kept by the ATC for the recorder
+    int_fields = ('start_vertiport', 'end_vertiport')
+
+    def __init__(self, capacity = 64):
+        self.num_uavs = 0
+        self.capacity = capacity
+        self.uav_id = np.zeros(capacity, dtype=np.int64)
+        for field in self.float_fields:
+            setattr(self, field, np.zeros(capacity, dtype=np.float64))
+        for field in self.bool_fields:
+            setattr(self, field, np.zeros(capacity, dtype=bool))
+        for field in self.int_fields:
+            setattr(self, field, np.full(capacity, -1, dtype=np.int32))
+
+    def __len__(self,):
+        return self.num_uavs
+
+    def _grow(self,):
+        '''Internal method. Doubles the capacity of all arrays, existing slots keep their index.'''
+        new_capacity = max(1, 2 * self.capacity)
+        for field in ('uav_id',) + self.float_fields + self.bool_fields + self.int_fields:
+            old_array = getattr(self, field)
+            new_array = np.full(new_capacity, -1 if field in self.int_fields else 0, dtype=old_array.dtype)
+            new_array[:self.capacity] = old_array
+            setattr(self, field, new_array)
+        self.capacity = new_capacity
+
+    def add_uav(self, uav_id) -> int:
+        '''Reserves a slot for a UAV and returns its fleet_index.'''
+        if self.num_uavs == self.capacity:
+            self._grow()
+        fleet_index = self.num_uavs
+        self.uav_id[fleet_index] = uav_id
+        for field in self.int_fields:
+            getattr(self, field)[fleet_index] = -1
+        self.num_uavs += 1
+        return fleet_index
+
+    def clear(self,):
+        '''Releases all slots, the arrays are kept and reused by the next add_uav calls.'''
+        self.num_uavs = 0
+
+    def reset_slots(self, start_xy, end_xy, rng = np.random):
+        '''Resets the first len(start_xy) slots to UAVs parked at their start points, 
+        with zero speed, a random heading (drawn from rng) and the reference heading pointed towards the end points.
+        Radii and speed limits are kept, vertiport event flags are cleared.'''
+        n = len(start_xy)
+        self.start_x[:n], self.start_y[:n] = start_xy[:, 0], start_xy[:, 1]
+        self.end_x[:n], self.end_y[:n] = end_xy[:, 0], end_xy[:, 1]
+        self.x[:n], self.y[:n] = start_xy[:, 0], start_xy[:, 1]
+        self.speed[:n] = 0
+        self.heading_deg[:n] = rng.uniform(-178, 178, n) # random heading between -180 and 180
+        self.ref_heading_deg[:n] = np.rad2deg(np.arctan2(end_xy[:, 1] - start_xy[:, 1], end_xy[:, 0] - start_xy[:, 0]))
+        self.leaving_start_vertiport[:n] = False
+        self.reaching_end_vertiport[:n] = False
+
+    @property
+    def position(self,) -> np.ndarray:
+        '''(num_uavs, 2) array of UAV positions'''
+        return np.column_stack((self.x[:self.num_uavs], self.y[:self.num_uavs]))
+
+    def acceleration_controller(self,) -> np.ndarray:
+        '''Vectorized UAV_Basic.acceleration_controller for the whole fleet.'''
+        n = self.num_uavs
+        speed = self.speed[:n]
+        max_speed = self.max_speed[:n]
+        max_acceleration = self.max_acceleration[:n]
+        distance_to_end = np.hypot(self.end_x[:n] - self.x[:n], self.end_y[:n] - self.y[:n])
+
+        acc = np.where(speed <= max_speed, max_acceleration, 0.)
+        acc = np.where(distance_to_end <= 500, - (max_speed**2 / (2*500)), acc)
+        acc = np.where(speed == 0, max_acceleration, acc)
+        return acc
+
+    def step_all(self, d_t, acceleration = None, heading_correction = None):
+        '''Advances the whole fleet by d_t seconds, same update order as UAV_Basic.step:
+        position, speed, heading, reference heading.
+
+        Args:
+            d_t (float): time step
+            acceleration (np.ndarray | None): acceleration from controller/das_system, one per UAV,
+                                              non zero values over-ride the speed controller
+            heading_correction (np.ndarray | None): heading correction from controller/das_system, one per UAV
+        '''
+        n = self.num_uavs
+        x, y = self.x[:n], self.y[:n]
+        speed = self.speed[:n]
+        heading_deg = self.heading_deg[:n]
+        ref_heading_deg = self.ref_heading_deg[:n]
+
+        # position - first order Euler's method
+        heading_rad = np.deg2rad(heading_deg)
+        x += speed * np.cos(heading_rad) * d_t
+        y += speed * np.sin(heading_rad) * d_t
+
+        # speed
+        final_acc = self.acceleration_controller()
+        if acceleration is not None:
+            acceleration = np.asarray(acceleration, dtype=np.float64)
+            final_acc = np.where(acceleration != 0, acceleration, final_acc)
+        speed += final_acc * d_t
+
+        # heading
+        if heading_correction is not None:
+            heading_correction = np.asarray(heading_correction, dtype=np.float64)
+        heading_deg[:] = heading_controller(heading_deg, ref_heading_deg, heading_correction)
+
+        # reference heading, pointed towards end point
+        ref_heading_deg[:] = np.rad2deg(np.arctan2(self.end_y[:n] - y, self.end_x[:n] - x))
+
+
+class FleetField:
+    '''Descriptor, exposes one slot of a FleetState array as a float (or bool, with cast=bool) attribute of a UAV.'''
+
+    def __init__(self, field:str, cast = float):
+        self.field = field
+        self.cast = cast
+
+    def __get__(self, uav, owner = None):
+        if uav is None:
+            return self
+        return self.cast(getattr(uav.fleet_state, self.field)[uav.fleet_index])
+
+    def __set__(self, uav, value):
+        getattr(uav.fleet_state, self.field)[uav.fleet_index] = value
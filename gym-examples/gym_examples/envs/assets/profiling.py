@@ -0,0 +1,154 @@
+# Per-phase timers and event counters for the sim step, aggregated per step, per episode and per run
+import os
+import json
+import time
+from contextlib import nullcontext
+
+
+_NULL_PHASE = nullcontext()
+
+
+class _Phase:
+    '''Times one block and adds the elapsed time to the profiler's current step.'''
+
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self,):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        phase_s = self.profiler.step_phase_s
+        phase_s[self.name] = phase_s.get(self.name, 0.) + time.perf_counter() - self.start
+
+
+class StepProfiler:
+    '''
+    Named phase timers and counters.
+
+    Instrumented code calls
+
+        with profiler.phase('controller'):
+            ...
+        profiler.count('pairwise_checks', n)
+
+    and the owner of the step loop calls end_step() once per step and end_episode() on reset.
+    When disabled phase() returns a shared no-op context manager and count() returns immediately,
+    so the instrumentation can stay in the hot path. Phases can nest, the time of an inner phase
+    is then also part of the outer phase.
+
+    Stats are dicts {'steps': int, 'phase_s': {phase: seconds}, 'counters': {counter: int}}.
+    '''
+
+    def __init__(self, enabled = False, jsonl_path = None):
+        self.enabled = False
+        self.jsonl_file = None
+        self.total = self._new_stats()
+        self.episode = self._new_stats()
+        self.last_step = self._new_stats()
+        self.last_episode = None
+        self.num_episodes = 0
+        self._reset_step()
+        if enabled:
+            self.enable(jsonl_path)
+
+    @staticmethod
+    def _new_stats():
+        return {'steps':0, 'phase_s':{}, 'counters':{}}
+
+    def _reset_step(self,):
+        self.step_phase_s = {}
+        self.step_counters = {}
+
+    def enable(self, jsonl_path = None):
+        '''Starts profiling. With jsonl_path every step and episode is appended to that file as one JSON line.'''
+        self.enabled = True
+        if jsonl_path is not None:
+            if self.jsonl_file is not None:
+                self.jsonl_file.close()
+            self.jsonl_file = open(jsonl_path, 'a')
+
+    def disable(self,):
+        self.enabled = False
+        if self.jsonl_file is not None:
+            self.jsonl_file.close()
+            self.jsonl_file = None
+
+    def phase(self, name):
+        if not self.enabled:
+            return _NULL_PHASE
+        return _Phase(self, name)
+
+    def count(self, name, n = 1):
+        if not self.enabled:
+            return
+        self.step_counters[name] = self.step_counters.get(name, 0) + n
+
+    @staticmethod
+    def _accumulate(stats, phase_s, counters, steps):
+        stats['steps'] += steps
+        for name, seconds in phase_s.items():
+            stats['phase_s'][name] = stats['phase_s'].get(name, 0.) + seconds
+        for name, n in counters.items():
+            stats['counters'][name] = stats['counters'].get(name, 0) + n
+
+    def end_step(self,) -> dict:
+        '''Closes the current step, adds it to the episode and run totals and returns its stats.'''
+        if not self.enabled:
+            return None
+        self.last_step = {'steps':1, 'phase_s':self.step_phase_s, 'counters':self.step_counters}
+        self._accumulate(self.episode, self.step_phase_s, self.step_counters, 1)
+        self._accumulate(self.total, self.step_phase_s, self.step_counters, 1)
+        self._write_jsonl('step', self.last_step)
+        self._reset_step()
+        return self.last_step
+
+    def end_episode(self,) -> dict:
+        '''Closes the current episode and returns its stats, an episode without steps is not recorded.'''
+        if not self.enabled or self.episode['steps'] == 0:
+            return self.last_episode
+        self.last_episode = self.episode
+        self.num_episodes += 1
+        self._write_jsonl('episode', self.last_episode)
+        self.episode = self._new_stats()
+        return self.last_episode
+
+    def info(self,) -> dict:
+        '''Stats for the gymnasium info dict: the last step and the running episode.'''
+        if not self.enabled:
+            return {}
+        return {'step':self.last_step, 'episode':self.episode}
+
+    def _write_jsonl(self, kind, stats):
+        if self.jsonl_file is None:
+            return
+        self.jsonl_file.write(json.dumps({'kind':kind, 'time':time.time(), 'episode':self.num_episodes, **stats}) + '\n')
+        self.jsonl_file.flush()
+
+    def write_prometheus(self, path, prefix = 'uam'):
+        '''Writes the run totals in the Prometheus text exposition format, e.g. for the node exporter textfile collector.'''
+        lines = [f'# HELP {prefix}_steps_total Simulation steps profiled.',
+                 f'# TYPE {prefix}_steps_total counter',
+                 f'{prefix}_steps_total {self.total["steps"]}',
+                 f'# HELP {prefix}_episodes_total Episodes profiled.',
+                 f'# TYPE {prefix}_episodes_total counter',
+                 f'{prefix}_episodes_total {self.num_episodes}',
+                 f'# HELP {prefix}_phase_seconds_total Time spent in each phase of the step.',
+                 f'# TYPE {prefix}_phase_seconds_total counter']
+        lines += [f'{prefix}_phase_seconds_total{{phase="{name}"}} {seconds:.9f}' for name, seconds in sorted(self.total['phase_s'].items())]
+        lines += [f'# HELP {prefix}_events_total Counted events (geometry constructions, pairwise checks, ATC reassignments).',
+                  f'# TYPE {prefix}_events_total counter']
+        lines += [f'{prefix}_events_total{{counter="{name}"}} {n}' for name, n in sorted(self.total['counters'].items())]
+
+        # written next to the target and renamed, so a scraper never reads a partial file
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as prometheus_file:
+            prometheus_file.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, path)
+
+
+# profiler shared by the simulators, the env and the UAV/ATC code, disabled by default
+profiler = StepProfiler()
@@ -0,0 +1,243 @@
+# Columnar trajectory recorder, per-step fleet state is buffered in preallocated chunks and flushed to disk
+import os
+import json
+import queue
+import threading
+import numpy as np
+import shapely
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+MEMMAP_META_FILE = 'meta.json'
+
+
+class TrajectoryRecorder:
+    '''
+    Records the fleet state of every sim step, one row per (step, UAV).
+
+    Rows are written into preallocated chunk buffers, full chunks are flushed as
+    a row group of a Parquet file (backend='parquet') or appended to one raw binary file per
+    column (backend='memmap', read back with numpy.memmap by replay.py).
+    With background_thread=True chunks are written by a writer thread, the sim only blocks
+    when all chunk buffers are waiting to be written, so memory stays bounded at num_buffers chunks.
+
+    Columns:
+        step, uav_id, x, y, speed, heading_deg, ref_heading_deg,
+        start_vertiport, end_vertiport (index in ATC.vertiports_in_airspace, -1 when unknown),
+        intruder_id (max_intruders nearest intruder uav ids, padded with -1),
+        acceleration, heading_correction (controller action)
+    '''
+
+    def __init__(self, path, backend = 'memmap', chunk_rows = 2**16, max_intruders = 4, background_thread = False, num_buffers = 2, metadata = None):
+        '''
+        Args:
+            path (str): output directory (memmap) or file (parquet)
+            backend (str): 'memmap' or 'parquet'
+            chunk_rows (int): rows per chunk buffer
+            max_intruders (int): number of intruder ids stored per row
+            background_thread (bool): flush chunks from a writer thread
+            num_buffers (int): chunk buffers in rotation when background_thread is True
+            metadata (dict | None): json serializable run information stored with the recording, see simulation_metadata
+        '''
+        if backend not in ('memmap', 'parquet'):
+            raise RuntimeError(f'Unknown recorder backend {backend}')
+        if backend == 'parquet' and pq is None:
+            raise RuntimeError('parquet backend needs pyarrow')
+
+        self.path = path
+        self.backend = backend
+        self.chunk_rows = chunk_rows
+        self.max_intruders = max_intruders
+        self.metadata = dict(metadata) if metadata is not None else {}
+        self.columns = {'step':(np.int64, ()),
+                        'uav_id':(np.int64, ()),
+                        'x':(np.float64, ()),
+                        'y':(np.float64, ()),
+                        'speed':(np.float64, ()),
+                        'heading_deg':(np.float64, ()),
+                        'ref_heading_deg':(np.float64, ()),
+                        'start_vertiport':(np.int32, ()),
+                        'end_vertiport':(np.int32, ()),
+                        'intruder_id':(np.int64, (max_intruders,)),
+                        'acceleration':(np.float64, ()),
+                        'heading_correction':(np.float64, ())}
+
+        self.num_rows = 0
+        self.step_offsets = [0]
+        self.closed = False
+        self._parquet_writer = None
+        self._column_files = None
+        if backend == 'memmap':
+            os.makedirs(path, exist_ok=True)
+            self._column_files = {name:open(os.path.join(path, f'{name}.bin'), 'wb') for name in self.columns}
+
+        self.buffer = self._new_buffer(chunk_rows)
+        self.buffer_rows = 0
+
+        self.background_thread = background_thread
+        if background_thread:
+            self._free_buffers = queue.Queue()
+            for _ in range(num_buffers - 1):
+                self._free_buffers.put(self._new_buffer(chunk_rows))
+            self._pending_chunks = queue.Queue()
+            self._writer_error = None
+            self._writer = threading.Thread(target=self._writer_loop, daemon=True)
+            self._writer.start()
+
+    def __enter__(self,):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _new_buffer(self, num_rows):
+        return {name:np.empty((num_rows,) + shape, dtype=dtype) for name, (dtype, shape) in self.columns.items()}
+
+    def record_step(self, step, fleet_state, neighbor_index = None, acceleration = None, heading_correction = None, start_vertiport = None, end_vertiport = None):
+        '''
+        Appends one row per UAV in fleet_state.
+
+        Args:
+            step (int): sim step
+            fleet_state (FleetState): fleet to record
+            neighbor_index (NeighborIndex | None): index rebuilt for the current positions, source of the intruder ids
+            acceleration (np.ndarray | None): controller acceleration of each UAV
+            heading_correction (np.ndarray | None): controller heading correction of each UAV
+            start_vertiport (np.ndarray | None): start vertiport index of each UAV, fleet_state.start_vertiport when None
+            end_vertiport (np.ndarray | None): end vertiport index of each UAV, fleet_state.end_vertiport when None
+        '''
+        if self.closed:
+            raise RuntimeError('Recorder is closed')
+
+        n = len(fleet_state)
+        if self.buffer_rows + n > len(self.buffer['step']):
+            self._flush()
+        if n > len(self.buffer['step']):
+            self.buffer = self._new_buffer(n)
+
+        rows = slice(self.buffer_rows, self.buffer_rows + n)
+        buffer = self.buffer
+        buffer['step'][rows] = step
+        buffer['uav_id'][rows] = fleet_state.uav_id[:n]
+        buffer['x'][rows] = fleet_state.x[:n]
+        buffer['y'][rows] = fleet_state.y[:n]
+        buffer['speed'][rows] = fleet_state.speed[:n]
+        buffer['heading_deg'][rows] = fleet_state.heading_deg[:n]
+        buffer['ref_heading_deg'][rows] = fleet_state.ref_heading_deg[:n]
+        buffer['start_vertiport'][rows] = fleet_state.start_vertiport[:n] if start_vertiport is None else start_vertiport
+        buffer['end_vertiport'][rows] = fleet_state.end_vertiport[:n] if end_vertiport is None else end_vertiport
+        buffer['acceleration'][rows] = 0. if acceleration is None else acceleration
+        buffer['heading_correction'][rows] = 0. if heading_correction is None else heading_correction
+
+        if neighbor_index is None:
+            buffer['intruder_id'][rows] = -1
+        else:
+            nearest_k = neighbor_index.nearest_k(self.max_intruders)
+            intruder_id = buffer['intruder_id'][rows]
+            np.take(fleet_state.uav_id, nearest_k, out=intruder_id)
+            intruder_id[nearest_k < 0] = -1
+
+        self.buffer_rows += n
+        self.num_rows += n
+        self.step_offsets.append(self.num_rows)
+
+    def _flush(self,):
+        '''Internal method. Hands the filled part of the chunk buffer to the writer.'''
+        if self.buffer_rows == 0:
+            return
+        if self.background_thread:
+            if self._writer_error is not None:
+                raise RuntimeError('Recorder writer thread failed') from self._writer_error
+            self._pending_chunks.put((self.buffer, self.buffer_rows))
+            self.buffer = self._free_buffers.get()
+        else:
+            self._write_chunk(self.buffer, self.buffer_rows)
+        self.buffer_rows = 0
+
+    def _writer_loop(self,):
+        while True:
+            chunk = self._pending_chunks.get()
+            if chunk is None:
+                return
+            buffer, num_rows = chunk
+            try:
+                self._write_chunk(buffer, num_rows)
+            except Exception as error:
+                self._writer_error = error
+            self._free_buffers.put(buffer)
+
+    def _write_chunk(self, buffer, num_rows):
+        if self.backend == 'memmap':
+            for name, column_file in self._column_files.items():
+                buffer[name][:num_rows].tofile(column_file)
+            return
+
+        arrays = {}
+        for name, column in buffer.items():
+            column = column[:num_rows]
+            if column.ndim == 2:
+                arrays[name] = pa.FixedSizeListArray.from_arrays(pa.array(column.ravel()), column.shape[1])
+            else:
+                arrays[name] = pa.array(column)
+        table = pa.table(arrays)
+        if self._parquet_writer is None:
+            self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+        self._parquet_writer.write_table(table)
+
+    def close(self,):
+        '''Flushes the last chunk, waits for the writer thread and finalizes the files.'''
+        if self.closed:
+            return
+        self._flush()
+        if self.background_thread:
+            self._pending_chunks.put(None)
+            self._writer.join()
+            if self._writer_error is not None:
+                raise RuntimeError('Recorder writer thread failed') from self._writer_error
+        self.closed = True
+
+        if self.backend == 'parquet':
+            if self._parquet_writer is not None:
+                self._parquet_writer.add_key_value_metadata({'uam_metadata':json.dumps(self.metadata)})
+                self._parquet_writer.close()
+            return
+
+        for column_file in self._column_files.values():
+            column_file.close()
+        np.asarray(self.step_offsets, dtype=np.int64).tofile(os.path.join(self.path, 'step_offsets.bin'))
+        with open(os.path.join(self.path, MEMMAP_META_FILE), 'w') as meta_file:
+            json.dump({'num_rows':self.num_rows,
+                       'num_steps':len(self.step_offsets) - 1,
+                       'metadata':self.metadata,
+                       'columns':{name:{'dtype':np.dtype(dtype).str, 'shape':list(shape)} for name, (dtype, shape) in self.columns.items()}},
+                      meta_file, indent=2)
+
+
+def airspace_geometry(airspace) -> dict:
+    '''Boundary, hospital and hospital buffer geometry of an airspace as hex WKB with the CRS,
+    so a recording can be drawn without geocoding the location again (see replay.RecordedAirspace).'''
+    crs = airspace.location_utm_gdf.crs
+    return {'crs':None if crs is None else crs.to_string(),
+            'location':shapely.to_wkb(np.asarray(airspace.location_utm_gdf.geometry), hex=True).tolist(),
+            'hospital':shapely.to_wkb(np.asarray(airspace.location_utm_hospital.geometry), hex=True).tolist(),
+            'hospital_buffer':shapely.to_wkb(np.asarray(airspace.location_utm_hospital_buffer), hex=True).tolist()}
+
+
+def simulation_metadata(atc) -> dict:
+    '''Run information needed to replay a recording: the airspace arguments and geometry, vertiport locations and UAV radii.'''
+    airspace = atc.airspace
+    n = len(atc.fleet_state)
+    return {'location_name':airspace.location_name,
+            'buffer_radius':airspace.buffer_radius,
+            'tags':airspace.tags,
+            'airspace_geometry':airspace_geometry(airspace),
+            'vertiport_xy':atc.vertiport_xy.tolist(),
+            'footprint':float(atc.fleet_state.footprint[:n].max(initial=0.)),
+            'nmac_radius':float(atc.fleet_state.nmac_radius[:n].max(initial=0.)),
+            'detection_radius':float(atc.fleet_state.detection_radius[:n].max(initial=0.))}
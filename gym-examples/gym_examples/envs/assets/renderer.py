@@ -0,0 +1,75 @@
+# Persistent-artist renderer, static layers are drawn once and UAVs are blitted on top every frame
+import numpy as np
+from matplotlib.collections import EllipseCollection
+
+
+class Renderer:
+    '''
+    Renders the airspace with blitting.
+
+    The city boundary, hospitals and vertiports are drawn once by static_plot and cached as a background.
+    UAV footprints, nmac radii and detection radii are three EllipseCollections (one ellipse per UAV),
+    every frame only their offsets, sizes and colors are updated in place and blitted over the background.
+    '''
+
+    def __init__(self, fig, ax, static_plot, sim, gpd):
+        self.fig = fig
+        self.ax = ax
+
+        ax.cla()
+        static_plot(sim, ax, gpd)
+
+        # footprint, nmac radius, detection radius
+        self.uav_collections = []
+        for _ in range(3):
+            collection = EllipseCollection(widths=np.zeros(0), heights=np.zeros(0), angles=np.zeros(0),
+                                           units='xy', offsets=np.zeros((0, 2)),
+                                           offset_transform=ax.transData, alpha=0.3, animated=True)
+            ax.add_collection(collection, autolim=False)
+            self.uav_collections.append(collection)
+
+        self.uav_colors = None
+        self.background = None
+        self._draw_event_id = fig.canvas.mpl_connect('draw_event', self._on_draw)
+        fig.canvas.draw()
+
+    def _on_draw(self, event):
+        '''Internal method. Recaptures the background whenever the full figure is redrawn (first draw, resize, zoom).'''
+        self.background = self.fig.canvas.copy_from_bbox(self.ax.bbox)
+        self._draw_animated()
+
+    def _draw_animated(self,):
+        for collection in self.uav_collections:
+            self.ax.draw_artist(collection)
+
+    def draw_uavs(self, xy, radii, colors):
+        '''
+        Draws one frame.
+
+        Args:
+            xy (np.ndarray): (N,2) UAV positions
+            radii (tuple[np.ndarray, np.ndarray, np.ndarray]): footprint, nmac and detection radius of each UAV
+            colors (tuple): footprint, nmac and detection colors, each a single color or one color per UAV
+        '''
+        xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+        for collection, radius, color in zip(self.uav_collections, radii, colors):
+            diameter = 2 * np.broadcast_to(radius, len(xy))
+            collection.set_offsets(xy)
+            collection.set_widths(diameter)
+            collection.set_heights(diameter)
+            collection.set_angles(np.zeros(len(xy)))
+        
+        # color conversion is costly, colors are only updated when they change
+        if colors != self.uav_colors:
+            for collection, color in zip(self.uav_collections, colors):
+                collection.set_facecolor(color)
+                collection.set_edgecolor(color)
+            self.uav_colors = colors
+
+        self.fig.canvas.restore_region(self.background)
+        self._draw_animated()
+        self.fig.canvas.blit(self.ax.bbox)
+        self.fig.canvas.flush_events()
+
+    def close(self,):
+        self.fig.canvas.mpl_disconnect(self._draw_event_id)
@@ -0,0 +1,134 @@
+'''
+Replays a run recorded by recorder.TrajectoryRecorder (memmap backend) without re-running the physics.
+
+    python replay.py <recording_dir> --start 0 --stop 5000 --decimation 10
+
+Columns are memory-mapped, a frame is a slice of rows located through the step offsets,
+so seeking is O(1) and only the pages of the frames that are drawn are read from disk.
+'''
+import os
+import json
+import time
+import argparse
+import numpy as np
+import geopandas as gpd
+from shapely import points
+from recorder import MEMMAP_META_FILE
+
+
+class RecordedRun:
+    '''
+    Read-only view of a memmap recording.
+
+    run[k] is the k-th recorded step as a dict of column arrays (memmap views, one entry per UAV),
+    run.frames(start, stop, decimation) streams frames lazily.
+    '''
+
+    def __init__(self, path):
+        meta_path = os.path.join(path, MEMMAP_META_FILE)
+        if not os.path.exists(meta_path):
+            raise RuntimeError(f'{path} is not a memmap recording, {MEMMAP_META_FILE} not found')
+        with open(meta_path) as meta_file:
+            meta = json.load(meta_file)
+
+        self.path = path
+        self.num_rows = meta['num_rows']
+        self.num_steps = meta['num_steps']
+        self.metadata = meta.get('metadata', {})
+        self.step_offsets = np.fromfile(os.path.join(path, 'step_offsets.bin'), dtype=np.int64)
+        self.columns = {}
+        for name, column_info in meta['columns'].items():
+            shape = (self.num_rows,) + tuple(column_info['shape'])
+            if self.num_rows == 0:
+                self.columns[name] = np.zeros(shape, dtype=column_info['dtype'])
+            else:
+                self.columns[name] = np.memmap(os.path.join(path, f'{name}.bin'), dtype=column_info['dtype'], mode='r', shape=shape)
+
+    def __len__(self,):
+        return self.num_steps
+
+    def __getitem__(self, k) -> dict:
+        '''Columns of the k-th recorded step, O(1) seek.'''
+        if k < 0:
+            k += self.num_steps
+        if not 0 <= k < self.num_steps:
+            raise IndexError(f'step {k} out of range for {self.num_steps} recorded steps')
+        rows = slice(self.step_offsets[k], self.step_offsets[k + 1])
+        return {name:column[rows] for name, column in self.columns.items()}
+
+    def frames(self, start = 0, stop = None, decimation = 1):
+        '''Yields every decimation-th recorded step in [start, stop).'''
+        stop = self.num_steps if stop is None else min(stop, self.num_steps)
+        for k in range(start, stop, decimation):
+            yield self[k]
+
+
+class RecordedAirspace:
+    '''Airspace layers drawn by static_plot, rebuilt from the geometry stored in the recording metadata (recorder.airspace_geometry).'''
+
+    def __init__(self, location_name, geometry:dict):
+        self.location_name = location_name
+        crs = geometry['crs']
+        self.location_utm_gdf = gpd.GeoDataFrame(geometry=gpd.GeoSeries.from_wkb(geometry['location'], crs=crs))
+        self.location_utm_hospital = gpd.GeoDataFrame(geometry=gpd.GeoSeries.from_wkb(geometry['hospital'], crs=crs))
+        self.location_utm_hospital_buffer = gpd.GeoSeries.from_wkb(geometry['hospital_buffer'], crs=crs)
+
+    def __repr__(self) -> str:
+        return ('RecordedAirspace({location_name})'.format(location_name = self.location_name))
+
+
+class ReplayScene:
+    '''Stand-in for a simulator in static_plot, airspace and vertiports come from the recording metadata.'''
+
+    def __init__(self, run:RecordedRun, airspace = None):
+        '''
+        Args:
+            run (RecordedRun): recording to draw
+            airspace (Airspace | None): airspace of the run, by default it is rebuilt from the recorded geometry.
+                                        Recordings without geometry are geocoded again with Airspace(location_name).
+        '''
+        metadata = run.metadata
+        if 'location_name' not in metadata:
+            raise RuntimeError('Recording has no airspace metadata, record with Simulator.RUN_SIMULATOR or pass simulation_metadata')
+        if airspace is not None:
+            self.airspace = airspace
+        elif 'airspace_geometry' in metadata:
+            self.airspace = RecordedAirspace(metadata['location_name'], metadata['airspace_geometry'])
+        else:
+            from airspace import Airspace
+            self.airspace = Airspace(metadata['location_name'], buffer_radius=metadata['buffer_radius'], tags=metadata['tags'])
+        self.sim_vertiports_point_array = points(np.asarray(metadata['vertiport_xy'], dtype=float).reshape(-1, 2))
+
+
+def replay(path, start = 0, stop = None, decimation = 1, sleep_time = 0., airspace = None):
+    '''Renders a recording frame by frame with the blitting renderer, airspace as in ReplayScene.'''
+    import matplotlib.pyplot as plt
+    from renderer import Renderer
+    from utils import static_plot
+
+    run = RecordedRun(path)
+    scene = ReplayScene(run, airspace)
+    radius = (run.metadata['footprint'], run.metadata['nmac_radius'], run.metadata['detection_radius'])
+    colors = ('blue', 'orange', 'green')
+
+    plt.ion()
+    fig, ax = plt.subplots()
+    renderer = Renderer(fig, ax, static_plot, scene, gpd)
+    for frame in run.frames(start, stop, decimation):
+        xy = np.column_stack((frame['x'], frame['y']))
+        renderer.draw_uavs(xy, tuple(np.full(len(xy), r) for r in radius), colors)
+        time.sleep(sleep_time)
+    renderer.close()
+    print('Replay complete.')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay a recorded run')
+    parser.add_argument('path', help='recording directory written by TrajectoryRecorder(backend="memmap")')
+    parser.add_argument('--start', type=int, default=0, help='first recorded step')
+    parser.add_argument('--stop', type=int, default=None, help='stop before this recorded step')
+    parser.add_argument('--decimation', type=int, default=1, help='draw every k-th step')
+    parser.add_argument('--sleep', type=float, default=0., help='pause (s) between frames')
+    args = parser.parse_args()
+
+    replay(args.path, args.start, args.stop, args.decimation, args.sleep)
@@ -2,7 +2,9 @@
 from airspace import Airspace
 from airtrafficcontroller import ATC
 from uav import UAV
-import matplotlib.pyplot as plt
+from renderer import Renderer
+from recorder import simulation_metadata
+import numpy as np
 import geopandas as gpd
 from shapely import Point
 import time
@@ -28,7 +30,7 @@ from typing import List
 
 class Simulator:
  
-    def __init__(self, location_name, num_vertiports, num_reg_uavs, sleep_time, total_timestep): 
+    def __init__(self, location_name, num_vertiports, num_reg_uavs, sleep_time, total_timestep, airspace = None): 
         """
         Initializes a Simulator object.
 
@@ -36,9 +38,10 @@ class Simulator:
             location_name (str): The name of the location for the simulation.
             num_vertiports (int): The number of vertiports to create in the simulation.
             num_reg_uavs (int): The number of regular UAVs to create in the simulation.
+            airspace (Airspace | None): A prebuilt airspace (e.g. SyntheticAirspace), location_name is ignored when given.
         """       
         # sim airspace and ATC
-        self.airspace = Airspace(location_name=location_name)
+        self.airspace = Airspace(location_name=location_name) if airspace is None else airspace
         self.atc = ATC(self.airspace, )
         # Initialize sim's vertiports and uavs using ATC 
         #*
@@ -57,29 +60,32 @@ class Simulator:
         self.sleep_time = sleep_time
         #sim run time
         self.total_timestep = total_timestep
+        #sim renderer, created on first render call
+        self.renderer = None
+        #trajectory recorder (recorder.TrajectoryRecorder), opt-in
+        self.recorder = None
+        self.timestep = 0
 
 
     def render(self,fig, ax, static_plot, sim, gpd):
-        plt.cla()
-        static_plot(sim, ax, gpd)
+        # static layers are drawn once, the renderer is rebuilt only when a new figure is passed
+        if self.renderer is None or self.renderer.ax is not ax:
+            self.renderer = Renderer(fig, ax, static_plot, sim, gpd)
         # UAV PLOT LOGIC
-        for uav_obj in self.uav_list:
-            uav_footprint_poly = uav_obj.uav_polygon_plot(uav_obj.uav_footprint)
-            uav_footprint_poly.plot(ax=ax, color=uav_obj.uav_footprint_color, alpha=0.3)
+        xy = [(uav_obj.current_position.x, uav_obj.current_position.y) for uav_obj in self.uav_list]
+        radii = (np.array([uav_obj.uav_footprint for uav_obj in self.uav_list]),
+                 np.array([uav_obj.nmac_radius for uav_obj in self.uav_list]),
+                 np.array([uav_obj.detection_radius for uav_obj in self.uav_list]))
+        colors = ([uav_obj.uav_footprint_color for uav_obj in self.uav_list],
+                  [uav_obj.uav_nmac_radius_color for uav_obj in self.uav_list],
+                  [uav_obj.uav_detection_radius_color for uav_obj in self.uav_list])
+        self.renderer.draw_uavs(xy, radii, colors)
 
-            uav_nmac_poly = uav_obj.uav_polygon_plot(uav_obj.nmac_radius)
-            uav_nmac_poly.plot(ax=ax, color=uav_obj.uav_nmac_radius_color, alpha=0.3)
-
-            uav_detection_poly = uav_obj.uav_polygon_plot(uav_obj.detection_radius)
-            uav_detection_poly.plot(ax=ax, color=uav_obj.uav_detection_radius_color,alpha=0.3)
-
-        fig.canvas.draw()
-        fig.canvas.flush_events()
         time.sleep(self.sleep_time)
 
     
     def _get_obs(self,uav_obj:UAV):
-        state_info = uav_obj.get_state(self.uav_list, self.airspace.location_utm_hospital_buffer)
+        state_info = uav_obj.get_state(self.uav_list, self.airspace)
         
         return state_info
     
@@ -96,14 +102,14 @@ class Simulator:
         return action_list
 
     def get_uav(self, uav_id):
-        for uav in self.uav_list:
-            if uav.id == int(uav_id):
-                return uav
-            else:
-                continue
-        raise RuntimeError('UAV not it list')
+        return self.atc.get_uav(uav_id)
 
     def sim_step(self, action_list):
+        if self.recorder is not None:
+            action = np.array([action if isinstance(action, tuple) else (0., 0.) for _, action in action_list], dtype=float).reshape(-1, 2)
+            self.recorder.record_step(self.timestep, self.atc.fleet_state, None, action[:, 0], action[:, 1])
+        self.timestep += 1
+        
         obs_list = []
         for uav_id, action in action_list:
             # print(uav_id, action)
@@ -116,7 +122,7 @@ class Simulator:
         return obs_list
         
 
-    def RUN_SIMULATOR(self, fig, ax, static_plot, sim, gpd, controller_predict): #! das-controller needs to be changed to controller_predict implement uniform name all across code base 
+    def RUN_SIMULATOR(self, fig, ax, static_plot, sim, gpd, controller_predict, recorder = None): #! das-controller needs to be changed to controller_predict implement uniform name all across code base 
         """
         Runs the simulator. 
         This method packs rendering, and stepping into one method. 
@@ -126,18 +132,25 @@ class Simulator:
             fig (matplotlib.figure.Figure): The figure object for plotting.
             ax (matplotlib.axes.Axes): The axes object for plotting.
             static_plot (function): A function that plots the static elements of the simulation.
+            recorder (TrajectoryRecorder | None): records every step, closed when the run is complete.
 
         Returns:
             None
         """
+        self.recorder = recorder
+        if self.recorder is not None:
+            self.recorder.metadata.update(simulation_metadata(self.atc))
         for _ in range(self.total_timestep):
-            self.render(fig, ax, static_plot, sim, gpd)
+            if fig is not None:
+                self.render(fig, ax, static_plot, sim, gpd)
             #! need an initial state
             # - initial state is created by create_n_reg_uavs
             #! feed the initial state to the controller if controller 
             action_list = self.get_action_list(controller_predict) #! check for zero_controller 
             self.sim_step(action_list) #! how would step behave to action_list 
         
+        if self.recorder is not None:
+            self.recorder.close()
         print('Simulation complete.')
 
 
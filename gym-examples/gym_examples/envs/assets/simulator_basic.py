@@ -1,9 +1,14 @@
 #Welcome to the simulator, this takes all the classes from all the modules, and builds an instance of the simulator
+import numpy as np
 from airspace import Airspace
 from airtrafficcontroller import ATC
 from uav import UAV
 from uav_basic import UAV_Basic
-import matplotlib.pyplot as plt
+from detection import NeighborIndex, InteractionCache, ConflictHorizon, fleet_das_state
+from fleet_kernel import FleetKernel
+from renderer import Renderer
+from recorder import simulation_metadata
+from profiling import profiler
 import geopandas as gpd
 from shapely import Point
 import time
@@ -13,7 +18,7 @@ from typing import List
 
 class Simulator_basic:
  
-    def __init__(self, location_name, num_vertiports, num_reg_uavs, sleep_time, total_timestep): 
+    def __init__(self, location_name, num_vertiports, num_reg_uavs, sleep_time, total_timestep, airspace = None, use_jit = None, conflict_horizon = False, conflict_lookahead = None): 
         """
         Initializes a Simulator object.
 
@@ -21,9 +26,15 @@ class Simulator_basic:
             location_name (str): The name of the location for the simulation.
             num_vertiports (int): The number of vertiports to create in the simulation.
             num_reg_uavs (int): The number of regular UAVs to create in the simulation.
+            airspace (Airspace | None): A prebuilt airspace (e.g. SyntheticAirspace), location_name is ignored when given.
+            use_jit (bool | None): Compiled fleet kernel, None uses it when numba is installed, see fleet_kernel.FleetKernel.
+            conflict_horizon (bool): Skip detection for UAVs that cannot have a conflict yet, see detection.ConflictHorizon.
+            conflict_lookahead (float | None): When set, the ATC predicts NMACs this many seconds ahead every step (see ATC.predict_conflicts)
+                                               and UAVs without an intruder in detection range get their most urgent predicted
+                                               intruder as DAS input (see InteractionCache.predicted_nearest).
         """       
         # sim airspace and ATC
-        self.airspace = Airspace(location_name=location_name)
+        self.airspace = Airspace(location_name=location_name) if airspace is None else airspace
         self.atc = ATC(self.airspace, )
         # Initialize sim's vertiports and uavs using ATC 
         #*
@@ -37,29 +48,43 @@ class Simulator_basic:
         # sim data
         self.sim_vertiports_point_array = vertiports_point_array
         self.uav_list:List[UAV_Basic] = self.atc.reg_uav_list
+        self.fleet_state = self.atc.fleet_state
+        self.neighbor_index = NeighborIndex(self.fleet_state)
+        # neighbors, nearest intruders and building checks of the current tick, see detection.InteractionCache
+        self.interaction_cache = InteractionCache(self.fleet_state, self.airspace, self.neighbor_index)
+        self.fleet_kernel = FleetKernel(self.fleet_state, UAV_Basic.das_controller, use_jit=use_jit)
+        self.conflict_horizon = ConflictHorizon(self.fleet_state, self.airspace, UAV_Basic.das_controller, self.neighbor_index) if conflict_horizon else None
+        # skipped UAVs are left out of the neighbor index, so they would be missing from the predictions
+        if conflict_horizon and conflict_lookahead is not None:
+            raise RuntimeError('Conflict prediction needs every UAV in the neighbor index, it cannot be combined with conflict_horizon')
+        self.conflict_lookahead = conflict_lookahead
         #* 
         # sim sleep time
         self.sleep_time = sleep_time
         #sim run time
         self.total_timestep = total_timestep
+        #sim renderer, created on first render call
+        self.renderer = None
+        #trajectory recorder (recorder.TrajectoryRecorder), opt-in
+        self.recorder = None
+        #phase timers and counters, enabled with self.profiler.enable()
+        self.profiler = profiler
+        self.timestep = 0
 
 
     def render(self,fig, ax, static_plot, sim, gpd):
-        plt.cla()
-        static_plot(sim, ax, gpd)
-        # UAV PLOT LOGIC
-        for uav_obj in self.uav_list:
-            uav_footprint_poly = uav_obj.uav_polygon_plot(uav_obj.uav_footprint)
-            uav_footprint_poly.plot(ax=ax, color=uav_obj.uav_footprint_color, alpha=0.3)
+        with self.profiler.phase('render'):
+            # static layers are drawn once, the renderer is rebuilt only when a new figure is passed
+            if self.renderer is None or self.renderer.ax is not ax:
+                self.renderer = Renderer(fig, ax, static_plot, sim, gpd)
+            # UAV PLOT LOGIC
+            n = len(self.fleet_state)
+            radii = (self.fleet_state.footprint[:n], self.fleet_state.nmac_radius[:n], self.fleet_state.detection_radius[:n])
+            colors = ([uav_obj.uav_footprint_color for uav_obj in self.uav_list],
+                      [uav_obj.uav_nmac_radius_color for uav_obj in self.uav_list],
+                      [uav_obj.uav_detection_radius_color for uav_obj in self.uav_list])
+            self.renderer.draw_uavs(self.fleet_state.position, radii, colors)
 
-            uav_nmac_poly = uav_obj.uav_polygon_plot(uav_obj.nmac_radius)
-            uav_nmac_poly.plot(ax=ax, color=uav_obj.uav_nmac_radius_color, alpha=0.3)
-
-            uav_detection_poly = uav_obj.uav_polygon_plot(uav_obj.detection_radius)
-            uav_detection_poly.plot(ax=ax, color=uav_obj.uav_detection_radius_color,alpha=0.3)
-
-        fig.canvas.draw()
-        fig.canvas.flush_events()
         time.sleep(self.sleep_time)
 
     
@@ -70,41 +95,81 @@ class Simulator_basic:
 
 
     def get_uav(self, uav_id):
-        for uav in self.uav_list:
-            if uav.id == int(uav_id):
-                return uav
-            else:
-                continue
-        raise RuntimeError('UAV not it list')
+        return self.atc.get_uav(uav_id)
 
 
     def set_uav_intruder_list(self):
+        self.interaction_cache.update(self.timestep)
         for uav in self.uav_list:
-            uav.get_intruder_uav_list(self.uav_list)
+            uav.get_intruder_uav_list(self.uav_list, neighbor_index=self.neighbor_index)
     
     def set_building_gdf(self):
         for uav in self.uav_list:
-            uav.get_airspace_building_list(self.airspace.location_utm_hospital_buffer)
+            uav.get_airspace_building_list(self.airspace)
+    
+    
+    def get_state_batch(self, ):
+        '''
+        Batched UAV_Basic.get_state for the whole fleet, in the argument order of Collision_controller.get_action_batch.
+        Returns static_mask, own_heading_deg, intruder_rel_pos, intruder_heading_deg, intruder_mask 
+        Intruders are read from the neighbor index, which has to be rebuilt for the current positions.
+        '''
+        return fleet_das_state(self.fleet_state, self.airspace, self.neighbor_index)
     
     
     def sim_step(self, ):
-        for uav in self.uav_list:
-            self.atc.has_left_start_vertiport(uav)
-            self.atc.has_reached_end_vertiport(uav)
-            uav.step()
+        '''Steps all UAVs. 
+        Vertiport checks are done for the whole fleet first, 
+        then DAS actions are evaluated for the whole fleet at once 
+        and the fleet is advanced using the fleet arrays (fleet_kernel.FleetKernel).
+        With the profiler enabled the stats of the step are returned.'''
+        with self.profiler.phase('atc_checks'):
+            self.atc.update_vertiport_events()
+        
+        # with the conflict horizon only the UAVs that could have a conflict are checked
+        active = None if self.conflict_horizon is None else self.conflict_horizon.due(self.timestep)
+        self.interaction_cache.update(self.timestep, active)
+        static_mask, nearest = self.interaction_cache.static_mask, self.interaction_cache.nearest
+        if self.conflict_lookahead is not None:
+            self.atc.predict_conflicts(self.interaction_cache, 'nmac', self.conflict_lookahead)
+            # UAVs without an intruder in detection range avoid their most urgent predicted NMAC
+            predicted, _ = self.interaction_cache.predicted_nearest('nmac', self.conflict_lookahead)
+            nearest = np.where(nearest >= 0, nearest, predicted)
+        if self.conflict_horizon is not None:
+            with self.profiler.phase('conflict_horizon'):
+                self.conflict_horizon.update(self.timestep, active, static_mask, nearest)
+        
+        if self.recorder is None and self.fleet_kernel.use_jit:
+            # DAS actions and integration fused in one compiled loop
+            with self.profiler.phase('fleet_step'):
+                self.fleet_kernel.step(1, static_mask, nearest)
+        else:
+            with self.profiler.phase('controller'):
+                acceleration, heading_correction = self.fleet_kernel.actions(static_mask, nearest)
+            
+            if self.recorder is not None:
+                with self.profiler.phase('recording'):
+                    self.recorder.record_step(self.timestep, self.fleet_state, self.neighbor_index, acceleration, heading_correction)
+            
+            with self.profiler.phase('integration'):
+                self.fleet_kernel.integrate(1, acceleration, heading_correction)
+        self.timestep += 1
+        
+        return self.profiler.end_step()
         
         
 
-    def RUN_SIMULATOR(self, fig, ax, static_plot, sim, gpd,): 
+    def RUN_SIMULATOR(self, fig, ax, static_plot, sim, gpd, recorder = None): 
         """
         Runs the simulator. 
         This method packs rendering, and stepping into one method. 
         Generally, for RL the loop is written explictly. This method was written for convinience. 
 
         Args:
-            fig (matplotlib.figure.Figure): The figure object for plotting.
+            fig (matplotlib.figure.Figure): The figure object for plotting, None runs headless.
             ax (matplotlib.axes.Axes): The axes object for plotting.
             static_plot (function): A function that plots the static elements of the simulation.
+            recorder (TrajectoryRecorder | None): records every step, closed when the run is complete.
 
         Returns:
             None
@@ -112,11 +177,17 @@ class Simulator_basic:
         
         self.set_uav_intruder_list()
         self.set_building_gdf()
+        self.recorder = recorder
+        if self.recorder is not None:
+            self.recorder.metadata.update(simulation_metadata(self.atc))
         
         for _ in range(self.total_timestep):
-            self.render(fig, ax, static_plot, sim, gpd)
+            if fig is not None:
+                self.render(fig, ax, static_plot, sim, gpd)
             self.sim_step() #! how would step behave to action_list 
         
+        if self.recorder is not None:
+            self.recorder.close()
         print('Simulation complete.')
 
 
@@ -5,6 +5,9 @@ from shapely.geometry import Point
 from geopandas import GeoSeries
 from vertiport import Vertiport
 from das import Collision_controller
+from detection import intruder_mask
+from fleet_state import heading_controller
+from profiling import profiler
 #TODO - abstract controller, basic collision controller 
 #from collision_avoidance_controller_basic import uav_collision_detection, uav_nmac_detection, static_collision_detection, static_nmac_detection
 
@@ -20,11 +23,13 @@ class UAV:
                  end_vertiport,
                  landing_proximity = 50., 
                  max_speed = 43,
+                 heading_deg = None,
                  ):
         
         
         #UAV builtin properties 
-        self.heading_deg = np.random.randint(-178,178) + np.random.rand() # random heading between -180 and 180
+        # random heading between -180 and 180 unless given
+        self.heading_deg = np.random.randint(-178,178) + np.random.rand() if heading_deg is None else heading_deg
         self.uav_footprint = 17 #H175 nose to tail length of 17m,
         self.nmac_radius = 150 #NMAC radius
         self.detection_radius = 550
@@ -64,6 +69,7 @@ class UAV:
 
 
     def uav_polygon(self, dimension):
+        profiler.count('geometry_constructions')
         return GeoSeries(self.current_position).buffer(dimension).iloc[0]
     
     def uav_polygon_plot(self, dimension):
@@ -132,56 +138,14 @@ class UAV:
                                                         self.end_point.x - self.current_position.x)
         self.current_ref_final_heading_deg = np.rad2deg(self.current_ref_final_heading_rad)
         
-    #TODO - update_theta needs to be reworked NOW  
     def _update_theta_d(self, heading_correction_das_controller = 0): 
         #TODO - update method to include theta_dd and d_t
-        '''Internal method. Updates heading of the aircraft, pointed towards ref_final_heading_deg''' 
-        if heading_correction_das_controller == 0:
-            avg_rate_of_turn = 20 #degree/s, collected from google - https://skybrary.aero/articles/rate-turn#:~:text=Description,%C2%B0%20turn%20in%20two%20minutes.
-
-            #! need to find how to dynamically slow down the turn rate as we get close to the ref_final_heading
-            if np.abs(self.current_ref_final_heading_deg - self.current_heading_deg) < avg_rate_of_turn:
-                avg_rate_of_turn = 1 #degree Airbus H175
-
-            if np.abs(self.current_ref_final_heading_deg - self.current_heading_deg) < 0.5:
-                avg_rate_of_turn = 0.
-            
-            #* logic for heading update 
-            if (np.sign(self.current_ref_final_heading_deg)==np.sign(self.current_heading_deg)==1):
-                # and (ref_final_heading > current_heading_deg)) or ((np.sign(ref_final_heading)==np.sign(current_heading_deg)== -1) and (np.abs(ref_final_heading)<(np.abs(current_heading_deg)))):
-                if self.current_ref_final_heading_deg > self.current_heading_deg:
-                    self.current_heading_deg += avg_rate_of_turn #counter clockwise turn
-                    self.current_heading_radians = np.deg2rad(self.current_heading_deg) 
-                elif self.current_ref_final_heading_deg < self.current_heading_deg:
-                    self.current_heading_deg -= avg_rate_of_turn #clockwise turn
-                    self.current_heading_radians = np.deg2rad(self.current_heading_deg)
-                else:
-                    pass  
-            
-            elif np.sign(self.current_ref_final_heading_deg) == np.sign(self.current_heading_deg) == -1:
-                if np.abs(self.current_ref_final_heading_deg) < np.abs(self.current_heading_deg):
-                    self.current_heading_deg += avg_rate_of_turn #counter clockwise turn
-                    self.current_heading_radians = np.deg2rad(self.current_heading_deg)
-                elif np.abs(self.current_ref_final_heading_deg) > np.abs(self.current_heading_deg):
-                    self.current_heading_deg -= avg_rate_of_turn #clockwise turn
-                    self.current_heading_radians = np.deg2rad(self.current_heading_deg)
-                else:
-                    pass
-                    
-            elif np.sign(self.current_ref_final_heading_deg) == 1 and np.sign(self.current_heading_deg) == -1:
-                self.current_heading_deg += avg_rate_of_turn #counter clockwise turn
-                self.current_heading_radians = np.deg2rad(self.current_heading_deg)
-
-            elif np.sign(self.current_ref_final_heading_deg) == -1 and np.sign(self.current_heading_deg) == 1:
-                self.current_heading_deg -= avg_rate_of_turn #clockwise turn
-                self.current_heading_radians = np.deg2rad(self.current_heading_deg)
-
-            else:
-                raise Exception('Error in heading correction')
-        
-        else:
-            self.current_heading_deg += heading_correction_das_controller
-            self.current_heading_radians = np.deg2rad(self.current_heading_deg)
+        '''Internal method. Updates heading of the aircraft, pointed towards ref_final_heading_deg.
+        Uses the same batched turn-rate controller as FleetState.step_all''' 
+        self.current_heading_deg = float(heading_controller(self.current_heading_deg, 
+                                                            self.current_ref_final_heading_deg, 
+                                                            heading_correction_das_controller))
+        self.current_heading_radians = np.deg2rad(self.current_heading_deg)
                      
 
     def get_intruder_distance(self, other_uav):
@@ -221,12 +185,12 @@ class UAV:
         else:
             raise RuntimeError('Unknown radius string passed.')
 
-        self.intruder_uav_list = []
         other_uav_list = self.get_other_uav_list(uav_list)
+        own_xy = (self.current_position.x, self.current_position.y)
+        others_xy = [(other_uav.current_position.x, other_uav.current_position.y) for other_uav in other_uav_list]
+        is_intruder = intruder_mask(own_xy, others_xy, own_radius, other_radius)
 
-        for other_uav in other_uav_list:
-            if self.uav_polygon(own_radius).intersects(other_uav.uav_polygon(other_radius)):
-                self.intruder_uav_list.append(other_uav)
+        self.intruder_uav_list = [other_uav for other_uav, intruder in zip(other_uav_list, is_intruder) if intruder]
         
         return self.intruder_uav_list
 
@@ -284,7 +248,7 @@ class UAV:
             
             return intruder_state_info
     
-    def get_state_static_obj(self, building_gdf, radius_str = 'detection'):
+    def get_state_static_obj(self, airspace, radius_str = 'detection'):
         if radius_str == 'detection':
             own_radius = self.detection_radius
         elif radius_str == 'nmac':
@@ -294,20 +258,15 @@ class UAV:
         else:
             raise RuntimeError('Unknown radius string passed.')
         
-        building_polygon_count = len(building_gdf)
-        intersection_list = []
-        
-        for i in range(building_polygon_count):
-            intersection_list.append(self.uav_polygon(own_radius).intersection(building_gdf.iloc[i]))
-        
-        intersection_with_building = any(intersection_list)
+        own_position = (self.current_position.x, self.current_position.y)
+        intersection_with_building = bool(airspace.query_obstacles_within(own_position, own_radius)[0])
         own_state_info = self.current_heading_deg
         
         return intersection_with_building , own_state_info
                 
         
-    def get_state(self, uav_list, building_gdf, radius_str = 'detection'):
-        static_state = self.get_state_static_obj(building_gdf, radius_str)
+    def get_state(self, uav_list, airspace, radius_str = 'detection'):
+        static_state = self.get_state_static_obj(airspace, radius_str)
         dynamic_state = self.get_state_dynamic_obj(uav_list, radius_str) 
 
 
@@ -5,20 +5,48 @@ from shapely.geometry import Point
 from geopandas import GeoSeries
 from vertiport import Vertiport
 from das import Collision_controller
+from detection import intruder_mask, NeighborIndex, InteractionCache
+from fleet_state import FleetState, FleetField, heading_controller
+from profiling import profiler
 
 class UAV_Basic:
     '''Representation of UAV in airspace. UAV motion represented in 2D plane. 
      Object is to move from start vertiport to end vertiport.
      A UAV instance requires a start and end vertiport.
+     The technical, position and heading properties are views into a FleetState,
+     so the whole fleet can be stepped with FleetState.step_all.
      '''
+
+    #DAS controller shared by all UAV_Basic 
+    das_controller = Collision_controller(static_heading_correction=5)
+
+    #UAV properties stored in the fleet arrays
+    uav_footprint = FleetField('footprint')
+    nmac_radius = FleetField('nmac_radius')
+    detection_radius = FleetField('detection_radius')
+    collision_radius = FleetField('collision_radius')
+    current_speed = FleetField('speed')
+    max_speed = FleetField('max_speed')
+    max_acceleration = FleetField('max_acceleration')
+    landing_proximity = FleetField('landing_proximity')
+    current_heading_deg = FleetField('heading_deg')
+    current_ref_final_heading_deg = FleetField('ref_heading_deg')
+    leaving_start_vertiport = FleetField('leaving_start_vertiport', cast=bool)
+    reaching_end_vertiport = FleetField('reaching_end_vertiport', cast=bool)
     
     def __init__(self,
                  start_vertiport ,  
                  end_vertiport,
                  landing_proximity = 50., 
                  max_speed = 43,
+                 fleet_state:FleetState = None,
+                 heading_deg = None,
                  ):
         
+        #UAV fleet slot, a UAV built without a fleet gets a fleet of its own
+        self.id = id(self)
+        self.fleet_state = fleet_state if fleet_state is not None else FleetState(capacity=1)
+        self.fleet_index = self.fleet_state.add_uav(self.id)
         
         #UAV rendering-representation properties 
         self.uav_footprint_color = 'blue' # this color represents the UAV object 
@@ -30,10 +58,11 @@ class UAV_Basic:
         self.uav_footprint = 17 #H175 nose to tail length of 17m,
         self.nmac_radius = 150 #NMAC radius
         self.detection_radius = 550
+        self.collision_radius = 17 #UAVs collide when footprints intersect
         
         #UAV technical properties
-        self.id = id(self)
-        self.heading_deg = np.random.randint(-178,178) + np.random.rand() # random heading between -180 and 180
+        # random heading between -180 and 180 unless given
+        self.heading_deg = np.random.randint(-178,178) + np.random.rand() if heading_deg is None else heading_deg
         self.current_speed = 0
         self.max_speed:float = max_speed
         self.max_acceleration = 1 # m/s^2, this has been obtained from internet 
@@ -62,7 +91,52 @@ class UAV_Basic:
         self.current_ref_final_heading_deg = np.rad2deg(self.current_ref_final_heading_rad)
 
 
+    @property
+    def current_position(self,) -> Point:
+        return Point(self.fleet_state.x[self.fleet_index], self.fleet_state.y[self.fleet_index])
+
+    @current_position.setter
+    def current_position(self, position:Point):
+        self.fleet_state.x[self.fleet_index] = position.x
+        self.fleet_state.y[self.fleet_index] = position.y
+
+    @property
+    def start_point(self,) -> Point:
+        return Point(self.fleet_state.start_x[self.fleet_index], self.fleet_state.start_y[self.fleet_index])
+
+    @start_point.setter
+    def start_point(self, position:Point):
+        self.fleet_state.start_x[self.fleet_index] = position.x
+        self.fleet_state.start_y[self.fleet_index] = position.y
+
+    @property
+    def end_point(self,) -> Point:
+        return Point(self.fleet_state.end_x[self.fleet_index], self.fleet_state.end_y[self.fleet_index])
+
+    @end_point.setter
+    def end_point(self, position:Point):
+        self.fleet_state.end_x[self.fleet_index] = position.x
+        self.fleet_state.end_y[self.fleet_index] = position.y
+
+    @property
+    def current_heading_radians(self,) -> float:
+        return np.deg2rad(self.current_heading_deg)
+
+    @current_heading_radians.setter
+    def current_heading_radians(self, heading_rad):
+        self.current_heading_deg = np.rad2deg(heading_rad)
+
+    @property
+    def current_ref_final_heading_rad(self,) -> float:
+        return np.deg2rad(self.current_ref_final_heading_deg)
+
+    @current_ref_final_heading_rad.setter
+    def current_ref_final_heading_rad(self, heading_rad):
+        self.current_ref_final_heading_deg = np.rad2deg(heading_rad)
+
+
     def uav_polygon(self, dimension):
+        profiler.count('geometry_constructions')
         return GeoSeries(self.current_position).buffer(dimension).iloc[0]
     
     def uav_polygon_plot(self, dimension):
@@ -119,9 +193,8 @@ class UAV_Basic:
         '''Internal method. Updates current_position of the UAV after d_t seconds.
            This uses a first order Euler's method to update the position.
            '''
-        update_x = self.current_position.x + self.current_speed * np.cos(self.current_heading_radians) * d_t 
-        update_y = self.current_position.y + self.current_speed * np.sin(self.current_heading_radians) * d_t 
-        self.current_position = Point(update_x,update_y)
+        self.fleet_state.x[self.fleet_index] += self.current_speed * np.cos(self.current_heading_radians) * d_t 
+        self.fleet_state.y[self.fleet_index] += self.current_speed * np.sin(self.current_heading_radians) * d_t 
     
 
     def _update_ref_final_heading(self, ): 
@@ -130,58 +203,13 @@ class UAV_Basic:
                                                         self.end_point.x - self.current_position.x)
         self.current_ref_final_heading_deg = np.rad2deg(self.current_ref_final_heading_rad)
         
-    #TODO - update_theta needs to be reworked NOW  
     def _update_theta_d(self, heading_correction_das_controller = 0): 
         #TODO - update method to include theta_dd and d_t
-        '''Internal method. Updates heading of the aircraft, pointed towards ref_final_heading_deg''' 
-        if heading_correction_das_controller == 0:
-            avg_rate_of_turn = 20 #degree/s, collected from google - https://skybrary.aero/articles/rate-turn#:~:text=Description,%C2%B0%20turn%20in%20two%20minutes.
-
-            #! need to find how to dynamically slow down the turn rate as we get close to the ref_final_heading
-            if np.abs(self.current_ref_final_heading_deg - self.current_heading_deg) < avg_rate_of_turn:
-                avg_rate_of_turn = 1 #degree Airbus H175
-
-            if np.abs(self.current_ref_final_heading_deg - self.current_heading_deg) < 0.5:
-                avg_rate_of_turn = 0.
-            
-            #* logic for heading update 
-            if (np.sign(self.current_ref_final_heading_deg)==np.sign(self.current_heading_deg)==1):
-                # and (ref_final_heading > current_heading_deg)) or ((np.sign(ref_final_heading)==np.sign(current_heading_deg)== -1) and (np.abs(ref_final_heading)<(np.abs(current_heading_deg)))):
-                if self.current_ref_final_heading_deg > self.current_heading_deg:
-                    self.current_heading_deg += avg_rate_of_turn #counter clockwise turn
-                    self.current_heading_radians = np.deg2rad(self.current_heading_deg) 
-                elif self.current_ref_final_heading_deg < self.current_heading_deg:
-                    self.current_heading_deg -= avg_rate_of_turn #clockwise turn
-                    self.current_heading_radians = np.deg2rad(self.current_heading_deg)
-                else:
-                    pass  
-            
-            elif np.sign(self.current_ref_final_heading_deg) == np.sign(self.current_heading_deg) == -1:
-                if np.abs(self.current_ref_final_heading_deg) < np.abs(self.current_heading_deg):
-                    self.current_heading_deg += avg_rate_of_turn #counter clockwise turn
-                    self.current_heading_radians = np.deg2rad(self.current_heading_deg)
-                elif np.abs(self.current_ref_final_heading_deg) > np.abs(self.current_heading_deg):
-                    self.current_heading_deg -= avg_rate_of_turn #clockwise turn
-                    self.current_heading_radians = np.deg2rad(self.current_heading_deg)
-                else:
-                    pass
-                    
-            elif np.sign(self.current_ref_final_heading_deg) == 1 and np.sign(self.current_heading_deg) == -1:
-                self.current_heading_deg += avg_rate_of_turn #counter clockwise turn
-                self.current_heading_radians = np.deg2rad(self.current_heading_deg)
-
-            elif np.sign(self.current_ref_final_heading_deg) == -1 and np.sign(self.current_heading_deg) == 1:
-                self.current_heading_deg -= avg_rate_of_turn #clockwise turn
-                self.current_heading_radians = np.deg2rad(self.current_heading_deg)
-
-            else:
-                raise Exception('Error in heading correction')
-        
-        else:
-            print('Heading before correction: ', self.current_heading_deg)
-            self.current_heading_deg += heading_correction_das_controller
-            print('Heading after correction: ', self.current_heading_deg)
-            self.current_heading_radians = np.deg2rad(self.current_heading_deg)
+        '''Internal method. Updates heading of the aircraft, pointed towards ref_final_heading_deg.
+        Uses the same batched turn-rate controller as FleetState.step_all''' 
+        self.current_heading_deg = float(heading_controller(self.current_heading_deg, 
+                                                            self.current_ref_final_heading_deg, 
+                                                            heading_correction_das_controller))
                      
 
     def get_intruder_distance(self, other_uav):
@@ -202,14 +230,21 @@ class UAV_Basic:
                 other_uav_list.append(uav)
         return other_uav_list
 
-    def get_intruder_uav_list(self,uav_list, radius_str = 'detection'):
+    def get_intruder_uav_list(self,uav_list, radius_str = 'detection', neighbor_index:NeighborIndex = None):
         #! This method is called by simulator
         '''
         Here the self.intruder_uav_list is created everytime as an empty list, 
         So everystep this attribute is an empty list and its populated with uavs that are within any(detection, nmac, collision) radius.
         There is no return from this method, the data is stored in the attribute and should be accessed immediately after calling this method.
         Any subsequent routines can call the attribute and use the attribute for data processing 
+
+        If a neighbor_index (rebuilt this step) is passed, intruders are read from it instead of scanning uav_list,
+        uav_list must then be in fleet order, uav_list[i].fleet_index == i, which is the case for ATC.reg_uav_list
         '''
+        if neighbor_index is not None:
+            self.intruder_uav_list = [uav_list[i] for i in neighbor_index.neighbors(self.fleet_index, radius_str)]
+            return
+        
         if radius_str == 'detection':
             own_radius = other_radius = self.detection_radius
             
@@ -222,15 +257,17 @@ class UAV_Basic:
         else:
             raise RuntimeError('Unknown radius string passed.')
 
-        self.intruder_uav_list = []
         other_uav_list = self.get_other_uav_list(uav_list)
+        own_xy = (self.current_position.x, self.current_position.y)
+        others_xy = [(other_uav.current_position.x, other_uav.current_position.y) for other_uav in other_uav_list]
+        is_intruder = intruder_mask(own_xy, others_xy, own_radius, other_radius)
 
-        for other_uav in other_uav_list:
-            if self.uav_polygon(own_radius).intersects(other_uav.uav_polygon(other_radius)):
-                self.intruder_uav_list.append(other_uav)
+        self.intruder_uav_list = [other_uav for other_uav, intruder in zip(other_uav_list, is_intruder) if intruder]
         
-    def get_airspace_building_list(self, building_gdf):
-        self.building_gdf = building_gdf
+    def get_airspace_building_list(self, airspace):
+        '''Stores the airspace, its prebuilt obstacle index is used for static object detection'''
+        self.airspace = airspace
+        self.building_gdf = airspace.location_utm_hospital_buffer
 
 
     def get_state_dynamic_obj(self,):
@@ -250,11 +287,8 @@ class UAV_Basic:
             and iterate through the list to find the intruder that is nearest. 
             State information, will be built using the nearest intruder. 
             '''
-            current_intruder = intruder_uav_list[0] #set first uav in intruder_list as current intruder 
-            #!sort based on distance
-            for ith_intruder in intruder_uav_list:
-                if self.get_intruder_distance(ith_intruder) < self.get_intruder_distance(current_intruder):
-                    current_intruder = ith_intruder #nearest intruder is current intruder
+            # nearest intruder, one distance per intruder, ties go to the first in the list
+            current_intruder = min(intruder_uav_list, key=self.get_intruder_distance)
             
             intruder_state_info = {'own_id':self.id,
                                 'own_pos': self.current_position,
@@ -283,117 +317,39 @@ class UAV_Basic:
         else:
             raise RuntimeError('Unknown radius string passed.')
         
-        building_polygon_count = len(self.building_gdf)
-        intersection_list = []
-        
-        for i in range(building_polygon_count):
-            intersection_list.append(self.uav_polygon(own_radius).intersection(self.building_gdf.iloc[i]))
-        
-        intersection_with_building = any(intersection_list)
+        own_position = (self.current_position.x, self.current_position.y)
+        intersection_with_building = bool(self.airspace.query_obstacles_within(own_position, own_radius)[0])
         
         return intersection_with_building , self.current_heading_deg
                 
         
-    def get_state(self, ):
+    def get_state(self, interaction_cache:InteractionCache = None):
+        '''State for the DAS controller, read from interaction_cache when one is passed (updated for the current positions).'''
+        if interaction_cache is not None:
+            return interaction_cache.das_state(self.fleet_index)
         static_state = self.get_state_static_obj()
         dynamic_state = self.get_state_dynamic_obj() 
 
 
         return static_state, dynamic_state
         
-    @staticmethod
-    def get_quadrant(theta):
-        if (theta >= 0) and (theta < 90):
-            return 1
-        elif (theta >= 90) and (theta <= 180):
-            return 2
-        elif (theta < 0) and (theta >= -90):
-            return 3
-        elif (theta >= -180) and (theta < -90):
-            return 4
-        else:
-            raise RuntimeError('DAS Error: Invalid heading')
-    
     def get_action(self, state): 
-        if state[0][0] is False and state[1] is None:
-            acceleration = 0
-            heading_correction = 0
-        
-        elif state[0][0] is False and isinstance(state[1], dict):
-            own_pos = state[1]['own_pos']
-            int_pos = state[1]['intruder_pos']
-            own_heading = state[1]['own_current_heading']
-            int_heading = state[1]['intruder_current_heading']
-
-            del_x = int_pos.x - own_pos.x
-            del_y = int_pos.y - own_pos.y
-            own_quadrant = self.get_quadrant(own_heading)
-            intruder_quadrant = self.get_quadrant(int_heading)
-            if (del_x > 0) and (del_y > 0):
-                if (own_quadrant == 1) and (intruder_quadrant == 4) :
-                    heading_correction = 25
-                    acceleration = -1
-                else:
-                    heading_correction = 0
-                    acceleration = 0
-            elif (del_x < 0) and (del_y > 0):
-                if (own_quadrant == 2) and (intruder_quadrant == 3) :
-                    heading_correction = -25
-                    acceleration = -1
-                else:
-                    heading_correction = 0
-                    acceleration = 0
-            elif (del_x < 0) and (del_y < 0):
-                if (own_quadrant == 4) and (intruder_quadrant == 1):
-                    heading_correction = 25
-                    acceleration = -1
-                else:
-                    heading_correction = 0
-                    acceleration = 0
-            elif (del_x > 0) and (del_y < 0):
-                if (own_quadrant == 3) and (intruder_quadrant == 2):
-                    heading_correction = -25
-                    acceleration = -1
-                else:
-                    heading_correction = 0
-                    acceleration = 0
-            else:
-                raise RuntimeError('Action not from scenario')
-        
-        elif state[0][0] is True and state[1] is None:
-            acceleration = 0 
-            current_heading = state[0][1]
-            
-            if (current_heading < 0):
-                current_heading += 360
-            elif (current_heading > 180):
-                current_heading -= 360
-
-            if 0 <= current_heading or current_heading <= 180:
-                heading_correction = 5
-            elif -180<=current_heading or current_heading<= 0: 
-                heading_correction = -5
-            else:
-                raise RuntimeError(f'DAS module - state[0][0] is True and state[1] is None, current heading {state[0][1]}')
-
-        elif state[0][0] is True and isinstance(state[1], dict):
-            acceleration = 0
-            heading_correction = 0
-        
-        else:
-            raise RuntimeError('DAS module: static and dynamic states do not match the conditionals')
-
-        return acceleration, heading_correction
+        '''DAS action of the UAV, from the baseline collision controller with a 5 degree static object correction'''
+        return self.das_controller.get_action(state)
     
     
 
     #TODO -  the action argument should be a named_tuple acceleration and theta_dd
     
-    def step(self,):
-        '''Updates the position of the UAV.'''
+    def step(self, interaction_cache:InteractionCache = None):
+        '''Updates the position of the UAV. 
+        With an interaction_cache (updated for the current tick) the state is read from it, 
+        no intruder list or building query is needed.'''
         
-        state = self.get_state()
-        action = self.get_action(state)
+        with profiler.phase('uav_state'):
+            state = self.get_state(interaction_cache)
+        with profiler.phase('uav_controller'):
+            action = self.get_action(state)
 
         if action is None:
             acceleration = None
@@ -401,10 +357,11 @@ class UAV_Basic:
             acceleration = action[0]
             heading_correction = action[1]
 
-        self._update_position(d_t=1, ) 
-        self._update_speed(d_t=1, acceleration_from_controller=acceleration)
-        self._update_theta_d(heading_correction)
-        self._update_ref_final_heading()
+        with profiler.phase('uav_integration'):
+            self._update_position(d_t=1, ) 
+            self._update_speed(d_t=1, acceleration_from_controller=acceleration)
+            self._update_theta_d(heading_correction)
+            self._update_ref_final_heading()
 
         obs = self.current_position
 
@@ -0,0 +1,51 @@
+import numpy as np
+import geopandas as gpd
+import pytest
+from shapely import box, Point
+from airspace import Airspace
+from fleet_state import FleetState
+from uav_basic import UAV_Basic
+from vertiport import Vertiport
+
+
+@pytest.fixture
+def make_airspace():
+    '''Factory for an Airspace with a square boundary and random hospital buffers, built without osmnx'''
+    def factory(size = 1e4, num_hospitals = 20, seed = 0):
+        rng = np.random.default_rng(seed)
+        airspace = object.__new__(Airspace)
+        airspace.location_utm_gdf = gpd.GeoDataFrame(geometry=[box(0, 0, size, size)])
+        airspace.location_utm_hospital_buffer = gpd.GeoSeries([Point(xy).buffer(500) for xy in rng.uniform(0, size, (num_hospitals, 2))])
+        return airspace
+    return factory
+
+
+@pytest.fixture
+def make_fleet():
+    '''
+    Factory for a fleet of UAV_Basic with random start and end vertiports in a size x size square,
+    returns (fleet_state, uav_list). Seeds np.random, so the random headings are reproducible.
+
+    Args of the factory:
+        num_uavs (int): fleet size
+        seed (int): seed of the vertiport locations, speeds and headings
+        size (float): side of the square (m)
+        random_speed (bool): every UAV gets 0 or a random speed up to 50 m/s, otherwise all are parked
+        airspace (Airspace | None): given to every UAV for static object detection
+    '''
+    def factory(num_uavs, seed = 0, size = 5000., random_speed = True, airspace = None):
+        rng = np.random.default_rng(seed)
+        np.random.seed(seed)
+        fleet_state = FleetState(capacity=4)
+        uav_list = []
+        for _ in range(num_uavs):
+            start_v = Vertiport(Point(rng.uniform(0, size, 2)))
+            end_v = Vertiport(Point(rng.uniform(0, size, 2)))
+            uav = UAV_Basic(start_v, end_v, fleet_state=fleet_state)
+            if random_speed:
+                uav.current_speed = rng.choice([0., rng.uniform(0, 50)])
+            if airspace is not None:
+                uav.get_airspace_building_list(airspace)
+            uav_list.append(uav)
+        return fleet_state, uav_list
+    return factory
@@ -0,0 +1,80 @@
+import numpy as np
+import random
+import pytest
+from airtrafficcontroller import ATC
+
+
+def make_atc(airspace, num_vertiports=30, num_uavs=20, seed=0):
+    random.seed(seed)
+    np.random.seed(seed)
+    atc = ATC(airspace)
+    atc.create_n_random_vertiports(num_vertiports)
+    atc.create_n_reg_uavs(num_uavs)
+    return atc
+
+
+def test_registries_match_lists(make_airspace):
+    atc = make_atc(make_airspace())
+    for uav in atc.reg_uav_list:
+        assert atc.get_uav(uav.id) is uav
+        assert atc.get_uav(str(uav.id)) is uav
+    for vertiport in atc.vertiports_in_airspace:
+        assert atc.get_vertiport(vertiport.id) is vertiport
+    with pytest.raises(RuntimeError):
+        atc.get_uav(-1)
+
+    atc.reset(10)
+    assert len(atc.uav_registry) == 10
+    for uav in atc.reg_uav_list:
+        assert atc.get_uav(uav.id) is uav
+    with pytest.raises(RuntimeError):
+        atc.get_uav(atc.uav_pool[-1].id)
+
+
+def test_landing_and_takeoff_bookkeeping(make_airspace):
+    atc = make_atc(make_airspace())
+    uav = atc.reg_uav_list[0]
+    landing_vertiport = uav.end_vertiport
+
+    atc._landing_procedure(uav)
+    assert landing_vertiport.uav_list == [uav]
+    assert uav.end_vertiport is not uav.start_vertiport
+
+    atc._update_start_vertiport_of_uav(landing_vertiport, uav)
+    atc._clearing_procedure(uav)
+    assert landing_vertiport.uav_list == []
+    # clearing a uav that is not parked is a no-op
+    atc._clearing_procedure(uav)
+    assert landing_vertiport.uav_list == []
+
+
+def test_start_end_vertiports_are_distinct(make_airspace):
+    atc = make_atc(make_airspace(), num_vertiports=30, num_uavs=29)
+    for seed in range(50):
+        np.random.seed(seed)
+        start_idx, end_idx = atc._sample_start_end_vertiports(29)
+        assert len(set(start_idx)) == len(set(end_idx)) == 29
+        assert not np.any(start_idx == end_idx)
+    # one vertiport is always left free for the auto_uav
+    with pytest.raises(RuntimeError):
+        atc._sample_start_end_vertiports(30)
+
+
+def test_fleet_vertiport_indices_follow_the_uavs(make_airspace):
+    atc = make_atc(make_airspace())
+
+    def assert_fleet_matches_uavs():
+        fleet_state = atc.fleet_state
+        for uav in atc.reg_uav_list:
+            assert fleet_state.start_vertiport[uav.fleet_index] == atc.vertiport_registry[uav.start_vertiport.id]
+            assert fleet_state.end_vertiport[uav.fleet_index] == atc.vertiport_registry[uav.end_vertiport.id]
+
+    assert_fleet_matches_uavs()
+    uav = atc.reg_uav_list[0]
+    landing_vertiport = uav.end_vertiport
+    atc._landing_procedure(uav)
+    atc._update_start_vertiport_of_uav(landing_vertiport, uav)
+    assert_fleet_matches_uavs()
+    # more UAVs than the pool, new slots are created
+    atc.reset(25)
+    assert_fleet_matches_uavs()
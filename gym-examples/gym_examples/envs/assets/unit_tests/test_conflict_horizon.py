@@ -0,0 +1,45 @@
+import numpy as np
+import random
+from airspace import SyntheticAirspace
+from detection import ConflictHorizon
+from fleet_state import FleetState
+from simulator_basic import Simulator_basic
+
+
+def run_simulator(airspace, conflict_horizon, num_steps=300, seed=0):
+    '''Fleet state and DAS inputs of every step'''
+    random.seed(seed)
+    np.random.seed(seed)
+    sim = Simulator_basic(airspace.location_name, 40, 30, sleep_time=0, total_timestep=0,
+                          airspace=airspace, conflict_horizon=conflict_horizon)
+    history = []
+    num_skipped = 0
+    for _ in range(num_steps):
+        if conflict_horizon:
+            num_skipped += np.count_nonzero(sim.conflict_horizon.next_check > sim.timestep)
+        sim.sim_step()
+        history.append({field:getattr(sim.fleet_state, field)[:len(sim.fleet_state)].copy() for field in FleetState.float_fields})
+        history[-1]['nearest'] = sim.neighbor_index.nearest('detection')[0]
+    return history, num_skipped
+
+
+def test_conflict_horizon_matches_checking_every_step():
+    airspace = SyntheticAirspace(num_hospitals=10, size=6000, buffer_radius=100)
+    every_step, _ = run_simulator(airspace, conflict_horizon=False)
+    scheduled, num_skipped = run_simulator(airspace, conflict_horizon=True)
+    # the run has to skip UAVs and have detections for the comparison to mean anything
+    assert num_skipped > 0
+    assert any((step['nearest'] >= 0).any() for step in every_step)
+    for expected, actual in zip(every_step, scheduled):
+        for key in expected:
+            np.testing.assert_array_equal(actual[key], expected[key])
+
+
+def test_safe_steps_is_conservative():
+    rng = np.random.default_rng(0)
+    clearance = rng.uniform(-10, 2000, 500)
+    speed = rng.uniform(0, 60, 500)
+    k = ConflictHorizon.safe_steps(clearance, speed, 60., 3., max_horizon=10**6)
+    closing = lambda k: k * (speed + 60.) + 3. * k * (k - 1)
+    assert ((k == 0) | (closing(k) < clearance)).all()
+    assert (closing(k + 1) >= clearance).all()
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+from airspace import SyntheticAirspace
+from detection import InteractionCache, closest_point_of_approach
+from simulator_basic import Simulator_basic
+
+
+def test_closest_point_of_approach_matches_sampled_separation():
+    rng = np.random.default_rng(0)
+    dx, dy = rng.uniform(-2000, 2000, (2, 300))
+    dvx, dvy = rng.uniform(-80, 80, (2, 300))
+    dvx[:10] = dvy[:10] = 0. # no relative motion
+    t_cpa, miss_distance = closest_point_of_approach(dx, dy, dvx, dvy, lookahead=30.)
+
+    t = np.linspace(0, 30, 30001)
+    separation = np.hypot(dx[:, None] + dvx[:, None] * t, dy[:, None] + dvy[:, None] * t)
+    assert np.all((t_cpa >= 0) & (t_cpa <= 30))
+    np.testing.assert_array_equal(t_cpa[:10], 0.)
+    # the analytic minimum is never above the sampled one, and at most a grid step of motion below it
+    assert np.all(miss_distance <= separation.min(axis=1) + 1e-9)
+    assert np.all(separation.min(axis=1) - miss_distance <= np.hypot(dvx, dvy) * 1e-3 + 1e-9)
+
+
+def test_predicted_conflicts_beyond_detection_range(make_fleet):
+    airspace = SyntheticAirspace(num_hospitals=5, size=10000, buffer_radius=100)
+    # 0 and 1 head-on 2000 m apart, 2 flies parallel to 0 at 1500 m, 3 crosses 0's path 15 s after 1 meets 0
+    fleet_state, _ = make_fleet(4)
+    fleet_state.x[:4], fleet_state.y[:4] = np.array([(0, 0), (2000, 0), (0, 1500), (1600, -1600)], dtype=float).T
+    fleet_state.speed[:4], fleet_state.heading_deg[:4] = 40, [0, 180, 0, 90]
+    cache = InteractionCache(fleet_state, airspace)
+    cache.update(0)
+    pair_i, pair_j, t_cpa, miss_distance = cache.predicted_conflicts('nmac', lookahead=60.)
+    conflicts = {(i, j): (t, d) for i, j, t, d in zip(pair_i, pair_j, t_cpa, miss_distance)}
+    # the pairs are far outside detection range now
+    assert not (cache.nearest >= 0).any()
+    assert set(conflicts) == {(0, 1), (0, 3)}
+    np.testing.assert_allclose(conflicts[(0, 1)], (25., 0.), atol=1e-9)
+    np.testing.assert_allclose(conflicts[(0, 3)], (40., 0.), atol=1e-9)
+
+    predicted, predicted_t_cpa = cache.predicted_nearest('nmac', lookahead=60.)
+    np.testing.assert_array_equal(predicted, [1, 0, -1, 0])
+    assert np.isclose(predicted_t_cpa[0], 25.) and np.isinf(predicted_t_cpa[2])
+
+    # nothing within a short horizon
+    assert len(cache.predicted_conflicts('nmac', lookahead=10.)[0]) == 0
+
+
+def test_atc_predicts_conflicts_every_step():
+    airspace = SyntheticAirspace(num_hospitals=10, size=6000, buffer_radius=100)
+    np.random.seed(0)
+    sim = Simulator_basic(airspace.location_name, 40, 30, sleep_time=0, total_timestep=0,
+                          airspace=airspace, conflict_lookahead=30.)
+    found = 0
+    for _ in range(100):
+        sim.sim_step()
+        conflicts = sim.atc.predicted_conflicts
+        assert set(conflicts) == {'uav_id_i', 'uav_id_j', 't_cpa', 'miss_distance'}
+        assert np.all(conflicts['miss_distance'] <= 300)
+        assert set(conflicts['uav_id_i']) <= set(sim.fleet_state.uav_id[:len(sim.fleet_state)])
+        found += len(conflicts['t_cpa'])
+    assert found > 0
+
+    with pytest.raises(RuntimeError):
+        Simulator_basic(airspace.location_name, 40, 30, sleep_time=0, total_timestep=0,
+                        airspace=airspace, conflict_horizon=True, conflict_lookahead=30.)
+
+
+def test_predicted_conflict_triggers_avoidance_before_detection():
+    airspace = SyntheticAirspace(num_hospitals=0, size=10000)
+    center_x, center_y = airspace.location_utm_gdf.geometry.iloc[0].centroid.coords[0]
+
+    def first_step(conflict_lookahead):
+        np.random.seed(0)
+        sim = Simulator_basic(airspace.location_name, 4, 2, sleep_time=0, total_timestep=0,
+                              airspace=airspace, conflict_lookahead=conflict_lookahead)
+        fleet_state = sim.fleet_state
+        # nearly head-on on the diagonal, about 2050 m apart, closing at 80 m/s: no detection overlap (1100 m) yet,
+        # but the closest point of approach is about 70 m away in 26 s
+        xy = np.array([(center_x, center_y), (center_x + 1500, center_y + 1400)])
+        heading_deg = np.array([45., -135.])
+        fleet_state.x[:2], fleet_state.y[:2] = xy.T
+        fleet_state.start_x[:2], fleet_state.start_y[:2] = xy.T
+        fleet_state.end_x[:2] = xy[:, 0] + 4000 * np.cos(np.deg2rad(heading_deg))
+        fleet_state.end_y[:2] = xy[:, 1] + 4000 * np.sin(np.deg2rad(heading_deg))
+        fleet_state.speed[:2], fleet_state.heading_deg[:2], fleet_state.ref_heading_deg[:2] = 40., heading_deg, heading_deg
+        sim.interaction_cache.clear()
+
+        sim.sim_step()
+        assert not (sim.interaction_cache.nearest >= 0).any()
+        return fleet_state.speed[:2], fleet_state.heading_deg[:2]
+
+    # without prediction both keep their heading and accelerate towards max_speed
+    speed, heading_deg = first_step(None)
+    np.testing.assert_allclose(speed, 41.)
+    np.testing.assert_allclose(heading_deg, [45., -135.])
+    # with prediction both brake and turn away (DAS acceleration -1, heading correction 25)
+    speed, heading_deg = first_step(30.)
+    np.testing.assert_allclose(speed, 39.)
+    np.testing.assert_allclose(heading_deg, [70., -110.])
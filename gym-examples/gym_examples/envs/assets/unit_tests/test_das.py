@@ -0,0 +1,47 @@
+import numpy as np
+from shapely import Point
+from das import Collision_controller, Zero_controller
+
+
+def random_batch(num_uavs, seed):
+    rng = np.random.default_rng(seed)
+    static_mask = rng.random(num_uavs) < 0.3
+    intruder_mask = rng.random(num_uavs) < 0.6
+    own_heading_deg = rng.uniform(-180, 180, num_uavs)
+    intruder_heading_deg = rng.uniform(-180, 180, num_uavs)
+    intruder_rel_pos = rng.uniform(-550, 550, (num_uavs, 2))
+    return static_mask, own_heading_deg, intruder_rel_pos, intruder_heading_deg, intruder_mask
+
+
+def scalar_state(i, static_mask, own_heading_deg, intruder_rel_pos, intruder_heading_deg, intruder_mask):
+    '''Builds the nested tuple/dict state get_action accepts'''
+    own_pos = Point(1000., 1000.)
+    if intruder_mask[i]:
+        dynamic_state = {'own_pos': own_pos,
+                         'own_current_heading': own_heading_deg[i],
+                         'intruder_pos': Point(own_pos.x + intruder_rel_pos[i, 0], own_pos.y + intruder_rel_pos[i, 1]),
+                         'intruder_current_heading': intruder_heading_deg[i]}
+    else:
+        dynamic_state = None
+    return (bool(static_mask[i]), own_heading_deg[i]), dynamic_state
+
+
+def test_get_action_batch_matches_get_action():
+    for controller in (Collision_controller(), Collision_controller(static_heading_correction=5), Zero_controller()):
+        for seed in range(5):
+            batch = random_batch(500, seed)
+            acceleration, heading_correction = controller.get_action_batch(*batch)
+            for i in range(500):
+                assert (acceleration[i], heading_correction[i]) == controller.get_action(scalar_state(i, *batch))
+
+
+def test_get_action_batch_avoidance_scenarios():
+    controller = Collision_controller()
+    # intruder up-right heading into quadrant 4 while own heading is in quadrant 1 -> turn left and slow down
+    acceleration, heading_correction = controller.get_action_batch(np.array([False, True]),
+                                                                   np.array([45., 45.]),
+                                                                   np.array([[100., 100.], [100., 100.]]),
+                                                                   np.array([-135., -135.]),
+                                                                   np.array([True, False]))
+    np.testing.assert_array_equal(acceleration, [-1, 0])
+    np.testing.assert_array_equal(heading_correction, [25, 25])
@@ -0,0 +1,45 @@
+import numpy as np
+import shapely
+
+
+def exact_signed_distance(airspace, points_xy):
+    buffers = airspace.location_utm_hospital_buffer.union_all()
+    points = shapely.points(points_xy)
+    inside = shapely.contains_xy(buffers, points_xy[:, 0], points_xy[:, 1])
+    return np.where(inside, -shapely.distance(buffers.boundary, points), shapely.distance(buffers, points))
+
+
+def test_distance_field_matches_exact_distance(tmp_path, make_airspace):
+    airspace = make_airspace()
+    airspace.cache_dir = False
+    airspace.obstacle_geometries = airspace.location_utm_hospital_buffer.values
+    airspace.build_distance_field(resolution=10.)
+
+    points_xy = np.random.default_rng(0).uniform(0, 1e4, (2000, 2))
+    distance, gradient = airspace.obstacle_distance(points_xy)
+    error = np.abs(distance - exact_signed_distance(airspace, points_xy))
+    assert np.median(error) < 5.
+    assert np.percentile(error, 99) < 20.
+
+    # gradient of a distance field has unit length away from the medial axis, and points away from the buffers
+    assert np.median(np.linalg.norm(gradient, axis=1)) > 0.95
+    step = points_xy + 20. * gradient
+    assert np.mean(exact_signed_distance(airspace, step) > exact_signed_distance(airspace, points_xy)) > 0.95
+
+    # memory-mapped field gives the same samples
+    airspace.cache_dir = str(tmp_path)
+    airspace.location_name, airspace.buffer_radius, airspace.tags = 'synthetic', 500, {}
+    airspace.build_distance_field(resolution=10.)
+    assert isinstance(airspace.distance_field, np.memmap)
+    assert np.allclose(airspace.obstacle_distance(points_xy)[0], distance)
+
+
+def test_distance_field_without_buffers_is_finite(make_airspace):
+    airspace = make_airspace(num_hospitals=0)
+    airspace.cache_dir = False
+    airspace.obstacle_geometries = airspace.location_utm_hospital_buffer.values
+    airspace.build_distance_field(resolution=100.)
+
+    distance, gradient = airspace.obstacle_distance(np.random.default_rng(0).uniform(-1e3, 1.1e4, (100, 2)))
+    np.testing.assert_allclose(distance, np.hypot(1e4, 1e4), rtol=1e-6)
+    np.testing.assert_array_equal(gradient, 0.)
@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+import fleet_kernel
+from fleet_kernel import FleetKernel
+from fleet_state import FleetState
+from uav_basic import UAV_Basic
+
+
+def python_loop(function):
+    '''The plain Python loop behind a kernel, compiled or not.'''
+    return getattr(function, 'py_func', function)
+
+
+def das_inputs(fleet_state, rng):
+    '''Random static mask and nearest intruders, every UAV is the nearest intruder of some other UAV now and then.'''
+    n = len(fleet_state)
+    static_mask = rng.random(n) < 0.2
+    nearest = np.where(rng.random(n) < 0.5, rng.integers(0, n, n), -1)
+    nearest[nearest == np.arange(n)] = -1
+    return static_mask, nearest
+
+
+def object_step(uav_list, static_mask, nearest):
+    '''Reference object engine: UAV_Basic.get_action on per-UAV states, then the UAV_Basic update methods.'''
+    actions = []
+    for uav in uav_list:
+        i = uav.fleet_index
+        dynamic_state = None
+        if nearest[i] >= 0:
+            intruder = uav_list[nearest[i]]
+            dynamic_state = {'own_pos':uav.current_position,
+                             'intruder_pos':intruder.current_position,
+                             'own_current_heading':uav.current_heading_deg,
+                             'intruder_current_heading':intruder.current_heading_deg}
+        actions.append(uav.get_action(((bool(static_mask[i]), uav.current_heading_deg), dynamic_state)))
+
+    for uav, (acceleration, heading_correction) in zip(uav_list, actions):
+        uav._update_position(d_t=1)
+        uav._update_speed(d_t=1, acceleration_from_controller=acceleration)
+        uav._update_theta_d(heading_correction)
+        uav._update_ref_final_heading()
+    return np.array(actions, dtype=float).reshape(-1, 2)
+
+
+def loop_step(fleet_state, static_mask, nearest):
+    controller = UAV_Basic.das_controller
+    n = len(fleet_state)
+    acceleration, heading_correction = np.zeros(n), np.zeros(n)
+    python_loop(fleet_kernel._fleet_step_loop)(n, 1., static_mask, nearest,
+                                               fleet_state.x, fleet_state.y, fleet_state.speed, fleet_state.max_speed, fleet_state.max_acceleration,
+                                               fleet_state.heading_deg, fleet_state.ref_heading_deg, fleet_state.end_x, fleet_state.end_y,
+                                               float(controller.static_heading_correction),
+                                               controller.heading_correction_table, controller.acceleration_table,
+                                               acceleration, heading_correction)
+    return np.column_stack((acceleration, heading_correction))
+
+
+def test_fleet_step_loop_matches_object_engine(make_fleet):
+    for seed in range(3):
+        fleet_state, uav_list = make_fleet(40, seed, size=3000.)
+        rng = np.random.default_rng(seed)
+        for _ in range(30):
+            static_mask, nearest = das_inputs(fleet_state, rng)
+            initial_state = {field: getattr(fleet_state, field).copy() for field in FleetState.float_fields}
+
+            object_actions = object_step(uav_list, static_mask, nearest)
+            object_state = {field: getattr(fleet_state, field).copy() for field in FleetState.float_fields}
+
+            for field, array in initial_state.items():
+                getattr(fleet_state, field)[:] = array
+            loop_actions = loop_step(fleet_state, static_mask, nearest)
+
+            np.testing.assert_array_equal(loop_actions, object_actions)
+            for field in FleetState.float_fields:
+                np.testing.assert_allclose(getattr(fleet_state, field), object_state[field], atol=1e-9)
+
+
+def assert_kernel_matches_numpy_path(fleet_state, kernel, seed, num_steps=30):
+    '''Steps kernel and the NumPy path from the same fleet state and inputs, actions and fleet state must match element-wise.'''
+    rng = np.random.default_rng(seed)
+    numpy_kernel = FleetKernel(fleet_state, UAV_Basic.das_controller, use_jit=False)
+    for _ in range(num_steps):
+        static_mask, nearest = das_inputs(fleet_state, rng)
+        initial_state = {field: getattr(fleet_state, field).copy() for field in FleetState.float_fields}
+
+        numpy_actions = np.column_stack(numpy_kernel.step(1, static_mask, nearest))
+        numpy_state = {field: getattr(fleet_state, field).copy() for field in FleetState.float_fields}
+
+        for field, array in initial_state.items():
+            getattr(fleet_state, field)[:] = array
+        actions = np.column_stack(kernel.step(1, static_mask, nearest))
+
+        np.testing.assert_array_equal(actions, numpy_actions)
+        for field in FleetState.float_fields:
+            np.testing.assert_allclose(getattr(fleet_state, field), numpy_state[field], atol=1e-9)
+
+
+def test_fleet_kernel_matches_numpy_path(make_fleet):
+    '''FleetKernel with the default backend (compiled when numba is installed) against the NumPy path.'''
+    fleet_state, _ = make_fleet(60, seed=4, size=3000.)
+    assert_kernel_matches_numpy_path(fleet_state, FleetKernel(fleet_state, UAV_Basic.das_controller), seed=4)
+
+
+def test_compiled_fleet_kernel_matches_numpy_path(make_fleet):
+    '''The numba compiled loop against the NumPy path, over several fleets.'''
+    pytest.importorskip('numba')
+    for seed in range(3):
+        fleet_state, _ = make_fleet(60, seed=seed, size=3000.)
+        kernel = FleetKernel(fleet_state, UAV_Basic.das_controller, use_jit=True)
+        assert kernel.use_jit
+        assert_kernel_matches_numpy_path(fleet_state, kernel, seed=seed)
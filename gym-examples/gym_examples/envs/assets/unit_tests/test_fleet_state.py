@@ -0,0 +1,52 @@
+import numpy as np
+from shapely import Point
+from fleet_state import FleetState, heading_controller
+
+
+def test_uav_is_view_into_fleet_state(make_fleet):
+    fleet_state, uav_list = make_fleet(10, seed=0)
+    assert len(fleet_state) == 10 and fleet_state.capacity >= 10
+
+    uav = uav_list[7]
+    uav.current_position = Point(12., 34.)
+    assert tuple(fleet_state.position[uav.fleet_index]) == (12., 34.)
+    fleet_state.heading_deg[uav.fleet_index] = 45.
+    assert uav.current_heading_deg == 45.
+    assert np.isclose(uav.current_heading_radians, np.pi / 4)
+
+
+def test_step_all_matches_uav_step_methods(make_fleet):
+    for seed in range(3):
+        fleet_state, uav_list = make_fleet(30, seed)
+        rng = np.random.default_rng(seed)
+        acceleration = rng.choice([0., 0., -1.], size=len(uav_list))
+        heading_correction = rng.choice([0., 0., 25., -25.], size=len(uav_list))
+
+        for _ in range(20):
+            initial_state = {field: getattr(fleet_state, field).copy() for field in FleetState.float_fields}
+
+            for uav in uav_list:
+                uav._update_position(d_t=1)
+                uav._update_speed(d_t=1, acceleration_from_controller=acceleration[uav.fleet_index])
+                uav._update_theta_d(heading_correction[uav.fleet_index])
+                uav._update_ref_final_heading()
+            object_state = {field: getattr(fleet_state, field).copy() for field in FleetState.float_fields}
+
+            for field, array in initial_state.items():
+                getattr(fleet_state, field)[:] = array
+            fleet_state.step_all(d_t=1, acceleration=acceleration, heading_correction=heading_correction)
+
+            for field in FleetState.float_fields:
+                np.testing.assert_allclose(getattr(fleet_state, field), object_state[field], atol=1e-9)
+
+
+def test_heading_controller_rate_limits_and_wrapping():
+    heading_deg = np.array([0., 0., 0., 170., -170., 179.5, 10.])
+    ref_heading_deg = np.array([90., 10., 0.3, -150., 160., -179.9, 10.])
+    heading_correction = np.array([0., 0., 0., 0., 0., 0., -25.])
+
+    new_heading_deg = heading_controller(heading_deg, ref_heading_deg, heading_correction)
+
+    # 20 degree/s turn, 1 degree/s within 20 degree, no turn within 0.5 degree,
+    # shorter turn across +-180, DAS correction over-rides the controller
+    np.testing.assert_allclose(new_heading_deg, [20., 1., 0., -170., 170., -179.5, -15.])
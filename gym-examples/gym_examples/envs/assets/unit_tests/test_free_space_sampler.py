@@ -0,0 +1,26 @@
+import numpy as np
+import shapely
+from shapely import box
+
+
+def test_samples_are_outside_hospital_buffers(make_airspace):
+    np.random.seed(0)
+    airspace = make_airspace()
+    samples = airspace.sample_free_space(5000)
+    assert samples.shape == (5000, 2)
+
+    buffers = airspace.location_utm_hospital_buffer.union_all()
+    assert not shapely.contains_xy(buffers, samples[:, 0], samples[:, 1]).any()
+    assert shapely.contains_xy(airspace.location_utm_gdf.iloc[0,0].buffer(1e-6), samples[:, 0], samples[:, 1]).all()
+
+
+def test_samples_are_area_weighted(make_airspace):
+    np.random.seed(1)
+    airspace = make_airspace()
+    samples = airspace.sample_free_space(40000)
+    free_space = airspace.location_utm_gdf.iloc[0,0].difference(airspace.location_utm_hospital_buffer.union_all())
+
+    for quadrant in (box(0, 0, 5e3, 5e3), box(5e3, 0, 1e4, 5e3), box(0, 5e3, 5e3, 1e4), box(5e3, 5e3, 1e4, 1e4)):
+        expected_fraction = quadrant.intersection(free_space).area / free_space.area
+        sampled_fraction = shapely.contains_xy(quadrant, samples[:, 0], samples[:, 1]).mean()
+        assert abs(sampled_fraction - expected_fraction) < 0.015
@@ -0,0 +1,56 @@
+import numpy as np
+from airspace import SyntheticAirspace
+from detection import InteractionCache, fleet_das_inputs, intruder_mask
+
+
+def test_cache_state_matches_uav_get_state(make_fleet):
+    airspace = SyntheticAirspace(num_hospitals=10, size=3000, buffer_radius=100)
+    fleet_state, uav_list = make_fleet(40, seed=0, size=3000., airspace=airspace)
+    cache = InteractionCache(fleet_state, airspace)
+    assert cache.update(0)
+    # a second consumer of the same tick reuses the cache
+    assert not cache.update(0)
+
+    for uav in uav_list:
+        uav.get_intruder_uav_list(uav_list)
+        expected_static, expected_dynamic = uav.get_state()
+        static, dynamic = uav.get_state(cache)
+        assert static == expected_static
+        if expected_dynamic is None:
+            assert dynamic is None
+            continue
+        assert dynamic['intruder_id'] == expected_dynamic['intruder_id']
+        assert dynamic['intruder_pos'].equals(expected_dynamic['intruder_pos'])
+        assert dynamic['intruder_current_heading'] == expected_dynamic['intruder_current_heading']
+
+
+def test_point_neighbors_matches_intruder_mask(make_fleet):
+    airspace = SyntheticAirspace(num_hospitals=10, size=3000, buffer_radius=100)
+    fleet_state, _ = make_fleet(60, seed=1, size=3000., airspace=airspace)
+    cache = InteractionCache(fleet_state, airspace)
+    cache.update(0)
+    rng = np.random.default_rng(1)
+    for own_xy in rng.uniform(0, 3000, (20, 2)):
+        expected = np.flatnonzero(intruder_mask(own_xy, fleet_state.position, 550, 550))
+        distance = np.hypot(*(fleet_state.position[expected] - own_xy).T)
+        expected = expected[np.lexsort((expected, distance))]
+        neighbors, _ = cache.point_neighbors(own_xy, 550, 550)
+        np.testing.assert_array_equal(neighbors, expected)
+
+
+def test_fleet_das_inputs_are_built_on_first_use(make_fleet, monkeypatch):
+    airspace = SyntheticAirspace(num_hospitals=10, size=3000, buffer_radius=100)
+    fleet_state, _ = make_fleet(40, seed=2, size=3000., airspace=airspace)
+    cache = InteractionCache(fleet_state, airspace)
+    calls = []
+    monkeypatch.setattr(airspace, 'query_obstacles_within', lambda *args: calls.append(args) or SyntheticAirspace.query_obstacles_within(airspace, *args))
+    cache.update(0)
+    # point queries, e.g. the observation after reset, skip the fleet wide building check
+    cache.point_neighbors((1500., 1500.), 550, 550)
+    cache.point_obstacles((1500., 1500.), 550)
+    assert len(calls) == 1
+
+    expected_static_mask, expected_nearest = fleet_das_inputs(fleet_state, airspace, cache.neighbor_index)
+    np.testing.assert_array_equal(cache.static_mask, expected_static_mask)
+    np.testing.assert_array_equal(cache.nearest, expected_nearest)
+    assert cache.nearest_distance is cache.nearest_distance
@@ -0,0 +1,83 @@
+import numpy as np
+from shapely import Point
+from uav import UAV
+from uav_basic import UAV_Basic
+from vertiport import Vertiport
+from fleet_state import FleetState
+from detection import NeighborIndex
+
+
+def shapely_intruder_set(own_uav, uav_list, radius):
+    '''Reference path, the buffered polygon intersection that the analytic check replaced'''
+    return {other_uav.id for other_uav in uav_list
+            if other_uav.id != own_uav.id and own_uav.uav_polygon(radius).intersects(other_uav.uav_polygon(radius))}
+
+
+def make_uav_list(uav_class, num_uavs, seed):
+    rng = np.random.default_rng(seed)
+    start_v = Vertiport(Point(0, 0))
+    end_v = Vertiport(Point(5000, 5000))
+    uav_list = [uav_class(start_v, end_v) for _ in range(num_uavs)]
+    for uav in uav_list:
+        uav.current_position = Point(rng.uniform(0, 4000, 2))
+    return uav_list
+
+
+def near_radius_boundary(own_uav, uav_list, radius, tolerance=2.):
+    '''Buffered polygons are inscribed in the circles, pairs this close to 2r can disagree'''
+    return any(abs(own_uav.get_intruder_distance(other_uav) - 2 * radius) < tolerance
+               for other_uav in uav_list if other_uav.id != own_uav.id)
+
+
+def test_circle_intruder_list_matches_shapely():
+    for uav_class in (UAV_Basic, UAV):
+        for seed in range(2):
+            uav_list = make_uav_list(uav_class, 25, seed)
+            for radius_str, radius in (('detection', 550), ('nmac', 150)):
+                for uav in uav_list:
+                    if near_radius_boundary(uav, uav_list, radius):
+                        continue
+                    uav.get_intruder_uav_list(uav_list, radius_str)
+                    assert {intruder.id for intruder in uav.intruder_uav_list} == shapely_intruder_set(uav, uav_list, radius)
+
+
+def test_touching_circles_are_intruders():
+    start_v = Vertiport(Point(0, 0))
+    end_v = Vertiport(Point(5000, 5000))
+    uav_1 = UAV_Basic(start_v, end_v)
+    uav_2 = UAV_Basic(start_v, end_v)
+    uav_2.current_position = Point(2 * uav_1.nmac_radius, 0)
+
+    uav_1.get_intruder_uav_list([uav_1, uav_2], 'nmac')
+    assert uav_1.intruder_uav_list == [uav_2]
+
+    uav_2.current_position = Point(2 * uav_1.nmac_radius + 1, 0)
+    uav_1.get_intruder_uav_list([uav_1, uav_2], 'nmac')
+    assert uav_1.intruder_uav_list == []
+
+
+def test_neighbor_index_matches_full_scan():
+    for seed in range(3):
+        rng = np.random.default_rng(seed)
+        fleet_state = FleetState()
+        start_v = Vertiport(Point(0, 0))
+        end_v = Vertiport(Point(5000, 5000))
+        uav_list = [UAV_Basic(start_v, end_v, fleet_state=fleet_state) for _ in range(120)]
+        for uav in uav_list:
+            uav.current_position = Point(rng.uniform(0, 8000, 2))
+
+        neighbor_index = NeighborIndex(fleet_state)
+        for radius_str in ('detection', 'nmac', 'collision'):
+            nearest, nearest_distance = neighbor_index.nearest(radius_str)
+            for uav in uav_list:
+                uav.get_intruder_uav_list(uav_list, radius_str)
+                full_scan = uav.intruder_uav_list
+                uav.get_intruder_uav_list(uav_list, radius_str, neighbor_index=neighbor_index)
+                assert uav.intruder_uav_list == full_scan
+
+                if full_scan:
+                    distance = [uav.get_intruder_distance(intruder) for intruder in full_scan]
+                    assert nearest[uav.fleet_index] == full_scan[int(np.argmin(distance))].fleet_index
+                    assert np.isclose(nearest_distance[uav.fleet_index], min(distance))
+                else:
+                    assert nearest[uav.fleet_index] == -1
@@ -0,0 +1,85 @@
+import json
+import os
+import sys
+import numpy as np
+from profiling import StepProfiler
+from detection import NeighborIndex
+
+ENVS_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, ENVS_DIR)
+
+from airspace import SyntheticAirspace
+from uam_uav import Uam_Uav_Env
+
+
+def test_disabled_profiler_records_nothing():
+    profiler = StepProfiler()
+    with profiler.phase('controller'):
+        pass
+    profiler.count('pairwise_checks', 10)
+    assert profiler.end_step() is None
+    assert profiler.total == {'steps':0, 'phase_s':{}, 'counters':{}}
+    assert profiler.info() == {}
+
+
+def test_step_and_episode_aggregation(tmp_path):
+    jsonl_path = tmp_path / 'profile.jsonl'
+    profiler = StepProfiler(enabled=True, jsonl_path=str(jsonl_path))
+    for episode_steps in (3, 2):
+        for _ in range(episode_steps):
+            with profiler.phase('controller'):
+                with profiler.phase('integration'):
+                    pass
+            profiler.count('pairwise_checks', 10)
+            profiler.count('atc_landings')
+            step = profiler.end_step()
+            assert step['counters'] == {'pairwise_checks':10, 'atc_landings':1}
+            assert step['phase_s']['controller'] >= step['phase_s']['integration'] >= 0
+        episode = profiler.end_episode()
+        assert episode['steps'] == episode_steps
+        assert episode['counters']['pairwise_checks'] == 10 * episode_steps
+
+    assert profiler.total['steps'] == 5 and profiler.num_episodes == 2
+    profiler.disable()
+    records = [json.loads(line) for line in jsonl_path.read_text().splitlines()]
+    assert [record['kind'] for record in records] == ['step'] * 3 + ['episode'] + ['step'] * 2 + ['episode']
+
+    prometheus_path = tmp_path / 'uam.prom'
+    profiler.write_prometheus(str(prometheus_path))
+    prometheus_text = prometheus_path.read_text()
+    assert 'uam_steps_total 5\n' in prometheus_text
+    assert 'uam_events_total{counter="pairwise_checks"} 50\n' in prometheus_text
+    assert 'uam_phase_seconds_total{phase="controller"}' in prometheus_text
+
+
+def test_neighbor_index_counts_pairwise_checks(make_fleet):
+    import profiling
+    fleet_state, _ = make_fleet(50, size=3000.)
+    profiling.profiler.enable()
+    try:
+        neighbor_index = NeighborIndex(fleet_state)
+        step = profiling.profiler.end_step()
+    finally:
+        profiling.profiler.disable()
+    assert step['counters']['pairwise_checks'] == len(neighbor_index.pair_i) > 0
+
+
+def test_enable_closes_the_previous_jsonl_file(tmp_path):
+    profiler = StepProfiler(enabled=True, jsonl_path=str(tmp_path / 'first.jsonl'))
+    first_file = profiler.jsonl_file
+    profiler.enable(str(tmp_path / 'second.jsonl'))
+    assert first_file.closed and not profiler.jsonl_file.closed
+    profiler.disable()
+
+
+def test_env_profiling_is_scoped_to_the_env_that_enabled_it():
+    airspace = SyntheticAirspace(num_hospitals=10, size=6000, buffer_radius=200)
+    profiled_env = Uam_Uav_Env(None, 10, 6, airspace=airspace, profile=True)
+    env = Uam_Uav_Env(None, 10, 6, airspace=airspace)
+    for each_env in (profiled_env, env):
+        each_env.reset(seed=0)
+    assert 'profile' in profiled_env.step(np.zeros(2))[-1]
+    assert 'profile' not in env.step(np.zeros(2))[-1]
+
+    profiled_env.close()
+    assert not profiled_env.profiler.enabled
@@ -0,0 +1,113 @@
+import os
+import json
+import numpy as np
+import pytest
+from detection import NeighborIndex
+from recorder import TrajectoryRecorder
+
+
+def make_recorder_fleet(make_fleet):
+    '''50 UAVs in a 3 km square, with a small detection radius so only some UAVs have intruders'''
+    fleet_state, _ = make_fleet(50, size=3000.)
+    fleet_state.detection_radius[:len(fleet_state)] = 150
+    return fleet_state
+
+
+def record_run(recorder, fleet_state, num_steps=30):
+    '''Records num_steps steps, returns the recorded x positions and intruder ids of every step'''
+    neighbor_index = NeighborIndex(fleet_state)
+    expected_x, expected_intruder_id = [], []
+    for step in range(num_steps):
+        neighbor_index.rebuild()
+        acceleration = np.full(len(fleet_state), 0.5 * step)
+        recorder.record_step(step, fleet_state, neighbor_index, acceleration=acceleration)
+        nearest_k = neighbor_index.nearest_k(recorder.max_intruders)
+        expected_x.append(fleet_state.x[:len(fleet_state)].copy())
+        expected_intruder_id.append(np.where(nearest_k >= 0, fleet_state.uav_id[nearest_k], -1))
+        fleet_state.step_all(1)
+    recorder.close()
+    return np.concatenate(expected_x), np.concatenate(expected_intruder_id)
+
+
+@pytest.mark.parametrize('background_thread', [False, True])
+def test_memmap_recorder_round_trip(tmp_path, background_thread, make_fleet):
+    fleet_state = make_recorder_fleet(make_fleet)
+    # 7 steps per chunk, chunks end mid-run and the last chunk is partial
+    recorder = TrajectoryRecorder(str(tmp_path), chunk_rows=7 * len(fleet_state), background_thread=background_thread)
+    expected_x, expected_intruder_id = record_run(recorder, fleet_state)
+
+    with open(os.path.join(tmp_path, 'meta.json')) as meta_file:
+        meta = json.load(meta_file)
+    assert meta['num_rows'] == 30 * 50 and meta['num_steps'] == 30
+
+    x = np.memmap(os.path.join(tmp_path, 'x.bin'), dtype=meta['columns']['x']['dtype'], mode='r')
+    intruder_id = np.memmap(os.path.join(tmp_path, 'intruder_id.bin'), dtype=meta['columns']['intruder_id']['dtype'], mode='r').reshape(-1, 4)
+    step_offsets = np.fromfile(os.path.join(tmp_path, 'step_offsets.bin'), dtype=np.int64)
+    assert np.array_equal(x, expected_x)
+    assert np.array_equal(intruder_id, expected_intruder_id)
+    assert (intruder_id >= 0).any()
+    assert np.array_equal(step_offsets, np.arange(31) * 50)
+
+
+def test_parquet_recorder_round_trip(tmp_path, make_fleet):
+    pq = pytest.importorskip('pyarrow.parquet')
+    fleet_state = make_recorder_fleet(make_fleet)
+    path = str(tmp_path / 'run.parquet')
+    expected_x, expected_intruder_id = record_run(TrajectoryRecorder(path, backend='parquet', chunk_rows=500), fleet_state)
+
+    table = pq.read_table(path)
+    assert pq.ParquetFile(path).num_row_groups == 3
+    assert np.array_equal(table['x'].to_numpy(), expected_x)
+    assert np.array_equal(np.stack(table['intruder_id'].to_numpy(zero_copy_only=False)), expected_intruder_id)
+    assert np.array_equal(table['acceleration'].to_numpy()[::50], 0.5 * np.arange(30))
+
+
+def test_recorded_run_seek_and_decimation(tmp_path, make_fleet):
+    from replay import RecordedRun
+    fleet_state = make_recorder_fleet(make_fleet)
+    recorder = TrajectoryRecorder(str(tmp_path), chunk_rows=300, metadata={'location_name':'synthetic'})
+    expected_x, _ = record_run(recorder, fleet_state)
+    expected_x = expected_x.reshape(30, 50)
+
+    run = RecordedRun(str(tmp_path))
+    assert len(run) == 30 and run.metadata == {'location_name':'synthetic'}
+    assert isinstance(run.columns['x'], np.memmap)
+    assert np.array_equal(run[17]['x'], expected_x[17])
+    assert np.array_equal(run[-1]['x'], expected_x[-1])
+    assert np.all(run[17]['step'] == 17)
+    with pytest.raises(IndexError):
+        run[30]
+
+    frames = list(run.frames(start=3, stop=25, decimation=5))
+    assert [int(frame['step'][0]) for frame in frames] == [3, 8, 13, 18, 23]
+
+
+def test_replay_of_a_synthetic_recording(tmp_path, monkeypatch):
+    import random
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import airspace
+    import replay
+    from simulator_basic import Simulator_basic
+    synthetic_airspace = airspace.SyntheticAirspace(num_hospitals=20)
+    random.seed(0)
+    np.random.seed(0)
+    sim = Simulator_basic(synthetic_airspace.location_name, 12, 10, sleep_time=0, total_timestep=20, airspace=synthetic_airspace)
+    sim.RUN_SIMULATOR(None, None, None, None, None, recorder=TrajectoryRecorder(str(tmp_path)))
+
+    # the replay never geocodes, the airspace comes from the recorded geometry
+    def no_network(self):
+        raise RuntimeError('replay touched the network')
+    monkeypatch.setattr(airspace.Airspace, '_load_from_network', no_network)
+    scene = replay.ReplayScene(replay.RecordedRun(str(tmp_path)))
+    assert scene.airspace.location_utm_gdf.geometry.iloc[0].equals(synthetic_airspace.location_utm_gdf.geometry.iloc[0])
+    assert scene.airspace.location_utm_hospital_buffer.geom_equals(synthetic_airspace.location_utm_hospital_buffer.reset_index(drop=True)).all()
+    assert scene.airspace.location_utm_gdf.crs == synthetic_airspace.location_utm_gdf.crs
+
+    run = replay.RecordedRun(str(tmp_path))
+    assert len(run) == 20
+    assert np.all((run[0]['start_vertiport'] >= 0) & (run[0]['end_vertiport'] < 12))
+    replay.replay(str(tmp_path), decimation=5)
+    replay.replay(str(tmp_path), stop=3, airspace=synthetic_airspace)
+    plt.close('all')
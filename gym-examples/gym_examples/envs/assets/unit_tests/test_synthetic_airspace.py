@@ -0,0 +1,44 @@
+import os
+import numpy as np
+import random
+import shapely
+from airspace import SyntheticAirspace
+from simulator_basic import Simulator_basic
+
+
+def test_synthetic_airspace_is_reproducible():
+    airspace = SyntheticAirspace(num_hospitals=40, seed=3)
+    same_airspace = SyntheticAirspace(num_hospitals=40, seed=3)
+    assert len(airspace.location_utm_hospital) == 40
+    assert airspace.location_utm_hospital.geometry.geom_equals(same_airspace.location_utm_hospital.geometry).all()
+
+    boundary = airspace.location_utm_gdf.iloc[0,0]
+    centroids = shapely.get_coordinates(airspace.location_utm_hospital.centroid)
+    assert shapely.contains_xy(boundary, centroids[:, 0], centroids[:, 1]).all()
+
+
+def test_simulator_runs_on_synthetic_airspace():
+    random.seed(0)
+    np.random.seed(0)
+    sim = Simulator_basic('unused', 12, 10, sleep_time=0, total_timestep=20, airspace=SyntheticAirspace(num_hospitals=20))
+    sim.RUN_SIMULATOR(None, None, None, None, None)
+    assert sim.timestep == 20
+    assert np.all(sim.fleet_state.speed[:10] > 0)
+
+
+def test_incomplete_or_corrupt_cache_entries_are_misses(tmp_path):
+    airspace = SyntheticAirspace(num_hospitals=20, seed=1, cache_dir=str(tmp_path))
+    # no temporary files are left behind, the meta file marks a complete entry
+    assert not [path for path in os.listdir(tmp_path) if path.endswith('.tmp')]
+    assert airspace._load_from_cache()
+
+    # a truncated layer, e.g. from a crashed writer, is a miss and is rewritten on the next start
+    with open(airspace._cache_path('hospital'), 'wb') as layer_file:
+        layer_file.write(b'PAR1')
+    assert not airspace._load_from_cache()
+    SyntheticAirspace(num_hospitals=20, seed=1, cache_dir=str(tmp_path))
+    assert airspace._load_from_cache()
+
+    # layers without the meta file are an incomplete entry
+    os.remove(airspace._meta_path())
+    assert not airspace._load_from_cache()
@@ -0,0 +1,124 @@
+import os
+import sys
+import numpy as np
+from gymnasium.utils.env_checker import check_env
+
+ENVS_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, ENVS_DIR)
+
+from airspace import SyntheticAirspace
+from uam_uav import Uam_Uav_Env
+
+
+def make_env(num_intruders):
+    airspace = SyntheticAirspace(num_hospitals=10, size=6000, buffer_radius=200)
+    return Uam_Uav_Env(None, 10, 6, airspace=airspace, num_intruders=num_intruders)
+
+
+def test_observation_is_a_fixed_shape_box():
+    env = make_env(num_intruders=3)
+    obs, _ = env.reset(seed=0)
+    assert env.observation_space.shape == (6 + 6*3 + 4,)
+    assert obs.dtype == np.float32 and obs.shape == env.observation_space.shape
+    assert env.observation_space.contains(obs)
+    # every observation is its own array, a stored observation is not overwritten by the next step
+    stored_obs = obs.copy()
+    next_obs, *_ = env.step(np.zeros(2))
+    assert next_obs is not obs
+    np.testing.assert_array_equal(obs, stored_obs)
+
+
+def test_env_passes_gymnasium_env_checker():
+    check_env(make_env(num_intruders=3), skip_render_check=True)
+
+
+def test_intruders_are_the_nearest_with_masked_padding():
+    env = make_env(num_intruders=4)
+    env.reset(seed=1)
+    auto_uav = env.auto_uav
+    fleet_state = env.atc.fleet_state
+    own_x, own_y = auto_uav.current_position.x, auto_uav.current_position.y
+
+    # two regular UAVs inside detection radius, the farther one listed first, the rest far away
+    fleet_state.x[:len(fleet_state)], fleet_state.y[:len(fleet_state)] = own_x + 5000, own_y + 5000
+    fleet_state.x[0], fleet_state.y[0] = own_x + 300, own_y
+    fleet_state.x[1], fleet_state.y[1] = own_x, own_y - 100
+    fleet_state.speed[1], fleet_state.heading_deg[1] = 10., 90.
+    # UAVs moved other than by stepping
+    env.interaction_cache.clear()
+
+    obs = env._get_obs()
+    intruders = obs[env.observation_slices()['intruders']].reshape(4, len(env.intruder_features))
+    assert list(env.intruder_index) == [1, 0, -1, -1]
+    np.testing.assert_array_equal(intruders[:, 0], [1, 1, 0, 0])
+    np.testing.assert_allclose(intruders[0, 1:3], [0, -100], atol=1e-3)
+    np.testing.assert_allclose(intruders[1, 1:3], [300, 0], atol=1e-3)
+    # padding rows are all zero
+    assert not intruders[2:].any()
+
+    heading_rad = np.deg2rad(auto_uav.current_heading_deg)
+    own_velocity = auto_uav.current_speed * np.array([np.cos(heading_rad), np.sin(heading_rad)])
+    np.testing.assert_allclose(intruders[0, 3:5], np.array([0., 10.]) - own_velocity, atol=1e-3)
+    assert intruders[0, 5] == 90.
+    assert env.get_reward(obs) <= -1.
+
+
+def test_human_render_without_a_figure():
+    import matplotlib
+    matplotlib.use('Agg')
+    airspace = SyntheticAirspace(num_hospitals=10, size=6000, buffer_radius=200)
+    env = Uam_Uav_Env(None, 10, 6, airspace=airspace, render_mode='human', sleep_time=0)
+    env.reset(seed=0)
+    env.render()
+    renderer = env.renderer
+    env.step(np.zeros(2))
+    env.render()
+    # the env's own figure is reused
+    assert env.renderer is renderer
+
+
+def test_observation_without_hospitals_is_in_the_observation_space():
+    env = Uam_Uav_Env(None, 10, 6, airspace=SyntheticAirspace(num_hospitals=0, size=6000))
+    obs, _ = env.reset(seed=0)
+    assert np.all(np.isfinite(obs))
+    assert env.observation_space.contains(obs)
+
+
+def test_obstacle_features_are_read_from_the_interaction_cache():
+    env = make_env(num_intruders=2)
+    obs, _ = env.reset(seed=2)
+    own_xy = np.array([[env.auto_uav.current_position.x, env.auto_uav.current_position.y]])
+    distance, gradient = env.airspace.obstacle_distance(own_xy)
+    expected_intersection = env.airspace.query_obstacles_within(own_xy, np.array([env.auto_uav.detection_radius]))[0]
+    np.testing.assert_allclose(obs[env.observation_slices()['obstacles']],
+                               [expected_intersection, distance[0], gradient[0, 0], gradient[0, 1]], rtol=1e-6)
+
+    # the static object check, observation and reward of one tick share a single lookup
+    queries = []
+    query_obstacles_within = env.airspace.query_obstacles_within
+    env.airspace.query_obstacles_within = lambda *args: queries.append(args) or query_obstacles_within(*args)
+    obs, *_ = env.step(np.zeros(2))
+    intersection_with_building, _ = env.get_observation_static_obj()
+    env._get_obs()
+    assert intersection_with_building == bool(obs[env.observation_slices()['obstacles']][0])
+    # one fleet wide query from the cache update, one for the auto_uav
+    assert len(queries) == 2
+
+
+def test_reset_seeds_only_the_env_generator():
+    import random
+    env = make_env(num_intruders=3)
+    random.seed(123)
+    np.random.seed(123)
+    python_state, numpy_state = random.getstate(), np.random.get_state()
+
+    obs, _ = env.reset(seed=5)
+    for _ in range(50):
+        env.step(np.zeros(2))
+    assert random.getstate() == python_state
+    assert all(np.array_equal(a, b) for a, b in zip(np.random.get_state(), numpy_state))
+
+    # the same seed gives the same scenario
+    np.testing.assert_array_equal(env.reset(seed=5)[0], obs)
+    np.testing.assert_array_equal(env.reset(seed=5, options={'resample_vertiports': True})[0],
+                                  env.reset(seed=5, options={'resample_vertiports': True})[0])
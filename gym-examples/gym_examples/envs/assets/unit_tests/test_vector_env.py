@@ -0,0 +1,65 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+ENVS_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, ENVS_DIR)
+
+from airspace import SyntheticAirspace
+from uam_vector_env import SharedMemoryVectorEnv, make_uam_env_pool, make_uam_vector_env
+
+
+def test_shared_memory_vector_env_steps_and_autoresets():
+    airspace = SyntheticAirspace(num_hospitals=10, size=6000, buffer_radius=200)
+    env = make_uam_vector_env(3, None, 10, 4, airspace=airspace, max_episode_steps=3)
+    try:
+        obs, infos = env.reset(seed=0)
+        assert obs.shape == (3,) + env.single_observation_space.shape and obs.dtype == np.float32
+        # batches are views into the shared buffers, not unpickled copies
+        assert not obs.flags.owndata
+
+        dones = []
+        for _ in range(4):
+            obs, rewards, terminated, truncated, infos = env.step(np.zeros((3, 2)))
+            assert rewards.shape == (3,) and np.isfinite(obs).all()
+            dones.append(terminated | truncated)
+        # time limit after 3 steps, the 4th step resets (next-step autoreset)
+        assert dones[2].all() and not dones[3].any()
+    finally:
+        env.close()
+
+
+def failing_env():
+    raise ValueError('env construction failed')
+
+
+def test_worker_errors_are_raised_in_the_learner():
+    with pytest.raises(RuntimeError, match='env construction failed'):
+        SharedMemoryVectorEnv([failing_env])
+
+
+def test_env_pool_reuses_warm_workers():
+    airspace = SyntheticAirspace(num_hospitals=10, size=6000, buffer_radius=200)
+    pool = make_uam_env_pool(2, None, 10, 4, airspace=airspace)
+    try:
+        startup_times = pool.startup_times
+        assert len(startup_times) == 2
+        assert all(startup['startup_s'] >= startup['env_build_s'] > 0 for startup in startup_times)
+
+        pids = []
+        for _ in range(2):
+            env = pool.vector_env(2)
+            env.reset(seed=0)
+            env.step(np.zeros((2, 2)))
+            pids.append(sorted(worker.process.pid for worker in env.workers))
+            env.close()
+        # the second run leases the same processes instead of starting new ones
+        assert pids[0] == pids[1] and len(pool.idle) == 2
+
+        # asking for more envs than idle workers starts the missing ones
+        env = pool.vector_env(3)
+        assert len(pool.startup_times) == 3
+        env.close()
+    finally:
+        pool.close()
@@ -0,0 +1,37 @@
+import numpy as np
+import random
+from airspace import SyntheticAirspace
+from airtrafficcontroller import ATC
+
+
+def run_atc(airspace, vectorized, num_steps=300, seed=0):
+    '''Steps a small fleet with the per UAV checks or the vectorized events, returns the transitions of every step'''
+    random.seed(seed)
+    np.random.seed(seed)
+    atc = ATC(airspace)
+    atc.create_n_random_vertiports(20)
+    atc.create_n_reg_uavs(15)
+    vertiport_index = {vertiport.id:k for k, vertiport in enumerate(atc.vertiports_in_airspace)}
+
+    transitions = []
+    for _ in range(num_steps):
+        if vectorized:
+            atc.update_vertiport_events()
+        else:
+            for uav in atc.reg_uav_list:
+                atc.has_left_start_vertiport(uav)
+                atc.has_reached_end_vertiport(uav)
+        transitions.append(([vertiport_index[uav.end_vertiport.id] for uav in atc.reg_uav_list],
+                            [uav.leaving_start_vertiport for uav in atc.reg_uav_list],
+                            [[atc.reg_uav_list.index(uav) for uav in vertiport.uav_list] for vertiport in atc.vertiports_in_airspace]))
+        atc.fleet_state.step_all(1)
+    return transitions
+
+
+def test_vectorized_events_match_per_uav_checks():
+    airspace = SyntheticAirspace(num_hospitals=5, size=4000, buffer_radius=100)
+    per_uav = run_atc(airspace, vectorized=False)
+    vectorized = run_atc(airspace, vectorized=True)
+    assert per_uav == vectorized
+    # the run has to contain landings for the comparison to mean anything
+    assert per_uav[0][0] != per_uav[-1][0]
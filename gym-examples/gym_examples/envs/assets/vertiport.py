@@ -9,14 +9,26 @@
 '''every class is one object - every function does only one thing for that object '''
 
 from shapely import Point
-from typing import List
+from typing import List, Dict
 
 
 class Vertiport:
-    def __init__(self,location, uav_list=[]): #sim:simulator.Simulator,
+    def __init__(self,location, uav_list=None): #sim:simulator.Simulator,
         self.id = id(self)
         self.location = location
-        self.uav_list:List = uav_list 
+        # uavs parked at the vertiport keyed by uav id, landing and takeoff bookkeeping is O(1)
+        self.uav_occupancy:Dict = {uav.id:uav for uav in uav_list} if uav_list is not None else {}
+
+    @property
+    def uav_list(self,) -> List:
+        '''UAVs parked at the vertiport, in order of arrival'''
+        return list(self.uav_occupancy.values())
+
+    def add_uav(self, uav):
+        self.uav_occupancy[uav.id] = uav
+
+    def remove_uav(self, uav):
+        self.uav_occupancy.pop(uav.id, None)
 
     # def __repr__(self,):
     #     return 'Vertiport({location}, {uav_list})'.format(location=self.location, uav_list=self.uav_list)
\ No newline at end of file
@@ -3,12 +3,20 @@ import matplotlib.pyplot as plt
 from typing import List
 import time
 from geopandas import GeoSeries
+import geopandas as gpd
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 
 import gymnasium as gym
 from gymnasium import spaces
 
 from assets import airspace, airtrafficcontroller 
+from assets.airspace import Airspace
 from assets.uav_basic import UAV_Basic
+from assets.renderer import Renderer
+from assets.utils import static_plot
+from assets.detection import NeighborIndex, InteractionCache
+from assets.fleet_kernel import FleetKernel
 
 
 
@@ -36,15 +44,42 @@ Therefore there will only be one auto_uav which is built into the uam_env
 
 
 class Uam_Uav_Env(gym.Env):
-    metadata = {"render_mode":["human", "rgb_array"], "render_fps":4}
+    metadata = {"render_modes":["human", "rgb_array"], "render_fps":4}
 
-    def __init__(self, location_name, num_vertiport, num_reg_uav,sleep_time = 0.005, render_mode=None):
+    # observation layout, own state, then num_intruders blocks of intruder features, then obstacle features
+    own_features = ('x', 'y', 'speed', 'heading_deg', 'end_dx', 'end_dy')
+    intruder_features = ('mask', 'dx', 'dy', 'dvx', 'dvy', 'heading_deg')
+    obstacle_features = ('intersection_with_building', 'building_distance', 'building_gradient_x', 'building_gradient_y')
+
+    def __init__(self, location_name, num_vertiport, num_reg_uav,sleep_time = 0.005, render_mode=None, render_scale = 1., render_every = 1, distance_field_resolution = 10., airspace = None, profile = False, profile_jsonl = None, num_intruders = 4):
+        '''
+        Args:
+            num_intruders (int): number of nearest intruders in the observation
+            profile (bool): enables the phase timers and counters, stats are returned in info['profile']
+            profile_jsonl (str | None): with profile, every step and episode is appended to this JSON lines file
+            airspace (Airspace | None): prebuilt airspace (e.g. SyntheticAirspace), location_name is ignored when given
+            distance_field_resolution (float): cell size (meters) of the hospital buffer distance field used for
+                                               the building distance and gradient observations
+            render_mode (str | None): "human" or "rgb_array"
+            render_scale (float): rgb_array frame resolution relative to 640x480
+            render_every (int): rgb_array frames are redrawn on every k-th render call, 
+                                the other calls return the last frame
+        '''
         
-        uam_airspace = airspace.Airspace(location_name)
+        uam_airspace = Airspace(location_name) if airspace is None else airspace
+        uam_airspace.build_distance_field(distance_field_resolution)
+        # the scenario built here is drawn from the global np.random (seed it before constructing the env for a fixed layout),
+        # from the first reset on the ATC draws from the env's own generator self.np_random
         uam_atc = airtrafficcontroller.ATC(airspace=uam_airspace)
         
         self.airspace = uam_airspace
         self.atc = uam_atc
+        # shared with the ATC and UAV code, see assets/profiling.py
+        self.profiler = self.atc.profiler
+        # the profiler is shared by the process, only the env that enabled it reports and disables it
+        self.profile = profile
+        if profile:
+            self.profiler.enable(profile_jsonl)
         
         #! this might belong to reset() 
         #*
@@ -54,57 +89,73 @@ class Uam_Uav_Env(gym.Env):
         # sim data
         self.sim_vertiports_point_array = vertiports_point_array
         self.uav_basic_list:List[UAV_Basic] = self.atc.reg_uav_list
+        self.num_reg_uav = num_reg_uav
+        self.neighbor_index = NeighborIndex(self.atc.fleet_state)
+        # geometry of the current tick, built once and read by the DAS, the observation and the reward
+        self.interaction_cache = InteractionCache(self.atc.fleet_state, self.airspace, self.neighbor_index)
+        self.fleet_kernel = FleetKernel(self.atc.fleet_state, UAV_Basic.das_controller)
+        self.timestep = 0
+        self.auto_uav = None
         #*
 
-        #! find a vertiport from self.atc.vertiports 
-        #   loop through 
-        # i need empty veriport because i need to assign the auto uav to that vertiport  
-        self.observation_space = {'agent_id': int,                              #!check if an int can be an observation space type
-                                  'agent_pos': spaces.Box(),                    #!find what should be the low and high of these from airspace - there is a max and min distance for the airspace
-                                  'agent_current_heading':spaces.Box(),         #!this will be between -180 and 180 
-                                  'intruder_id':int,
-                                  'intruder_pos':spaces.Box(),
-                                  'intruder_current_heading': spaces.Box(),
-                                  'intersection_with_building':bool}
-        self.action_space = spaces.Box()                                        #!action space will have both acceleration and heading change so find what is necessary for this
+        # the auto_uav is created by reset() at a vertiport that is not the start vertiport of a regular uav
+        # observation: own state, the num_intruders nearest intruders and obstacle features, see _get_obs
+        self.num_intruders = num_intruders
+        self.observation_space = self._build_observation_space()
+        # observations are assembled in this array, _get_obs returns a copy
+        self.obs_buffer = np.zeros(self.observation_space.shape, dtype=np.float32)
+        # fleet indices of the intruders in the last observation, nearest first, padded with -1
+        self.intruder_index = np.full(num_intruders, -1, dtype=np.int64)
+        # acceleration (m/s^2), heading correction (degree)
+        self.action_space = spaces.Box(low=np.array([-1., -25.]), high=np.array([1., 25.]), dtype=np.float64)
 
         self.sleep_time = sleep_time
+        self.renderer = None
 
+        #off-screen rgb_array rendering
+        self.render_mode = render_mode
+        self.render_scale = render_scale
+        self.render_every = render_every
+        self.render_count = 0
+        self.frame_canvas = None
+        self.frame_buffer = None
 
 
 
-        #! create_auto_uav()
 
-    def reset(self,):
+    def reset(self, seed = None, options = None):
         '''
-        This method will reset the environment. NOT sure how this will be done, but it will be done.
+        Resets the environment for a new episode without rebuilding it.
+        The airspace geometry and its indexes are kept, ATC refills vertiports_in_airspace and reg_uav_list in place
+        from pooled objects, and a new auto_uav is created at a vacant vertiport.
+        The first observation rebuilds the neighbor index of tick 0, the fleet wide DAS inputs of that tick
+        (building check, nearest intruders) are left to the first step.
+
+        Args:
+            seed (int | None): seeds self.np_random, the generator the ATC draws the scenario from (ATC.rng).
+                               The process-global random and np.random generators are not touched.
+            options (dict | None): {'resample_vertiports': True} moves the vertiports to new random locations
         '''
-        # this will first remove the existing vertiports 
-        #                 remove the existing reg uavs
-        #                 remove the auto_uav
-        # then it will create new vertiport 
-        #              create new reg_uavs
-        # then this method will use one of the empty vertiports and assign it to the auto_uav
-        
-        '''
-        Since reset is called after creating the env, in reset we will perform the following 
-        
-        1) create the auto_uav with start_vertiport -> empty_vertiport, end_vertiport -> choose a random vertiport from vertiport list this function will be performed by the ATC
-        '''
-        #! check the following things - 1) how and where is a uav_basic created, 
-        #! how are its attributes assigned, 
-        #! once this is clear -> create a script for auto_uav, and use that to create the auto_uav above in reset and assign all the necessary attributes to it
+        super().reset(seed=seed)
+        if self.profile:
+            self.profiler.end_episode()
+        # super().reset replaces np_random when seeded
+        self.atc.rng = self.np_random
+        options = options if options is not None else {}
+
+        self.atc.reset(self.num_reg_uav, resample_vertiports=options.get('resample_vertiports', False))
+        if options.get('resample_vertiports', False):
+            self.sim_vertiports_point_array[:] = [vertiport.location for vertiport in self.atc.vertiports_in_airspace]
+            self.renderer = None
+            self.frame_canvas = None
 
         self.auto_uav = self.atc.create_auto_uav() 
-
-        pass 
-    
-    
+        self.timestep = 0
+        self.interaction_cache.clear()
+        
+        return self._get_obs(), self._get_info()
     
-    def uav_polygon(self, dimension):
-        return GeoSeries(self.current_position).buffer(dimension).iloc[0]
     
-
     def get_intruder_uav_list(self, radius_str = 'detection'):
         '''
         Here the self.intruder_uav_list is created everytime as an empty list, 
@@ -113,102 +164,126 @@ class Uam_Uav_Env(gym.Env):
         Any subsequent routines can call the attribute and use the attribute for data processing 
         '''
         if radius_str == 'detection':
-            own_radius = other_radius = self.detection_radius
+            own_radius = other_radius = self.auto_uav.detection_radius
             
         elif radius_str == 'nmac':
-            own_radius = other_radius = self.nmac_radius
+            own_radius = other_radius = self.auto_uav.nmac_radius
             
         elif radius_str == 'collision':
-            own_radius = other_radius = self.collision_radius
+            own_radius = other_radius = self.auto_uav.collision_radius
             
         else:
             raise RuntimeError('Unknown radius string passed.')
         
-        self.intruder_uav_list = []
-
-        for uav in self.uav_basic_list:
-            if self.uav_polygon(own_radius).intersects(uav.uav_polygon(other_radius)):
-                self.intruder_uav_list.append(uav)
+        own_xy = (self.auto_uav.current_position.x, self.auto_uav.current_position.y)
+        self.interaction_cache.update(self.timestep)
+        intruders, _ = self.interaction_cache.point_neighbors(own_xy, own_radius, other_radius)
+        
+        self.intruder_uav_list = [self.uav_basic_list[i] for i in np.sort(intruders)]
 
     
     
-    def get_observation_dynamic_obj(self,):
-        intruder_uav_list = self.intruder_uav_list
-        
-        #! DYNAMIC OBSERVATION NEEDS TO BE HANDLED FOR NONE CASE
-        if len(intruder_uav_list) == 0:
-            return None
-        
-        else:
-            current_intruder = intruder_uav_list[0] #set first uav in intruder_list as current intruder 
-            #!sort based on distance
-            for ith_intruder in intruder_uav_list:
-                if self.get_intruder_distance(ith_intruder) < self.get_intruder_distance(current_intruder):
-                    current_intruder = ith_intruder #nearest intruder is current intruder
-            
-            intruder_state_info = {'own_id':self.id,
-                                'own_pos': self.current_position,
-                                'own_current_heading':self.current_heading_deg,
-                                'intruder_id': current_intruder.id,
-                                'intruder_pos': current_intruder.current_position,
-                                'intruder_current_heading': current_intruder.current_heading_deg,
-                                }
-            
-            return intruder_state_info #! THERE ARE TWO DIFFERENT RETURNS - 1)NONE 2) DICT - NEED TO FIND A WAY TO HANDLE NONE 
-        
     def get_observation_static_obj(self, radius_str = 'detection'):
         if radius_str == 'detection':
-            own_radius = self.detection_radius
+            own_radius = self.auto_uav.detection_radius
         elif radius_str == 'nmac':
-            own_radius  = self.nmac_radius
+            own_radius  = self.auto_uav.nmac_radius
         elif radius_str == 'collision':
-            own_radius = self.collision_radius
+            own_radius = self.auto_uav.collision_radius
         else:
             raise RuntimeError('Unknown radius string passed.')
         
-        building_polygon_count = len(self.airspace.location_utm_hospital_buffer)
-        intersection_list = []
-        
-        for i in range(building_polygon_count):
-            intersection_list.append(self.uav_polygon(own_radius).intersection(self.building_gdf.iloc[i]))
+        own_position = (self.auto_uav.current_position.x, self.auto_uav.current_position.y)
+        # read from the cache of this tick, shared with the distance observation
+        self.interaction_cache.update(self.timestep)
+        intersection_with_building, _, _ = self.interaction_cache.point_obstacles(own_position, own_radius)
         
-        intersection_with_building = any(intersection_list)
-        
-        return intersection_with_building , self.current_heading_deg #! RETURN - TUPLE[BOOL, FLOAT] 
-
-
-    def _get_obs(self,):
+        return intersection_with_building , self.auto_uav.current_heading_deg #! RETURN - TUPLE[BOOL, FLOAT] 
+
+
+    def _build_observation_space(self,) -> spaces.Box:
+        '''Internal method. Box over the flat observation layout, see own_features, intruder_features and obstacle_features.'''
+        min_x, min_y, max_x, max_y = self.airspace.location_utm_gdf.total_bounds
+        bounds = {'x':(min_x, max_x), 'y':(min_y, max_y), 'heading_deg':(-180, 180),
+                  'mask':(0, 1), 'intersection_with_building':(0, 1)}
+        features = self.own_features + self.intruder_features * self.num_intruders + self.obstacle_features
+        low = np.array([bounds.get(feature, (-np.inf, np.inf))[0] for feature in features], dtype=np.float32)
+        high = np.array([bounds.get(feature, (-np.inf, np.inf))[1] for feature in features], dtype=np.float32)
+        return spaces.Box(low=low, high=high, dtype=np.float32)
+
+    def observation_slices(self,) -> dict:
+        '''Where each group of features sits in the observation vector: own, intruders ((num_intruders, len(intruder_features)) after reshape), obstacles.'''
+        num_own, num_intruder = len(self.own_features), len(self.intruder_features) * self.num_intruders
+        return {'own':slice(0, num_own),
+                'intruders':slice(num_own, num_own + num_intruder),
+                'obstacles':slice(num_own + num_intruder, num_own + num_intruder + len(self.obstacle_features))}
+
+    def _get_obs(self,) -> np.ndarray:
         '''
-        This method will collect observations for auto_uav only. 
+        Observation of the auto_uav as a float32 vector, assembled in self.obs_buffer and returned as a copy,
+        so stored observations are not overwritten by the next step.
+
+        own: position, speed, heading and the offset to the end vertiport.
+        intruders: the num_intruders nearest regular UAVs within detection radius, nearest first,
+                   mask (1 for an intruder, 0 for padding), position and velocity relative to the auto_uav and heading.
+        obstacles: hospital buffer within detection radius (0/1), signed distance and its gradient.
         '''
+        auto_uav = self.auto_uav
+        own_x, own_y = auto_uav.current_position.x, auto_uav.current_position.y
+        own_heading_rad = np.deg2rad(auto_uav.current_heading_deg)
+        own_vx, own_vy = auto_uav.current_speed * np.cos(own_heading_rad), auto_uav.current_speed * np.sin(own_heading_rad)
+        slices = self.observation_slices()
+        obs = self.obs_buffer
+
+        obs[slices['own']] = (own_x, own_y, auto_uav.current_speed, auto_uav.current_heading_deg,
+                              auto_uav.end_point.x - own_x, auto_uav.end_point.y - own_y)
+
+        # nearest intruders from the cache of this tick, ties go to the lower fleet index
+        fleet_state = self.atc.fleet_state
+        self.interaction_cache.update(self.timestep)
+        intruders, _ = self.interaction_cache.point_neighbors((own_x, own_y), auto_uav.detection_radius, auto_uav.detection_radius)
+        intruders = intruders[:self.num_intruders]
+        self.intruder_index[:] = -1
+        self.intruder_index[:len(intruders)] = intruders
+        dx, dy = fleet_state.x[intruders] - own_x, fleet_state.y[intruders] - own_y
+
+        intruder_obs = obs[slices['intruders']].reshape(self.num_intruders, len(self.intruder_features))
+        intruder_obs[:] = 0.
+        heading_rad = np.deg2rad(fleet_state.heading_deg[intruders])
+        intruder_obs[:len(intruders)] = np.column_stack((np.ones(len(intruders)),
+                                                         dx, dy,
+                                                         fleet_state.speed[intruders] * np.cos(heading_rad) - own_vx,
+                                                         fleet_state.speed[intruders] * np.sin(heading_rad) - own_vy,
+                                                         fleet_state.heading_deg[intruders]))
+
+        # buffer within detection radius, signed distance to the nearest buffer and its gradient (points away from it),
+        # one lookup per tick in the interaction cache
+        intersection_with_building, building_distance, building_gradient = self.interaction_cache.point_obstacles((own_x, own_y), auto_uav.detection_radius)
+        obs[slices['obstacles']] = (intersection_with_building, building_distance, building_gradient[0], building_gradient[1])
+        return obs.copy()
 
-        observation_static = self.get_observation_static_obj()
-        intersection_with_building = observation_static[0] #! -> bool, True or False
 
-        observation_dynamic = self.get_observation_dynamic_obj()
+    def _get_info(self,):
+        if self.profile:
+            return {'profile':self.profiler.info()}
+        return {}
 
-        if observation_dynamic is None:
-            current_intruder_id = None
-            current_intruder_current_position = 1000
-            current_intruder_current_heading_deg = None
-        else:
-            current_intruder_id = observation_dynamic['intruder_id']
-            current_intruder_current_position = observation_dynamic['intruder_position']
-            current_intruder_current_heading_deg = observation_dynamic['intruder_current_heading']
-
-
-        return {   'agent_id': self.id,                              #!check if an int can be an observation space type
-                    'agent_pos': self.current_position,                    #!find what should be the low and high of these from airspace - there is a max and min distance for the airspace
-                    'agent_current_heading':self.current_heading,         #!this will be between -180 and 180 
-                    'intruder_id':current_intruder_id,
-                    'intruder_pos':current_intruder_current_position,
-                    'intruder_current_heading': current_intruder_current_heading_deg,
-                    'intersection_with_building':intersection_with_building}
-        
-         
+    def get_reward(self, obs):
+        '''
+        Baseline reward for the auto_uav, #TODO - reward design.
+        -1 when a building is within detection radius, -1 when a regular uav is within detection radius.
+        '''
+        slices = self.observation_slices()
+        reward = 0.
+        if obs[slices['obstacles']][0]:
+            reward -= 1.
+        if obs[slices['intruders']][0]:
+            reward -= 1.
+        return reward
 
-    def _get_info(self,):
-        pass 
+    def has_auto_uav_reached_end_vertiport(self,) -> bool:
+        '''Episode terminates when the auto_uav is within landing_proximity of its end vertiport'''
+        return self.auto_uav.current_position.distance(self.auto_uav.end_point) <= self.auto_uav.landing_proximity
 
 
 
@@ -227,47 +302,93 @@ class Uam_Uav_Env(gym.Env):
         acceleration = action[0]
         heading_correction = action[1]
         
-        #for uav in uav_basic_list step all uav_basic
-        #! if i have auto_uav, then i can use the same structure from ATC and perform the following funtions without any problem
-        for uav in self.uav_basic_list:
-            self.atc.has_left_start_vertiport(uav)
-            self.atc.has_reached_end_vertiport(uav)
-            uav.step()
+        #for uav in uav_basic_list step all uav_basic, same as Simulator_basic.sim_step
+        with self.profiler.phase('atc_checks'):
+            self.atc.update_vertiport_events()
         
-        self.auto_uav.step(acceleration, heading_correction) #! this will be created inside the reset method
+        # built by the last observation, the ATC checks do not move UAVs
+        self.interaction_cache.update(self.timestep)
+        with self.profiler.phase('controller'):
+            das_acceleration, das_heading_correction = self.fleet_kernel.actions(self.interaction_cache.static_mask, self.interaction_cache.nearest)
+        with self.profiler.phase('integration'):
+            self.fleet_kernel.integrate(1, das_acceleration, das_heading_correction)
+        self.timestep += 1
+        
+        with self.profiler.phase('auto_uav'):
+            self.auto_uav.step(acceleration, heading_correction) #! this will be created inside the reset method
         
         
         #! then lets call get_obs on auto_uav and connect that to env._get_obs()
-        obs = self._get_obs()
-        reward = self.get_reward(obs)
-        done = None #! HOW should we check for truncation, and termination
-        info = None #! DO we need info 
+        with self.profiler.phase('observation'):
+            obs = self._get_obs()
+        with self.profiler.phase('reward'):
+            reward = self.get_reward(obs)
+            terminated = self.has_auto_uav_reached_end_vertiport()
+        truncated = False # time limit is left to gymnasium's TimeLimit wrapper
+        if self.profile:
+            self.profiler.end_step()
+        info = self._get_info()
+
+        return obs, reward, terminated, truncated, info
+
+    def render(self,fig = None, ax = None, static_plot = static_plot, sim = None, gpd = gpd):
+        '''Draws the airspace into fig, ax ("human"), in "rgb_array" render_mode returns the frame from _render_frame.
+        Without fig and ax the env draws into its own figure, created on the first call.'''
+        if self.render_mode == "rgb_array":
+            with self.profiler.phase('render'):
+                return self._render_frame()
+
+        if ax is None:
+            if self.renderer is not None:
+                fig, ax = self.renderer.fig, self.renderer.ax
+            else:
+                fig, ax = plt.subplots()
+
+        # static layers are drawn once, the renderer is rebuilt only when a new figure is passed
+        with self.profiler.phase('render'):
+            if self.renderer is None or self.renderer.ax is not ax:
+                self.renderer = Renderer(fig, ax, static_plot, sim if sim is not None else self, gpd)
+            self._draw_uavs()
 
-        return obs, reward, done, info
+        time.sleep(self.sleep_time)
 
-    def render(self,fig, ax, static_plot, sim, gpd):
-        plt.cla()
-        static_plot(sim, ax, gpd)
+    def _draw_uavs(self,):
+        '''Internal method. Updates the UAV artists of the renderer'''
         # UAV PLOT LOGIC
-        for uav_obj in self.uav_basic_list:
-            uav_footprint_poly = uav_obj.uav_polygon_plot(uav_obj.uav_footprint)
-            uav_footprint_poly.plot(ax=ax, color=uav_obj.uav_footprint_color, alpha=0.3)
-
-            uav_nmac_poly = uav_obj.uav_polygon_plot(uav_obj.nmac_radius)
-            uav_nmac_poly.plot(ax=ax, color=uav_obj.uav_nmac_radius_color, alpha=0.3)
-
-            uav_detection_poly = uav_obj.uav_polygon_plot(uav_obj.detection_radius)
-            uav_detection_poly.plot(ax=ax, color=uav_obj.uav_detection_radius_color,alpha=0.3)
+        fleet_state = self.atc.fleet_state
+        n = len(fleet_state)
+        radii = (fleet_state.footprint[:n], fleet_state.nmac_radius[:n], fleet_state.detection_radius[:n])
+        colors = ([uav_obj.uav_footprint_color for uav_obj in self.uav_basic_list],
+                  [uav_obj.uav_nmac_radius_color for uav_obj in self.uav_basic_list],
+                  [uav_obj.uav_detection_radius_color for uav_obj in self.uav_basic_list])
+        self.renderer.draw_uavs(fleet_state.position, radii, colors)
 
         #TODO - render auto_uav here
 
-        fig.canvas.draw()
-        fig.canvas.flush_events()
-        time.sleep(self.sleep_time)
-
     def _render_frame(self,):
-        pass
+        '''
+        Off-screen frame for "rgb_array" render_mode. 
+        Uses the Agg canvas directly, so there is no GUI event loop and no sleep. 
+        The frame is written into a preallocated (H, W, 3) uint8 buffer which is returned, 
+        the buffer is overwritten by the next frame - copy it to keep it.
+        '''
+        if self.frame_canvas is None:
+            fig = Figure(figsize=(6.4, 4.8), dpi=100 * self.render_scale)
+            self.frame_canvas = FigureCanvasAgg(fig)
+            self.renderer = Renderer(fig, fig.add_subplot(), static_plot, self, gpd)
+            width, height = self.frame_canvas.get_width_height()
+            self.frame_buffer = np.zeros((height, width, 3), dtype=np.uint8)
+
+        if self.render_count % self.render_every == 0:
+            self._draw_uavs()
+            np.copyto(self.frame_buffer, np.asarray(self.frame_canvas.buffer_rgba())[:, :, :3])
+        self.render_count += 1
+
+        return self.frame_buffer
 
     def close(self,):
-        pass
+        '''Disables the profiler if this env enabled it, which also closes the profile_jsonl file.'''
+        if self.profile:
+            self.profiler.disable()
+            self.profile = False
     
\ No newline at end of file
@@ -0,0 +1,434 @@
+'''
+Vector env for Uam_Uav_Env with shared-memory observation, reward and done buffers.
+
+    env = make_uam_vector_env(8, 'Austin, Texas, USA', num_vertiport=20, num_reg_uav=10)
+    obs, infos = env.reset(seed=0)
+    obs, rewards, terminated, truncated, infos = env.step(actions)
+
+The Airspace is built once in the parent, workers are forked from it and share the geometry, its indexes
+and the distance field copy-on-write (the distance field is a read-only memmap when the airspace cache is enabled).
+Workers write observations, rewards and done flags straight into shared-memory NumPy blocks and read their
+actions from one, the pipes only carry a one word command and the (usually empty) info dict.
+
+make_uam_env_fns gives the same envs as a list of factories for gymnasium.vector.AsyncVectorEnv,
+EnvPool keeps warm workers across training runs in the same session.
+'''
+import os
+import time
+import random
+import traceback
+import multiprocessing
+from functools import partial
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+
+import gymnasium as gym
+from gymnasium import spaces
+from gymnasium.vector import VectorEnv
+from gymnasium.vector.utils import batch_space
+try:
+    from gymnasium.vector import AutoresetMode
+    NEXT_STEP_AUTORESET = AutoresetMode.NEXT_STEP
+except ImportError:
+    # gymnasium < 1.1 (e.g. the 0.26 pin in spec-file.txt) has no AutoresetMode, next-step autoreset is its only mode
+    NEXT_STEP_AUTORESET = 'NextStep'
+
+from assets.airspace import Airspace
+from uam_uav import Uam_Uav_Env
+
+
+def make_env(airspace, num_vertiport, num_reg_uav, max_episode_steps = None, **env_kwargs) -> gym.Env:
+    '''Uam_Uav_Env on a prebuilt airspace, optionally limited by TimeLimit.'''
+    env = Uam_Uav_Env(airspace.location_name, num_vertiport, num_reg_uav, airspace=airspace, **env_kwargs)
+    if max_episode_steps is not None:
+        env = gym.wrappers.TimeLimit(env, max_episode_steps)
+    return env
+
+
+def make_uam_env_fns(num_envs, location_name, num_vertiport, num_reg_uav, airspace = None, distance_field_resolution = 10., max_episode_steps = None, **env_kwargs) -> list:
+    '''
+    Env factories sharing one Airspace, for SharedMemoryVectorEnv or gymnasium.vector.AsyncVectorEnv.
+    The airspace and its indexes are built here, once, so forked workers start without loading any geometry.
+
+    Args:
+        num_envs (int): number of factories
+        airspace (Airspace | None): prebuilt airspace (e.g. SyntheticAirspace), location_name is ignored when given
+        max_episode_steps (int | None): episode length limit (TimeLimit)
+        env_kwargs: other Uam_Uav_Env arguments
+    '''
+    airspace = Airspace(location_name) if airspace is None else airspace
+    airspace.build_indexes(distance_field_resolution)
+    env_fn = partial(make_env, airspace, num_vertiport, num_reg_uav, max_episode_steps,
+                     distance_field_resolution=distance_field_resolution, **env_kwargs)
+    return [env_fn] * num_envs
+
+
+def make_uam_vector_env(num_envs, location_name, num_vertiport, num_reg_uav, airspace = None, context = None, **kwargs) -> 'SharedMemoryVectorEnv':
+    '''SharedMemoryVectorEnv of num_envs Uam_Uav_Env sharing one Airspace, kwargs are passed to make_uam_env_fns.'''
+    return SharedMemoryVectorEnv(make_uam_env_fns(num_envs, location_name, num_vertiport, num_reg_uav, airspace=airspace, **kwargs), context=context)
+
+
+class _SharedArray:
+    '''NumPy array in a named shared-memory block, created by the learner and attached by the workers.'''
+
+    def __init__(self, shape, dtype, name = None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        if name is None:
+            self.shm = SharedMemory(create=True, size=max(1, int(np.prod(self.shape)) * self.dtype.itemsize))
+        else:
+            self.shm = SharedMemory(name=name)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    def spec(self,):
+        return self.shape, self.dtype.str, self.shm.name
+
+    def close(self, unlink = False):
+        self.array = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _worker(env_fn, pipe, parent_pipe, start_time):
+    '''Worker loop: builds the env, then steps and resets it on command, results are written into the shared blocks
+    of the vector env the worker is attached to. A detached worker keeps its env and waits for the next attach.'''
+    if parent_pipe is not None:
+        parent_pipe.close()
+    # forked workers inherit the parent's generator state, every worker gets its own scenario stream
+    random.seed()
+    np.random.seed()
+    blocks = None
+    try:
+        process_start_s = time.time() - start_time
+        env_build_start = time.perf_counter()
+        env = env_fn()
+        pipe.send((True, {'spaces':(env.observation_space, env.action_space),
+                          'pid':os.getpid(),
+                          'process_start_s':process_start_s,
+                          'env_build_s':time.perf_counter() - env_build_start,
+                          'startup_s':time.time() - start_time}))
+
+        while True:
+            command, data = pipe.recv()
+            if command == 'attach':
+                index, specs = data
+                blocks = {name:_SharedArray(*spec[:2], name=spec[2]) for name, spec in specs.items()}
+                needs_reset = False
+                pipe.send((True, None))
+                continue
+            elif command == 'detach':
+                for block in blocks.values():
+                    block.close()
+                blocks = None
+                pipe.send((True, None))
+                continue
+            elif command == 'reset':
+                slot, seed, options = data
+                obs, info = env.reset(seed=seed, options=options)
+                reward, terminated, truncated = 0., False, False
+            elif command == 'step':
+                slot = data
+                if needs_reset:
+                    # next-step autoreset, same as gymnasium's AsyncVectorEnv
+                    obs, info = env.reset()
+                    reward, terminated, truncated = 0., False, False
+                else:
+                    obs, reward, terminated, truncated, info = env.step(blocks['actions'].array[index])
+            elif command == 'close':
+                env.close()
+                pipe.send((True, None))
+                return
+            else:
+                raise RuntimeError(f'Unknown vector env command {command}')
+
+            needs_reset = terminated or truncated
+            blocks[f'observations_{slot}'].array[index] = obs
+            blocks[f'rewards_{slot}'].array[index] = reward
+            blocks[f'terminated_{slot}'].array[index] = terminated
+            blocks[f'truncated_{slot}'].array[index] = truncated
+            pipe.send((True, info))
+    except (KeyboardInterrupt, EOFError):
+        pass
+    except Exception:
+        pipe.send((False, traceback.format_exc()))
+    finally:
+        if blocks is not None:
+            for block in blocks.values():
+                block.close()
+        pipe.close()
+
+
+class _WorkerHandle:
+    '''Learner side of a worker process.'''
+
+    def __init__(self, pipe, process):
+        self.pipe = pipe
+        self.process = process
+        self.startup = None
+
+    def close(self, terminate = False):
+        if not terminate and self.process.is_alive():
+            try:
+                self.pipe.send(('close', None))
+                self.pipe.recv()
+            except (EOFError, BrokenPipeError):
+                pass
+        self.process.join(timeout=1 if terminate else None)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.pipe.close()
+
+
+def _get_context(context):
+    if context is None and 'fork' in multiprocessing.get_all_start_methods():
+        context = 'fork'
+    return multiprocessing.get_context(context)
+
+
+def _start_workers(env_fns, ctx) -> list:
+    '''Starts one worker per env factory, waits until every env is built and records its startup times.'''
+    # workers have to share the learner's resource tracker, a tracker of their own would
+    # report the shared blocks they attach as leaked and unlink them when the worker exits
+    resource_tracker.ensure_running()
+    workers = []
+    for index, env_fn in enumerate(env_fns):
+        parent_pipe, child_pipe = ctx.Pipe()
+        process = ctx.Process(target=_worker, name=f'UamVectorEnvWorker-{index}', daemon=True,
+                              args=(env_fn, child_pipe, parent_pipe if ctx.get_start_method() == 'fork' else None, time.time()))
+        process.start()
+        child_pipe.close()
+        workers.append(_WorkerHandle(parent_pipe, process))
+    for worker, startup in zip(workers, _receive_all(workers)):
+        worker.startup = startup
+    return workers
+
+
+def _receive_all(workers) -> list:
+    '''Waits for every worker, closes all of them and raises on the first worker error.'''
+    results, errors = [], []
+    for index, worker in enumerate(workers):
+        try:
+            success, result = worker.pipe.recv()
+        except EOFError:
+            success, result = False, 'worker exited'
+        if not success:
+            errors.append(f'worker {index}: {result}')
+        results.append(result)
+    if errors:
+        for worker in workers:
+            worker.close(terminate=True)
+        raise RuntimeError('Vector env worker failed\n' + '\n'.join(errors))
+    return results
+
+
+class SharedMemoryVectorEnv(VectorEnv):
+    '''
+    Vector env with one worker process per env and shared-memory result buffers.
+
+    Observations, rewards and done flags are double buffered: every step is written into the other buffer
+    and step/reset return views into it, so the learner gets the batch without a copy or unpickling.
+    A returned batch stays valid until the step after next, pass copy=True (or copy the arrays)
+    to keep it longer. Autoreset follows gymnasium's next-step mode.
+    '''
+
+    metadata = {'autoreset_mode':NEXT_STEP_AUTORESET}
+
+    def __init__(self, env_fns, context = None, copy = False, workers = None, pool = None):
+        '''
+        Args:
+            env_fns (list[callable]): env factories, every env needs a Box observation space (e.g. Uam_Uav_Env)
+            context (str | None): multiprocessing start method, 'fork' by default where available,
+                                  so workers share the parent's airspace copy-on-write
+            copy (bool): return copies instead of views into the shared buffers
+            workers, pool: internal, running workers leased from an EnvPool, returned to it on close
+        '''
+        self.closed = True # until the workers are running
+        self.blocks = {}
+        self.pool = pool
+        self.workers = _start_workers(env_fns, _get_context(context)) if workers is None else workers
+        self.closed = False
+        self.num_envs = len(self.workers)
+        self.copy = copy
+        self.slot = 0
+
+        self.single_observation_space, self.single_action_space = self.workers[0].startup['spaces']
+        for worker in self.workers[1:]:
+            if worker.startup['spaces'] != (self.single_observation_space, self.single_action_space):
+                self.close(terminate=True)
+                raise RuntimeError('Every env of a SharedMemoryVectorEnv needs the same observation and action space')
+        if not isinstance(self.single_observation_space, spaces.Box):
+            self.close(terminate=True)
+            raise RuntimeError(f'SharedMemoryVectorEnv needs a Box observation space, got {self.single_observation_space}')
+        self.observation_space = batch_space(self.single_observation_space, self.num_envs)
+        self.action_space = batch_space(self.single_action_space, self.num_envs)
+
+        n = self.num_envs
+        self.blocks['actions'] = _SharedArray((n,) + self.single_action_space.shape, self.single_action_space.dtype)
+        for slot in (0, 1):
+            self.blocks[f'observations_{slot}'] = _SharedArray((n,) + self.single_observation_space.shape, self.single_observation_space.dtype)
+            self.blocks[f'rewards_{slot}'] = _SharedArray((n,), np.float64)
+            self.blocks[f'terminated_{slot}'] = _SharedArray((n,), bool)
+            self.blocks[f'truncated_{slot}'] = _SharedArray((n,), bool)
+        specs = {name:block.spec() for name, block in self.blocks.items()}
+        for index, worker in enumerate(self.workers):
+            worker.pipe.send(('attach', (index, specs)))
+        self._receive_all()
+
+    @property
+    def startup_times(self,) -> list:
+        '''Startup report of every worker, see EnvPool.startup_times.'''
+        return [{key:value for key, value in worker.startup.items() if key != 'spaces'} for worker in self.workers]
+
+    def _receive_all(self,) -> list:
+        try:
+            return _receive_all(self.workers)
+        except RuntimeError:
+            self.close(terminate=True)
+            raise
+
+    def _batch(self, infos_list):
+        '''Internal method. Views (or copies) of the buffer slot the workers just wrote, and the merged infos.'''
+        slot = self.slot
+        self.slot = 1 - slot
+        batch = tuple(self.blocks[f'{name}_{slot}'].array for name in ('observations', 'rewards', 'terminated', 'truncated'))
+        if self.copy:
+            batch = tuple(array.copy() for array in batch)
+        infos = {}
+        for index, info in enumerate(infos_list):
+            if info:
+                infos = self._add_info(infos, info, index)
+        return batch, infos
+
+    def reset(self, *, seed = None, options = None):
+        '''Resets every env. An int seed seeds the envs with seed, seed + 1, ...'''
+        if seed is None or isinstance(seed, int):
+            seed = [None if seed is None else seed + index for index in range(self.num_envs)]
+        if len(seed) != self.num_envs:
+            raise RuntimeError(f'Expected {self.num_envs} seeds, got {len(seed)}')
+        for worker, env_seed in zip(self.workers, seed):
+            worker.pipe.send(('reset', (self.slot, env_seed, options)))
+        (observations, _, _, _), infos = self._batch(self._receive_all())
+        return observations, infos
+
+    def step(self, actions):
+        self.blocks['actions'].array[:] = actions
+        for worker in self.workers:
+            worker.pipe.send(('step', self.slot))
+        (observations, rewards, terminated, truncated), infos = self._batch(self._receive_all())
+        return observations, rewards, terminated, truncated, infos
+
+    def close(self, terminate = False):
+        '''Releases the shared memory. Own workers are closed, workers leased from an EnvPool go back to the pool.'''
+        if self.closed:
+            return
+        self.closed = True
+        if self.pool is not None and not terminate:
+            for worker in self.workers:
+                worker.pipe.send(('detach', None))
+            try:
+                _receive_all(self.workers)
+                self.pool._release(self.workers)
+            except RuntimeError:
+                self.pool._discard(self.workers)
+        else:
+            for worker in self.workers:
+                worker.close(terminate)
+            if self.pool is not None:
+                self.pool._discard(self.workers)
+        for block in self.blocks.values():
+            block.close(unlink=True)
+        self.blocks = {}
+
+    def __del__(self,):
+        if not self.closed:
+            self.close(terminate=True)
+
+
+class EnvPool:
+    '''
+    Pre-warmed pool of env workers, reused by every vector env created from it in the same session.
+
+        pool = make_uam_env_pool(16, 'Austin, Texas, USA', num_vertiport=20, num_reg_uav=10)
+        print(pool.startup_times)
+        env = pool.vector_env(8)      # leases 8 warm workers
+        ...
+        env.close()                   # workers go back to the pool, their envs are kept
+        env = pool.vector_env(16)     # next training run starts without building any env
+        pool.close()
+
+    Heavy modules and the Airspace are loaded once in the parent. With 'fork' (default where available)
+    workers inherit them copy-on-write. With 'forkserver' the fork server preloads the heavy modules,
+    so workers only unpickle the env factory (and its airspace), not import geopandas/osmnx/shapely again.
+    '''
+
+    preload_modules = ('numpy', 'scipy.spatial', 'shapely', 'geopandas', 'osmnx', 'gymnasium', 'uam_uav')
+
+    def __init__(self, env_fn, num_workers, context = None):
+        '''
+        Args:
+            env_fn (callable): env factory, every env needs a Box observation space (e.g. Uam_Uav_Env)
+            num_workers (int): number of workers started now
+            context (str | None): 'fork' (default where available), 'forkserver' or 'spawn'
+        '''
+        self.ctx = _get_context(context)
+        if self.ctx.get_start_method() == 'forkserver':
+            self.ctx.set_forkserver_preload(list(self.preload_modules))
+        self.env_fn = env_fn
+        self.workers = []
+        self.idle = []
+        self.closed = False
+        self.add_workers(num_workers)
+
+    def add_workers(self, num_workers):
+        '''Starts num_workers more warm workers.'''
+        workers = _start_workers([self.env_fn] * num_workers, self.ctx)
+        self.workers += workers
+        self.idle += workers
+
+    @property
+    def startup_times(self,) -> list:
+        '''Startup report of every worker: pid, process_start_s (start call to worker running), env_build_s and startup_s (total), in seconds.'''
+        return [{key:value for key, value in worker.startup.items() if key != 'spaces'} for worker in self.workers]
+
+    def vector_env(self, num_envs = None, copy = False) -> SharedMemoryVectorEnv:
+        '''SharedMemoryVectorEnv on num_envs idle workers (all idle workers by default), more workers are started when needed.'''
+        if self.closed:
+            raise RuntimeError('EnvPool is closed')
+        num_envs = len(self.idle) if num_envs is None else num_envs
+        if num_envs > len(self.idle):
+            self.add_workers(num_envs - len(self.idle))
+        workers, self.idle = self.idle[:num_envs], self.idle[num_envs:]
+        return SharedMemoryVectorEnv(None, copy=copy, workers=workers, pool=self)
+
+    def _release(self, workers):
+        if self.closed:
+            for worker in workers:
+                worker.close()
+            self._discard(workers)
+            return
+        self.idle += workers
+
+    def _discard(self, workers):
+        self.workers = [worker for worker in self.workers if worker not in workers]
+
+    def close(self,):
+        '''Closes the idle workers, workers leased to vector envs that are still open are closed when those envs are closed.'''
+        if self.closed:
+            return
+        self.closed = True
+        for worker in self.idle:
+            worker.close()
+        self._discard(self.idle)
+        self.idle = []
+
+    def __del__(self,):
+        if not getattr(self, 'closed', True):
+            self.close()
+
+
+def make_uam_env_pool(num_workers, location_name, num_vertiport, num_reg_uav, airspace = None, context = None, **kwargs) -> EnvPool:
+    '''EnvPool of Uam_Uav_Env workers sharing one Airspace, kwargs are passed to make_uam_env_fns.'''
+    env_fn = make_uam_env_fns(1, location_name, num_vertiport, num_reg_uav, airspace=airspace, **kwargs)[0]
+    return EnvPool(env_fn, num_workers, context=context)